@@ -0,0 +1,284 @@
+#!/usr/bin/python3
+# coding: utf-8
+
+# ----- IMPORT LIBRARIES ------------------------------------------------------
+
+import json
+import os
+import platform
+import random
+from shutil import copy2, rmtree
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image as PIL_Image, ImageDraw as PIL_ImageDraw
+import pygame
+
+from photocore import version as photocore_version
+from photocore import GUI, Image, ImageManager, PhotoSoup, Vector4
+from scheduler import Scheduler
+
+# the display is drawn to offscreen, so this runs without a screen (and alongside a running photocore)
+# note: set after importing photocore, as on a Pi that sets the display driver to the framebuffer
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+"""
+This script times the hot paths of photocore: getting images at various sizes (scaling,
+making circular, removing pure black), correcting orientation, drawing images and text,
+the forces between images in PhotoSoup, and picking the next image from libraries of
+various sizes.
+
+Photos are generated rather than taken from the library, so runs can be compared across
+commits and hardware. Results are saved as JSON (default: benchmark.json), e.g.:
+
+	python3 benchmark.py -out=before.json
+	python3 benchmark.py -quick  (fewer repeats and a smaller largest library)
+
+Each result has the median, minimum and mean time per run in milliseconds.
+
+Like photocore itself, this runs on macOS or a Pi (elsewhere on Linux, RPi.GPIO and ft5406 are missing).
+"""
+
+# ----- CLASSES ---------------------------------------------------------------
+
+
+"""
+Stands in for Photocore, with just what the parts under test need to be created
+(none of the processes, threads or files of a running photocore)
+"""
+class BenchmarkCore ():
+	def __init__ (self):
+		self.is_debug  = False
+		self.scheduler = Scheduler()
+		self.gui       = GUI(core=self)
+		self.images    = ImageManager(core=self, use_import=False)
+
+	def get_images_count (self):
+		return self.images.get_count()
+
+
+class Benchmark ():
+	def __init__ (self, repeat=50, library_sizes=(100, 1000, 10000, 100000)):
+		self.repeat        = repeat  # runs per case (fewer for the slow ones)
+		self.library_sizes = library_sizes
+		self.results       = []
+		self.folder        = tempfile.mkdtemp(prefix='phototype_benchmark_')
+		self.core          = BenchmarkCore()
+		self.gui           = self.core.gui
+
+		# same seed, same photos and picks on every run
+		random.seed(1984)
+
+		# photos as they arrive from a camera (5MP, rotated via EXIF) and as kept in the library (display size)
+		self.photo_path    = self.make_photo('photo.jpg', (2592, 1944), orientation=6)
+		self.library_path  = self.make_photo('library.jpg', (800, 480))
+		self.library_image = Image(self.library_path)
+		self.library_image.load()
+
+	def close (self):
+		rmtree(self.folder, ignore_errors=True)
+
+	""" Saves a synthetic photo to the benchmark folder, returns its path
+		Gradients and noise make it decode like a photo, and a pure black bar gives remove_pure_black work to do. """
+	def make_photo (self, filename, size, orientation=None):
+		gradient = PIL_Image.linear_gradient('L').resize(size)
+		noise    = PIL_Image.effect_noise(size, 40)
+		photo    = PIL_Image.merge('RGB', (gradient, noise, gradient.transpose(PIL_Image.FLIP_LEFT_RIGHT)))
+		PIL_ImageDraw.Draw(photo).rectangle((0, 0, size[0], size[1] // 10), fill=(0, 0, 0))
+
+		file_path = os.path.join(self.folder, filename)
+		if (orientation is not None):
+			exif = PIL_Image.Exif()
+			exif[0x0112] = orientation  # orientation tag
+			photo.save(file_path, quality=90, exif=exif)
+		else:
+			photo.save(file_path, quality=90)
+		return file_path
+
+	""" Times func over a number of runs, with setup (if any) run before each but not timed """
+	def measure (self, name, func, setup=None, repeat=None, **params):
+		times = []
+		for x in range(repeat or self.repeat):
+			if (setup is not None):
+				setup()
+			t0 = time.perf_counter()
+			func()
+			times.append(time.perf_counter() - t0)
+
+		result = {
+			'name':      name,
+			'params':    params,
+			'runs':      len(times),
+			'median_ms': round(1000 * statistics.median(times), 4),
+			'min_ms':    round(1000 * min(times), 4),
+			'mean_ms':   round(1000 * statistics.mean(times), 4)
+		}
+		self.results.append(result)
+
+		label = name
+		if (params):
+			label += ' ' + ', '.join('{0}={1}'.format(key, value) for key, value in params.items())
+		print('{0:<52} {1:>10.3f} ms  (min {2:.3f})'.format(label, result['median_ms'], result['min_ms']))
+		return result
+
+	def run (self):
+		self.run_image()
+		self.run_gui()
+		self.run_soup()
+		self.run_library()
+
+	def run_image (self):
+		image = self.library_image
+
+		def reset_image ():
+			# drop all but the full size, so every run scales anew
+			image.image = {'full': image.image['full']}
+
+		# only decoding, as done the first time an image is used
+		self.measure('image.load', lambda: Image(self.library_path).load(), repeat=max(self.repeat // 5, 5), size='800x480')
+
+		# sizes as requested by the programs, both when scaled anew (miss) and when cached already (hit)
+		variants = [
+			('half',     (400, 240), {}),
+			('fill',     (360, 360), {'fill_box': True}),
+			('square',   (150, 150), {'fit_to_square': True}),
+			('circular', (300, 300), {'circular': True})
+		]
+		for variant, size, kwargs in variants:
+			get = lambda: image.get(size, **kwargs)
+			self.measure('image.get', get, setup=reset_image, variant=variant, cache='miss')
+			self.measure('image.get', get, variant=variant, cache='hit')
+
+		for smooth in (True, False):
+			self.measure('image.scale', lambda: image.scale((400, 240), smooth=smooth), smooth=smooth)
+
+		# circular images get drawn onto, so each run starts from a fresh copy
+		scaled  = image.scale((300, 300), fit_to_square=True)
+		surface = [None]
+		def copy_scaled ():
+			surface[0] = scaled.copy()
+		self.measure('image.make_circular', lambda: image.make_circular(surface[0]), setup=copy_scaled, size='300x300')
+
+		full = image.image['full']
+		self.measure('image.remove_pure_black', lambda: image.remove_pure_black(full), size='800x480')
+
+		# done on import, to the original photo (which gets rewritten, so each run starts from a fresh copy)
+		original = os.path.join(self.folder, 'original.jpg')
+		photo    = Image(original, use_convert=False)
+		self.measure('image.correct_orientation', photo.correct_orientation,
+			setup=lambda: copy2(self.photo_path, original), repeat=max(self.repeat // 5, 5), size='2592x1944')
+
+	def run_gui (self):
+		image = self.library_image
+
+		# images are cached at the size drawn by then, as is usual during drawing
+		self.measure('gui.draw_image', lambda: self.gui.draw_image(image), variant='full')
+		self.measure('gui.draw_image', lambda: self.gui.draw_image(image, pos=(0.4, 0.5), size=(0.8, 1), mask=(0, 0.8125, 0, 1)),
+			variant='mask')
+		self.measure('gui.draw_image', lambda: self.gui.draw_image(image, pos=(0.4, 0.5), size=(0.8, 1), mask=(0, 0.8125, 0, 1), a=0.5),
+			variant='mask+alpha')
+		self.measure('gui.draw_image', lambda: self.gui.draw_image(image, pos=(0.3, 0.4), size=(300, 300), rs=False, ci=True),
+			variant='circular')
+		self.measure('gui.draw_image', lambda: self.gui.draw_image(image, pos=(0.90625, 0.117), size=(0.1875, 0.234), a=0.5),
+			variant='side+alpha')
+
+		for s in ('small', 'large'):
+			for has_back in (True, False):
+				self.measure('gui.draw_text', lambda: self.gui.draw_text('1984 photos, 12 new', has_back=has_back, s=s),
+					size=s, back=has_back)
+
+	""" Times one step of the forces between images, as PhotoSoup does per frame for every image """
+	def run_soup (self):
+		soup = PhotoSoup(core=self.core)
+		for num_images in (3, 5, 10):
+			soup.images = []
+			for x in range(num_images):
+				soup.images.append({
+					'image': self.library_image,
+					'v':     Vector4(random.random() * 800, random.random() * 480, random.random() * 6.28, 1),
+					'size':  1
+				})
+
+			def step ():
+				for i in soup.images:
+					soup.get_force(i)
+			self.measure('soup.force_step', step, images=num_images)
+
+	""" Times picking the next image, with the usual number of recent and current images to avoid """
+	def run_library (self):
+		for size in self.library_sizes:
+			library = ImageManager(core=self.core, use_import=False)
+			for x in range(size):
+				# files don't need to exist for picking one, so these are just names
+				image = Image('library/{0:06d}.jpg'.format(x))
+				image.set_rate(random.uniform(-1, 1))
+				image.set_dhash(random.getrandbits(64))
+				library.images.append(image)
+				library.image_index[image.file] = image
+				library.similar.add(image.dhash, image)
+
+			current = [library.get_next().file for x in range(5)]
+			for x in range(20):
+				library.get_next()
+
+			self.measure('library.get_next', lambda: library.get_next(current_images=current), repeat=self.repeat * 4,
+				images=size)
+
+	""" Returns details on the machine and code, to tell results apart """
+	def get_environment (self):
+		commit = None
+		try:
+			commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+				cwd=os.path.dirname(os.path.abspath(__file__))).decode('utf-8').strip()
+		except (OSError, subprocess.CalledProcessError):
+			pass
+
+		return {
+			'timestamp': int(time.time()),
+			'commit':    commit,
+			'version':   photocore_version,
+			'host':      platform.node(),
+			'machine':   platform.machine(),
+			'platform':  platform.platform(),
+			'python':    platform.python_version(),
+			'pygame':    pygame.version.ver,
+			'sdl':       '.'.join(str(x) for x in pygame.get_sdl_version()),
+			'repeat':    self.repeat
+		}
+
+	def save (self, file_path):
+		with open(file_path, 'w') as f:
+			json.dump({'environment': self.get_environment(), 'results': self.results}, f, indent='\t')
+		print('Saved {0} results to {1}'.format(len(self.results), file_path))
+
+
+# ----- RUN AS MAIN ------------------------------------------------------------
+
+
+def main ():
+	out_path      = 'benchmark.json'
+	repeat        = 50
+	library_sizes = (100, 1000, 10000, 100000)
+
+	# check for arguments passed in
+	for argument in sys.argv:
+		if (argument == '-quick'):
+			repeat        = 10
+			library_sizes = (100, 1000, 10000)
+		elif (argument.startswith('-out=')):
+			out_path = argument[5:]
+
+	benchmark = Benchmark(repeat, library_sizes)
+	try:
+		benchmark.run()
+		benchmark.save(out_path)
+	finally:
+		benchmark.close()
+		pygame.quit()
+
+""" Unless this script is imported, do the following """
+if __name__ == '__main__':
+	main()
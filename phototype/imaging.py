@@ -0,0 +1,338 @@
+#!/usr/bin/python3
+# coding: utf-8
+
+# ----- IMPORT LIBRARIES ------------------------------------------------------
+
+import os
+import pygame
+from pygame import Rect
+import time
+
+# ----- CLASSES ---------------------------------------------------------------
+
+
+"""
+Image is a photo in the library: it loads the file when needed, and keeps rescaled copies
+of it for the sizes requested. It's kept apart from photocore (which also makes it available),
+so the importer can resize photos without loading all of that, as it doesn't need the display.
+"""
+class Image ():
+	def __init__ (self, file=None, shown=[], rate=0, use_convert=True):
+		self.file        = file
+		self.image       = {'full': None}  # only load when necessary
+		self.size        = (0,0)           # in pixels x,y
+		self.is_loaded   = False
+		self.last_use    = 0
+		self.use_convert = use_convert     # set to False if class is used without a display available
+
+		self.preloaded     = None   # surface decoded ahead of use (on another thread), not converted yet
+		self.is_preloading = False  # True while waiting for that to be done
+
+		self.hidden    = 0      # timestamp until when image is hidden
+		self.rate      = rate   # default is 0, range is [-1, 1]
+		self.shown     = list(shown)  # list, each item denotes for how long image has been shown
+		self.dhash     = None   # perceptual hash, similar images have similar hashes
+
+		self.cache_hits   = 0  # requests for a size that was available already
+		self.cache_misses = 0  # requests for a size that needed scaling first
+
+	def get (self, size, fill_box=False, fit_to_square=False, circular=False, smooth=True, remove_black=False, check_orientation=False):
+		self.last_use = time.time()
+		size        = (round(size[0]), round(size[1]))
+		size_string = 'full'
+		do_convert  = False
+
+		# if orientation needs checking, do it here before regular loading
+		# as any changes are done to base file
+		if (check_orientation):
+			if (self.is_loaded):
+				self.unload()
+			self.correct_orientation()
+
+		# load if necessary
+		if (not self.is_loaded):
+			self.load()
+
+		# check the required size and make it available
+		# a request size >= image size is normally ignored, unless it has to be made circular
+		if (size[0] < self.size[0] or size[1] < self.size[1] or circular):
+			# create unique identifier string for this size
+			size_string = '{0}x{1}'.format(size[0], size[1])
+			if (circular):
+				size_string = size_string.replace('x','c')
+			elif (fit_to_square):
+				size_string = size_string.replace('x','s')
+			elif (fill_box):
+				size_string = size_string.replace('x','f')
+
+			# check if this resizing is cached already
+			# if so, ready to return that
+			if (not size_string in self.image):
+				self.cache_misses += 1
+				# scale and keep for future use
+				img = None
+				if (circular):
+					img = self.scale(size, fill_box=True, fit_to_square=True, smooth=smooth)
+					img = self.make_circular(img)
+				else:
+					img = self.scale(size, fill_box, fit_to_square, smooth)
+				self.image[size_string] = img
+				do_convert = True
+				# ready to return now
+			else:
+				self.cache_hits += 1
+
+		# if pure blacks need to be removed, do it here after rescaling (smaller file = quicker)
+		if (remove_black):
+			self.image[size_string] = self.remove_pure_black(self.image[size_string])
+			do_convert = True
+
+		# convert to display pixel layout for improved performance
+		if (do_convert and self.use_convert):
+			self.image[size_string] = self.image[size_string].convert()
+
+		return self.image[size_string], size_string
+
+	def load (self):
+		# load image (also call convert for a speed-up)
+		if (self.preloaded is not None):
+			self.image['full'] = self.preloaded
+			self.preloaded     = None
+		else:
+			self.image['full'] = pygame.image.load(self.file)
+		if (self.use_convert):
+			self.image['full'] = self.image['full'].convert()
+		self.size          = self.image['full'].get_size()
+		self.is_loaded = True
+
+	""" Decodes the image file, so a later load only needs to convert it
+		Meant to be run on another thread, as it doesn't touch the display. """
+	def preload (self):
+		if (not self.is_loaded and self.preloaded is None):
+			surface = pygame.image.load(self.file)
+			# it may have been loaded meanwhile, in which case this is no longer needed
+			if (not self.is_loaded):
+				self.preloaded = surface
+
+	""" Free up memory by unloading an image no longer needed """
+	def unload (self, since=None):
+		self.is_loaded = False
+		self.preloaded = None
+
+		# also record time this image was shown
+		if (since is not None):
+			self.was_shown(time.time() - since)  # now - timestamp of its first showing
+
+		# set image to None if a default size
+		# or delete if non-default
+		sizes_to_delete = []
+		for s in self.image:
+			if (s == 'full'):
+				self.image[s] = None
+			else:
+				sizes_to_delete.append(s)
+		# finally, delete sizes (separate loop avoids dict size changes during iteration)
+		for sd in sizes_to_delete:
+			del self.image[sd]
+
+	""" Returns the number of bytes held by surfaces of this image (at any size) """
+	def get_cache_bytes (self):
+		cache_bytes = 0
+		for surface in list(self.image.values()):
+			if (surface is not None):
+				cache_bytes += surface.get_pitch() * surface.get_height()
+		return cache_bytes
+
+	""" Checks if image has been requested since threshold_time, False if not """
+	def check_use_since (self, threshold_time):
+		if (self.last_use >= threshold_time):
+			return True
+		return False
+
+	""" Save a version of this image to path. Size_string is assumed to exist, returns False otherwise. """
+	def save_to_file (self, size_string, output_path):
+		if (size_string in self.image):
+			try:
+				# save under a hidden name first, so an interrupted save never leaves a partial file
+				# (the extension stays the same, as it decides on the file format)
+				temp_path = os.path.join(os.path.dirname(output_path), '.' + os.path.basename(output_path))
+				pygame.image.save(self.image[size_string], temp_path)
+				os.replace(temp_path, output_path)
+				return True
+			except Exception as e:
+				print(e)
+		# return here if saving fails
+		return False
+
+	""" Scales 'img' to fit into box bx/by.
+		This method will retain the original image's aspect ratio
+	    Based on: http://www.pygame.org/pcr/transform_scale/ """
+	def scale (self, box_size, fill_box=False, fit_to_square=False, smooth=True):
+		ix,iy = self.image['full'].get_size()
+		bx,by = box_size
+		fill_box = fill_box
+		# square images always fill out the box, so make sure it's square in shape
+		if (fit_to_square):
+			fill_box = True
+			bx = min(bx,by)
+			by = min(bx,by)
+
+		# determine scale factor
+		if ix > iy:
+			# fit to width
+			scale_factor = bx/float(ix)
+			sy = scale_factor * iy
+			if sy > by:
+				scale_factor = by/float(iy)
+				sx = scale_factor * ix
+				sy = by
+			else:
+				sx = bx
+		else:
+			# fit to height
+			scale_factor = by/float(iy)
+			sx = scale_factor * ix
+			if sx > bx:
+				scale_factor = bx/float(ix)
+				sx = bx
+				sy = scale_factor * iy
+			else:
+				sy = by
+
+		if (fill_box):
+			if (bx == sx and by == sy):
+				pass  # s'all good man!
+			elif (bx/sx > by/sy):
+				sy = (bx / sx) * sy
+				sx = bx
+			else:
+				sx = (by / sy) * sx
+				sy = by
+
+		scaled_img = None
+
+		if (smooth is True):
+			scaled_img = pygame.transform.smoothscale(self.image['full'], (int(sx), int(sy)))
+		else:
+			scaled_img = pygame.transform.scale(self.image['full'], (int(sx), int(sy)))
+		
+		# a to-be-squared image will get the excess part taken off
+		if (fit_to_square and sx != sy):
+			s_left, s_top, s_width, s_height = 0, 0, sx, sy
+			if (sx > sy):
+				s_width = sy
+				s_left  = (sx - sy) / 2  # making sure we get the middle
+			else:
+				s_height = sx
+				s_top    = (sy - sx) / 2
+			scaled_img = scaled_img.subsurface( Rect(s_left, s_top, s_width, s_height) )
+
+		return scaled_img
+
+	""" Returns a surface that is 'circular' (has a black background with image as circle in it) """
+	def make_circular (self, img):
+		size = img.get_size()
+
+		# make a surface that is equal in size
+		surface = pygame.Surface(size)
+		# fill it black
+		surface.fill([0,0,0])
+		# draw white circle on top and set white color to transparent
+		pygame.draw.circle(surface, [255,255,255], (int(size[0]/2), int(size[1]/2)), int(min(size)/2), 0)
+		surface.set_colorkey([255,255,255])
+
+		# draw the black 'vignette' on top of the image, white parts won't overwrite original
+		surface_rect = surface.get_rect()
+		surface_rect.topleft = (0,0)
+		img.blit(surface, surface_rect)
+		# set pure black as the transparent color
+		img.set_colorkey([0,0,0])
+
+		return img
+
+	""" Prepare image to avoid pure black parts being set to transparent elsewhere.
+		This should only be done when files are first imported to reduce computation later on. """
+	def remove_pure_black (self, img):
+		size = img.get_size()
+		grey_surface = pygame.Surface(size)
+		# get a surface and fill it almost pure black (1/255)
+		grey_surface.fill([1,1,1])
+		# draw image on top with pure black set to transparent
+		img.set_colorkey([0,0,0])
+		img_rect = img.get_rect()
+		img_rect.topleft = (0,0)
+		grey_surface.blit(img, img_rect)
+		img = grey_surface
+		# all pure black pixels have now been replaced with almost black
+		return img
+
+	""" Opens a file, checks it orientation and rotates appropriately, saves, and closes.
+		This should only be done when files are first imported, as it's unnecessary later. """
+	def correct_orientation (self):
+		# only loaded here, as only the importer needs it
+		from PIL import Image as PIL_Image, ExifTags
+
+		try:
+			image = PIL_Image.open(self.file)
+			for orientation in ExifTags.TAGS.keys():
+				if ExifTags.TAGS[orientation]=='Orientation':
+					break
+			exif = dict(image._getexif().items())
+
+			if exif[orientation] == 3:
+				image = image.rotate(180, expand=True)
+			elif exif[orientation] == 6:
+				image = image.rotate(270, expand=True)
+			elif exif[orientation] == 8:
+				image = image.rotate(90, expand=True)
+			image.save(self.file)
+			image.close()
+		except (AttributeError, KeyError, IndexError):
+			# cases: image don't have getexif
+			pass
+
+	""" Up or downvotes an image """
+	def do_rate (self, positive=True, delta=0.2):
+		if (positive):
+			self.rate += delta
+		else:
+			self.rate -= delta
+		# limit to [-1,1] range
+		self.rate = max(min(self.rate, 1), -1)
+
+		return self.rate
+
+	def set_rate (self, rate=0):
+		self.rate = rate
+
+	""" sets image to be hidden until indicated timestamp (default is very far into future) """
+	def hide (self, until=9999999999):
+		self.hidden = int(until)  # ensure this is just an integer, not a float, for simplicity
+		# if permanently hiding this image, also set its rating to the lowest possible
+		if (until == 9999999999):
+			self.do_rate(False, 2)
+
+	""" Adds viewings of this image to a list """
+	def was_shown (self, time=0):
+		if (time > 0):
+			self.shown.append(int(time))  # no need for more precision than int
+
+	def set_shown (self, shown=[]):
+		self.shown = list(shown)  # avoids referencing to inbound list object
+
+	def set_dhash (self, dhash=None):
+		self.dhash = dhash
+
+	""" Gives a default str(this instance) output """
+	def __str__ (self):
+		return '{0}; rate: {1:.2f}; hidden: {2}; shown: {3}'.format(self.file, self.rate, self.hidden, self.shown)
+
+	""" when pickling, this method provides an alternative to the regular __dict__ function """
+	def __getstate__ (self):
+		state = self.__dict__.copy()
+		# get rid of any unpicklable elements (e.g., image objects, pygame surfaces, file handlers)
+		state['image']         = {'full': None}
+		state['is_loaded']     = False  # triggers a reload after unpickling
+		state['preloaded']     = None
+		state['is_preloading'] = False
+		return state
@@ -3,7 +3,11 @@
 # taken from: https://github.com/pimoroni/python-multitouch/blob/master/library/ft5406.py
 
 from collections import namedtuple
+from math import sin
+import os
 from pygame.locals import *
+import pty
+import random
 import threading
 import time
 import queue
@@ -188,3 +192,140 @@ class Touchscreen ():
 					self.position.y = event.value
 
 		return []
+
+
+# ----- MOCK GPIO -------------------------------------------------------------
+
+# mimics the parts of RPi.GPIO used by the distance sensor
+
+class MockGPIO ():
+	BCM      = 11
+	BOARD    = 10
+	IN       = 1
+	OUT      = 0
+	LOW      = 0
+	HIGH     = 1
+	PUD_OFF  = 20
+	PUD_DOWN = 21
+	PUD_UP   = 22
+	RISING   = 31
+	FALLING  = 32
+	BOTH     = 33
+
+	def __init__ (self):
+		self.mode    = None
+		self.levels  = {}  # pin: level
+		self.threads = {}  # pin: pulse train thread
+		self.running = {}  # pin: True while pulse train should continue
+
+		# pulse train settings, see set_pulse_train()
+		self.distance    = lambda t: 2.25 + 1.75 * sin(t / 4.0)  # in meters, slowly sweeping
+		self.period      = 0.049  # an LV-MaxSonar reads every 49 ms
+		self.jitter      = 0.00002
+		self.glitch_rate = 0.02   # chance of a bogus pulse instead of a true one
+
+	def setmode (self, mode):
+		self.mode = mode
+
+	def setup (self, pin, direction, pull_up_down=None, initial=None):
+		self.levels[pin] = self.LOW if initial is None else initial
+
+	def input (self, pin):
+		return self.levels.get(pin, self.LOW)
+
+	def output (self, pin, value):
+		self.levels[pin] = value
+
+	""" Starts feeding a synthetic pulse train to the callback """
+	def add_event_detect (self, pin, edge, callback=None, bouncetime=None):
+		self.running[pin] = True
+		self.threads[pin] = threading.Thread(target=self._run_pulse_train, args=(pin, edge, callback))
+		self.threads[pin].daemon = True
+		self.threads[pin].start()
+
+	def remove_event_detect (self, pin):
+		self.running[pin] = False
+		if (pin in self.threads):
+			self.threads[pin].join()
+			del self.threads[pin]
+
+	def cleanup (self):
+		for pin in list(self.threads):
+			self.remove_event_detect(pin)
+		self.levels = {}
+
+	""" Adjust the pulse train: distance is a function of time (seconds since start) returning meters """
+	def set_pulse_train (self, distance=None, period=None, jitter=None, glitch_rate=None):
+		if (distance is not None):
+			self.distance = distance
+		if (period is not None):
+			self.period = period
+		if (jitter is not None):
+			self.jitter = jitter
+		if (glitch_rate is not None):
+			self.glitch_rate = glitch_rate
+
+	""" Emulates LV-MaxSonar PW output: a pulse of 147 uS per inch of distance """
+	def _run_pulse_train (self, pin, edge, callback):
+		t0 = time.time()
+		while (self.running.get(pin)):
+			width = self.distance(time.time() - t0) / 0.0254 * 0.000147
+			width = width + random.uniform(-self.jitter, self.jitter)
+			if (random.random() < self.glitch_rate):
+				width = random.uniform(0, 0.05)
+
+			self._set_level(pin, self.HIGH, edge, callback)
+			time.sleep(max(width, 0))
+			self._set_level(pin, self.LOW, edge, callback)
+			time.sleep(max(self.period - width, 0.001))
+
+	def _set_level (self, pin, level, edge, callback):
+		self.levels[pin] = level
+		if (callback is not None):
+			if (edge == self.BOTH or (edge == self.RISING and level) or (edge == self.FALLING and not level)):
+				callback(pin)
+
+
+GPIO = MockGPIO()
+
+
+# ----- MOCK SERIAL -----------------------------------------------------------
+
+# a pseudo-terminal that outputs LV-MaxSonar serial frames, open its port like any tty
+
+class MockSerialSensor ():
+	def __init__ (self, distance=None, period=0.049, noise_rate=0.02):
+		self.distance   = distance  # function of time (seconds since start) returning meters
+		if (self.distance is None):
+			self.distance = lambda t: 2.25 + 1.75 * sin(t / 4.0)
+		self.period     = period
+		self.noise_rate = noise_rate  # chance of sending junk bytes before a frame
+
+		self.master, self.slave = pty.openpty()
+		self.port     = os.ttyname(self.slave)
+		self._running = False
+		self._thread  = None
+
+	def start (self):
+		self._running = True
+		self._thread  = threading.Thread(target=self._run)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def stop (self):
+		self._running = False
+		if (self._thread is not None):
+			self._thread.join()
+			self._thread = None
+		os.close(self.master)
+		os.close(self.slave)
+
+	def _run (self):
+		t0 = time.time()
+		while (self._running):
+			inches = int(round(self.distance(time.time() - t0) / 0.0254))
+			frame  = 'R{0:03d}\r'.format(max(6, min(inches, 255))).encode('ascii')
+			if (random.random() < self.noise_rate):
+				frame = bytes(random.randrange(256) for i in range(random.randrange(1, 6))) + frame
+			os.write(self.master, frame)
+			time.sleep(self.period)
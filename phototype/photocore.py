@@ -3,32 +3,37 @@
 
 # ----- IMPORT LIBRARIES ------------------------------------------------------
 
+import asyncio
+from collections import deque
 from hashlib import md5
 from math import sqrt, pi, cos, sin, atan2, ceil
-import multiprocessing as mp # or only import? Process, Queue
 import os
 import pickle
-from PIL import Image as PIL_Image, ExifTags
 import psutil
 import pygame
 from pygame.locals import *
+import queue
 from queue import Empty as QueueEmpty
 import random
-import requests
 from shutil import chown
 import signal
 from socket import gethostname
 import sys
+import threading
 import time
 import traceback
-from simpleserver import SimpleServer
-import qrcode
+from sensors import SensorChannel, PresenceModel
+from scheduler import Scheduler
+from services import ServiceLoop
+from imaging import Image
+from similarity import BKTree, hamming_distance
+import tracing
+import workers
 
 if (sys.platform == 'darwin'):
 	# simulate touches by masquerading pointer movements and clicks
 	from mocking import Touchscreen, Touch, TS_PRESS, TS_RELEASE, TS_MOVE
 else:
-	import RPi.GPIO as GPIO
 	from ft5406 import Touchscreen, TS_PRESS, TS_RELEASE, TS_MOVE
 	# set display explicitly to allow starting this script via SSH with output on Pi display
 	# not necessary otherwise. requires running with sudo on the remote terminal.
@@ -61,13 +66,6 @@ def main ():
 		print('nostart.txt file present, will not start photocore.')
 		exit(0)
 
-	# note: python-3.8+ has changed the default multiprocessing start methof from 'fork' to 'spawn'
-	#       that situation should be handled properly but causes a semlock crash for now
-	#       in the mean time, we revert to fork despite it being thread-unsafe on macOS
-	#       see: https://bugs.python.org/issue33725
-	if (sys.platform == 'darwin'):
-		mp.set_start_method('fork')
-		
 	# define here so it's available later, also in case of exception handling
 	core = None
 	try:
@@ -77,7 +75,8 @@ def main ():
 		# program stays in this loop unless called for exit
 		while (True):
 			t0 = time.time()
-			core.update()
+			with tracing.span('frame'):
+				core.update()
 				
 			# exit flag set?
 			if (core.do_exit):
@@ -86,9 +85,10 @@ def main ():
 			else:
 				# pause between frames
 				t1 = time.time()
+				core.record_frame(t1 - t0)
 				dt = round((t1 - t0) * 1000)  # in millis
-				# pause for a minimum of 10 ms and max of 40 ms (25fps)
-				pygame.time.wait( max(40 - dt, 10) )
+				# pause for a minimum of 10 ms and max of one frame interval (25fps, or less if nobody is near)
+				pygame.time.wait( max(core.get_frame_interval() - dt, 10) )
 	except Exception as e:
 		with open('errors.log', 'a') as f:
 			t = time.strftime("%Y-%m-%d %H:%M:%S - ", time.localtime())
@@ -123,12 +123,23 @@ class Photocore ():
 		self.do_shutdown            = False
 		self.is_debug               = False
 		self.use_network            = True   # can any web, import, or update services be run?
+		self.use_mock_sensor        = False  # on macOS, feed the sensor code with synthetic readings
+		self.sensor_backend         = 'gpio' # read the distance sensor via 'gpio' (pulse width) or 'serial'
+		self.use_tracing            = False  # record where time is spent, saved to trace.json on close
 		self.do_updates             = False  # currently not functional due to external SSL changes
-		self.last_update            = 0
 		self.memory_usage           = 0
 		self.memory_total           = round(psutil.virtual_memory().total / (1024*1024))
-		self.disk_usage             = 0
-		self.disk_usage_last_update = 0
+		self.metrics_intervals      = {}     # seconds between samples, see MetricsCollector for defaults
+		self.frame_interval         = 40     # in ms, 25fps
+		self.frame_interval_idle    = 200    # in ms, 5fps while nobody is near
+		self.task_budget            = 0.02   # in seconds, time per frame for due tasks (beyond the first one)
+		self.frame_times            = deque(maxlen=500)  # in seconds, time spent on recent frames
+		self.frame_count            = 0
+		self.frame_time_total       = 0      # in seconds, time spent on all frames so far
+		self.process_info           = psutil.Process()
+		self.started                = self.process_info.create_time()  # includes the time taken to load code
+		self.first_frame_at         = None   # time the first frame was drawn
+		self.cached_frame_at        = None   # time a cached frame (of the previous run) was shown
 
 		# check for arguments passed in
 		for argument in sys.argv:
@@ -139,30 +150,80 @@ class Photocore ():
 				self.do_updates  = False
 			elif (argument == '-noupdate'):
 				self.do_updates  = False
+			elif (argument == '-mocksensor'):
+				self.use_mock_sensor = True
+			elif (argument.startswith('-sensor=')):
+				self.sensor_backend = argument[8:]
+			elif (argument == '-trace'):
+				self.use_tracing = True
+
+		# start tracing before any other process is started, so those are traced too
+		if (self.use_tracing):
+			tracing.enable('traces')
+			tracing.set_process_name('photocore')
+
+		# periodic housekeeping of all parts is run from here (see update)
+		self.scheduler = Scheduler()
+		self.scheduler.every(10, self.check_memory, 'core.check_memory', jitter=1)
+
+		# network-bound work (such as checking for updates) is run in the background from here
+		self.services = ServiceLoop()
+
+		# get something on screen first: the last frame of the previous run, if available
+		self.gui = GUI(core=self)
+		if (self.gui.show_last_screen()):
+			self.cached_frame_at = time.time()
 
 		# initiate all subclasses
 		self.data     = DataManager(core=self)
-		self.network  = NetworkManager()
+		self.network  = NetworkManager(core=self)
+		self.metrics  = MetricsCollector(intervals=self.metrics_intervals, net_types=self.network.net_types)
 		self.updater  = SelfUpdater(core=self, use_updater=self.do_updates)
-		self.display  = DisplayManager()
-		self.distance = DistanceSensor()
+		self.display  = DisplayManager(core=self)
+		self.distance = DistanceSensor(backend=self.sensor_backend, use_mock=self.use_mock_sensor)
+		self.presence = PresenceModel()
 		self.images   = ImageManager('../images', '../uploads', core=self, use_import=self.use_network)
-		self.gui      = GUI(core=self)
 		self.input    = InputHandler(core=self)
 		
-		# init programs
+		# init programs (only the blank one for now, which needs no images)
 		self.programs                = []
 		self.program_active_index    = 0
 		self.program_preferred_index = 0
 		self.max_time_for_program    = time.time() + 30
 		self.switch_requested        = False
 		self.add_program('BlankScreen')
-		self.add_program('DualDisplay')
-		self.add_program('PhotoSoup')
-		self.add_program('PhotoPatterns')
+
+		# the next program gets prepared ahead of switching to it (see prepare_next_program)
+		self.program_next_index = None
+		self.prewarm_time       = 20   # in seconds, preparing starts this long before a scheduled switch
+		self.prewarm_wait       = 2    # in seconds, a requested switch waits at most this long to get ready
+		self.prewarm_memory     = 400  # in MB, only prepare ahead while more memory than this is available
+		self.prewarm_since      = 0
+
+		# a restart (e.g., after an update) continues where the previous run left off (see save_state)
+		self.state_path      = 'state.bin'
+		self.state_version   = 1     # increase on any change to what gets saved, so older snapshots are ignored
+		self.state_max_age   = 600   # in seconds, older snapshots are ignored (as it's not a quick restart then)
+		self.restore_wait    = 10    # in seconds, the restored program waits at most this long for the library to load
+		self.restoring       = None  # snapshot of the previous run, until the program is restored
+		self.restoring_since = 0
+
+		# everything else starts once frames are drawn, one step per frame (see update)
+		self.startup_steps = [
+			self.images.start_scan,
+			self.images.start_services,
+			self.updater.start,
+			self.add_other_programs
+		]
 
 		self.data.log('Photocore started.')
 
+		self.restoring = self.load_state()
+		if (self.restoring is not None):
+			# all programs are needed right away
+			self.startup_steps.remove(self.add_other_programs)
+			self.add_other_programs()
+
 		if len(self.programs) < 1:
 			print('No programs to run, will exit')
 			self.do_exit = True
@@ -170,32 +231,32 @@ class Photocore ():
 			# begin with a program
 			self.set_active(self.program_active_index, force=True)
 
+			if (self.restoring is not None):
+				self.begin_restore()
+
 	def update (self):
 		now = time.time()
 
-		# update self (not every frame)
-		if (self.last_update < now - 10):
-			# track memory usage
-			mem_available = round(psutil.virtual_memory().available / (1024*1024))
-			self.memory_usage = round(100 * (1 - (mem_available / self.memory_total) ))
-
-			# deal with potential memory leak of images not unloading after use
-			if (mem_available < 400):
-				self.images.check_use()
-
-			self.last_update = now
+		# run any housekeeping that is due, and act on results of background services
+		self.scheduler.run_pending(now, budget=self.task_budget)
+		self.services.update()
 		
-		# update all subclasses
-		self.data.update()
-		self.network.update()
-		self.updater.update()
-		self.display.update()
+		# update all subclasses (that need to every frame)
 		self.distance.update()
 		self.input.update()
 		self.images.update()
 
+		# check whether anyone is around, and turn things down (or back up) accordingly
+		if (self.presence.update(self.distance.get_distance(), self.input.get_last_touch(), now)):
+			self.display.set_dimmed(not self.is_someone_near())
+			self.data.log_action('presence', self.presence.get_state_name())
+
 		# decide on active program  - - - - - - - - - - - - - - - - -
 
+		# pick the next program ahead of a scheduled switch, so it can be prepared meanwhile
+		if (self.program_next_index is None and now > self.max_time_for_program - self.prewarm_time and len(self.startup_steps) == 0):
+			self.set_next_program_index(self.pick_next_program(), now)
+
 		# check if time is up for current program
 		# or, if at night, see if program has been active for some time before forcing a switch
 		if (now > self.max_time_for_program or (self.get_active().get_active_time() > 600 and self.get_time_is_night()) ):
@@ -204,23 +265,23 @@ class Photocore ():
 				self.switch_requested = True
 
 		# pick another program if a switch is desired (but no preference was indicated)
+		# (the one picked ahead of time, unless the time of day asks otherwise)
 		if (self.switch_requested):
-			# at night, stick with a blank screen
-			if (self.get_time_is_night()):
-				if (self.program_active_index == 0):
-					pass  # do nothing, remain in night mode
-				else:
-					self.program_preferred_index = 0
-			else:
-				# pick another program (but avoid blank program, so index >= 1)
-				# and make sure the new pick isn't similar to the current program
-				while True:
-					self.program_preferred_index = random.randint(1, len(self.programs) - 1)
-					if (self.program_preferred_index != self.program_active_index):
-						break
+			if (self.program_next_index in (None, self.program_active_index) or self.get_time_is_night()):
+				self.set_next_program_index(self.pick_next_program(), now)
+			self.program_preferred_index = self.program_next_index
 
-		# switch over if desired program does not match current
+		# a switch requested without warning (e.g., via the status panel) gets prepared now
 		if (self.program_preferred_index != self.program_active_index):
+			self.set_next_program_index(self.program_preferred_index, now)
+
+		# prepare the next program, a step per frame
+		next_ready = self.prepare_next_program()
+
+		# switch over if desired program does not match current
+		# (once it's ready, or given up on waiting for that)
+		if (self.program_preferred_index != self.program_active_index and (next_ready or now > self.prewarm_since + self.prewarm_wait)
+			and not self.is_restore_waiting(now)):
 			switch_success = self.set_active(self.program_preferred_index)
 
 			if (switch_success):
@@ -236,14 +297,31 @@ class Photocore ():
 			else:
 				# add another minute to time allowance to avoid trying once again on next loop
 				self.max_time_for_program += 60
+				# and pick another program next time
+				self.set_next_program_index(None, now)
+
+			if (self.restoring is not None):
+				self.finish_restore(switch_success, now)
 
 		# update active program  - - - - - - - - - - - - - - - - -
-		self.programs[self.program_active_index].update()
+		with tracing.span('program.update', args={'program': self.get_active().get_name()}):
+			self.programs[self.program_active_index].update()
 
 		# last, update GUI
-		self.gui.update()
+		with tracing.span('gui.update'):
+			self.gui.update()
+
+		if (self.first_frame_at is None):
+			self.first_frame_at = time.time()
+			self.log_startup_time()
+		elif (len(self.startup_steps) > 0):
+			# continue starting up, in steps to keep the display going
+			step = self.startup_steps.pop(0)
+			with tracing.span('startup.' + step.__name__):
+				step()
 
 	def close (self, exit_code=0):
+		t0 = time.time()
 		if (exit_code == 0):
 			if (self.do_shutdown):
 				self.data.log('Photocore closing, device shutting down.')
@@ -252,19 +330,134 @@ class Photocore ():
 		else:
 			self.data.log('Photocore closing, with errors.')
 
+		# keep the state of the display to continue from at the next start (unless something went wrong)
+		if (exit_code == 0 and not self.do_shutdown):
+			self.save_state()
+
 		# close in reverse order from update
 		for program in self.programs:
 			program.close()
 
-		# close subclasses
+		# close subclasses, timing each as a slow shutdown holds up a restart (e.g., after an update)
 		self.data.close()
-		self.updater.close()
-		self.gui.close()
-		self.images.close()
-		self.input.close()
-		self.distance.close()
-		self.display.close()
-		self.network.close()
+		self.gui.save_last_screen()
+		durations = []
+		for part in (self.services, self.gui, self.images, self.input, self.distance, self.display, self.network, self.metrics):
+			t1 = time.time()
+			part.close()
+			durations.append((time.time() - t1, type(part).__name__))
+
+		# log how long it took, saved separately as data has been saved already
+		duration, slowest = max(durations)
+		self.data.log('Photocore closed in {0:.2f}s (slowest: {1}, {2:.2f}s).'.format(time.time() - t0, slowest, duration))
+		self.data.save()
+		print('Closed in {0:.2f}s'.format(time.time() - t0))
+
+		# all other processes have ended by now, so their traces are complete
+		tracing.export('trace.json')
+
+	""" Saves a snapshot of what is on display (program, images and their timers) to continue from on a restart """
+	def save_state (self):
+		program = self.get_active()
+		now     = time.time()
+
+		# a blank screen is where a start begins anyway
+		if (self.program_active_index == 0 or not program.is_active):
+			return
+
+		snapshot = {
+			'version':   self.state_version,
+			'saved':     now,
+			'program':   program.get_name(),
+			'time_left': self.max_time_for_program - now,
+			'state':     program.get_state(),
+			'recent':    list(self.images.recent),
+			'hot':       self.images.get_loaded_paths()  # images held in memory, to load again ahead of use
+		}
+		try:
+			with open(self.state_path, 'wb') as f:
+				pickle.dump(snapshot, f)
+		except (IOError, pickle.PicklingError) as e:
+			logging('Photocore: could not save state - ' + str(e))
+
+	""" Returns the snapshot saved by the previous run, or None if there is none to use
+		A snapshot is only used once, so a problem with it can't hold up every start that follows. """
+	def load_state (self):
+		try:
+			with open(self.state_path, 'rb') as f:
+				snapshot = pickle.load(f)
+			os.remove(self.state_path)
+		except (IOError, EOFError, pickle.UnpicklingError):
+			return None
+
+		if (not isinstance(snapshot, dict) or snapshot.get('version') != self.state_version):
+			return None
+		if (snapshot['saved'] < time.time() - self.state_max_age):
+			return None
+		return snapshot
+
+	""" Gets the program of the previous run ready to take over from the blank screen (see update)
+		Meanwhile, the last screen of the previous run stays on (as the blank screen draws nothing). """
+	def begin_restore (self):
+		snapshot      = self.restoring
+		program_index = None
+		for index, program in enumerate(self.programs):
+			if (program.get_name() == snapshot['program']):
+				program_index = index
+
+		if (program_index is not None):
+			# the images needed are added to the library right away, rather than waiting for the scan to find them
+			program = self.programs[program_index]
+			for path in program.get_state_paths(snapshot['state']) + snapshot['recent'] + snapshot['hot']:
+				if (path not in self.images.image_index and os.path.exists(path)):
+					self.images.append(os.path.dirname(path), os.path.basename(path))
+
+		# without the images on display, there is nothing to continue from
+		if (program_index is None or not program.set_state(snapshot['state'])):
+			self.finish_restore(False, time.time())
+			return
+
+		self.gui.set_dirty(False)
+		self.images.recent   = [path for path in snapshot['recent'] if path in self.images.image_index]
+		self.restoring_since = time.time()
+		self.set_next_program_index(program_index, self.restoring_since)
+		self.program_preferred_index = program_index
+
+	""" Returns True while the program to restore waits for enough images to be available """
+	def is_restore_waiting (self, now):
+		if (self.restoring is None):
+			return False
+		return (not self.programs[self.program_preferred_index].can_run() and not self.images.is_scan_complete()
+			and now < self.restoring_since + self.restore_wait)
+
+	def finish_restore (self, success, now):
+		if (success):
+			self.max_time_for_program = now + max(self.restoring['time_left'], 60)
+
+			# images that were in memory are likely to be needed soon, so decode those ahead of use
+			for path in self.restoring['hot']:
+				image = self.images.get_image(path)
+				if (image is not None and not image.is_loaded):
+					self.images.preload(image)
+
+			message = 'Restored {0} after {1:.2f}s'.format(self.get_active().get_name(), time.time() - self.started)
+			print(message)
+			self.data.log(message)
+			self.restoring = None
+		else:
+			# nothing to continue from after all, so start with a regular blank screen
+			self.restoring = None
+			self.get_active().make_active()
+
+	""" Tracks memory usage, and unloads unused images when memory runs low """
+	def check_memory (self):
+		# as last sampled by metrics collector
+		mem_available = self.metrics.get('memory_available', self.memory_total)
+		self.memory_usage = round(100 * (1 - (mem_available / self.memory_total) ))
+
+		# deal with potential memory leak of images not unloading after use
+		if (mem_available < 400):
+			self.images.check_use()
 
 	def set_exit (self, shutdown=False):
 		self.do_exit     = True
@@ -288,14 +481,20 @@ class Photocore ():
 		if (force or new_index != self.program_active_index):
 			# check if prospective program can be run
 			if (self.programs[new_index].can_run()):
-				# cleanup
-				self.get_active().make_inactive()
-				self.images.check_use(0)
+				with tracing.span('program.switch', args={'from': self.get_active().get_name(), 'to': self.programs[new_index].get_name()}):
+					# anything prepared for another program is no longer needed
+					if (self.program_next_index is not None and self.program_next_index != new_index):
+						self.programs[self.program_next_index].release_prepared()
+					self.program_next_index = None
 
-				# switch
-				self.program_active_index    = new_index
-				self.program_preferred_index = new_index
-				self.get_active().make_active()
+					# cleanup (but keep images prepared for the new program)
+					self.get_active().make_inactive()
+					self.images.check_use(0, keep=self.programs[new_index].prepared_images)
+
+					# switch
+					self.program_active_index    = new_index
+					self.program_preferred_index = new_index
+					self.get_active().make_active()
 
 				self.data.log('Switching to program ' + self.get_active().get_name())
 
@@ -306,11 +505,62 @@ class Photocore ():
 
 		return False
 
+	""" Returns the index of a program to switch to """
+	def pick_next_program (self):
+		# at night, stick with a blank screen
+		if (self.get_time_is_night() or len(self.programs) < 2):
+			return 0
+
+		# pick another program (but avoid blank program, so index >= 1)
+		# and make sure the new pick isn't similar to the current program
+		while True:
+			index = random.randint(1, len(self.programs) - 1)
+			if (index != self.program_active_index):
+				return index
+
+	""" Sets the program to prepare for switching to next, freeing what was prepared for another one """
+	def set_next_program_index (self, index, now):
+		if (index is not None):
+			index = min(max(index, 0), len(self.programs) - 1)
+
+		if (index != self.program_next_index):
+			if (self.program_next_index is not None and self.program_next_index != self.program_active_index):
+				self.programs[self.program_next_index].release_prepared()
+			self.program_next_index = index
+			self.prewarm_since      = now
+
+	""" Does a step of preparing the next program, returns True once there is no need to wait for it
+		Preparing ahead is skipped while memory is low, leaving the work to the switch itself. """
+	def prepare_next_program (self):
+		if (self.program_next_index is None or self.program_next_index == self.program_active_index):
+			return True
+
+		program = self.programs[self.program_next_index]
+		if (not program.can_run() or self.metrics.get('memory_available', self.memory_total) < self.prewarm_memory):
+			return True
+
+		with tracing.span('program.prepare', args={'program': program.get_name()}):
+			return program.prepare()
+
 	""" returns True if the desired program is the same as the currently active one """
 	def set_preferred (self, index=0):
 		self.program_preferred_index = index
 		return (self.program_preferred_index == self.program_active_index)
 
+	def add_other_programs (self):
+		self.add_program('DualDisplay')
+		self.add_program('PhotoSoup')
+		self.add_program('PhotoPatterns')
+
+	""" Reports how long it took from starting the process until the first frame was drawn """
+	def log_startup_time (self):
+		message = 'First frame after {0:.2f}s'.format(self.first_frame_at - self.started)
+		if (self.cached_frame_at is not None):
+			message += ', with the last screen shown after {0:.2f}s'.format(self.cached_frame_at - self.started)
+		print(message)
+		self.data.log(message)
+		self.data.log_action('startup.first_frame', round(self.first_frame_at - self.started, 2))
+
 	def add_program (self, name):
 		# create instance of program class (based on name)
 		program = globals()[name](core=self)
@@ -350,6 +600,16 @@ class Photocore ():
 	def get_sensor_distance (self):
 		return self.distance.get_distance()
 
+	""" Returns False if nobody has been around for a while, so non-essential work can be skipped """
+	def is_someone_near (self):
+		return self.presence.is_someone_near()
+
+	""" Returns the desired time between frames in ms """
+	def get_frame_interval (self):
+		if (self.is_someone_near()):
+			return self.frame_interval
+		return self.frame_interval_idle
+
 	def get_display_brightness (self):
 		return self.display.get_brightness()
 
@@ -374,29 +634,101 @@ class Photocore ():
 
 	""" Returns disk space usage in percentage """
 	def get_disk_space (self):
-		if (time.time() > self.disk_usage_last_update + 10):
-			self.disk_usage = psutil.disk_usage('/').percent
-			self.disk_usage_last_update = time.time()
-		return self.disk_usage
+		return self.metrics.get('disk_usage', 0)
 
+	""" Returns CPU temperature in degrees Celsius """
 	def get_temperature (self):
-		if (sys.platform == 'darwin'):
-			return 0
-		else:
-			# update CPU temperature -----
-			#   call returns CPU temperature as a character string (> temp=42.8'C)
-			try:
-				temp = os.popen('vcgencmd measure_temp').readline()
-				return float(temp.replace("temp=","").replace("'C\n",""))
-			except Exception:
-				# most likely a memory allocation issue if low on memory
-				# it's not critical to the functioning though, so warn and continue
-				print('Warning: temperature cannot be read')
-				return 0
+		return self.metrics.get('temperature', 0)
 
 	def get_network_state (self):
 		return self.network.get_state_summary()
 
+	""" Returns the seconds from start until the first frame, or None if not there yet """
+	def get_startup_time (self):
+		if (self.first_frame_at is None):
+			return None
+		return self.first_frame_at - self.started
+
+	""" Keeps track of the time spent on a frame (in seconds) """
+	def record_frame (self, duration):
+		self.frame_times.append(duration)
+		self.frame_count      += 1
+		self.frame_time_total += duration
+
+	""" Returns (resident, unique) memory in bytes of worker processes that are running, as two lists of (labels, number) tuples """
+	def get_worker_memory (self):
+		resident, unique = [], []
+		processes = [('sensor', self.distance.process), ('importer', self.images.process)]
+
+		for name, process in processes:
+			if (process is not None and process.is_alive()):
+				memory = workers.get_memory(process)
+				if (memory is not None):
+					resident.append(({'worker': name}, memory[0]))
+					unique.append(({'worker': name}, memory[1]))
+		return (resident, unique)
+
+	""" Returns runtime metrics of all parts, as a list of (name, type, description, value) tuples
+		A value is either a number, or a list of (labels, number) tuples. None means unknown.
+		A summary has a dictionary as value, with a list of quantiles, and the sum and count so far.
+		Note: this gets called from the upload server's threads. """
+	def get_runtime_metrics (self):
+		snapshot    = self.metrics.get_snapshot()
+		frame_times = sorted(self.frame_times)
+		quantiles   = []
+		for q in (0.5, 0.9, 0.99):
+			if (frame_times):
+				quantiles.append(({'quantile': str(q)}, frame_times[min(int(q * len(frame_times)), len(frame_times) - 1)]))
+		cache_bytes, cache_hits, cache_misses = self.images.get_cache_stats()
+
+		memory_available = snapshot['memory_available']
+		if (memory_available is not None):
+			memory_available *= 1024 * 1024
+
+		task_runs, task_lateness, task_lateness_max = [], [], []
+		for name, runs, lateness, lateness_max, duration in self.scheduler.get_stats():
+			task_runs.append(({'task': name}, runs))
+			task_lateness.append(({'task': name}, lateness))
+			task_lateness_max.append(({'task': name}, lateness_max))
+
+		worker_resident, worker_unique = self.get_worker_memory()
+
+		return [
+			('uptime_seconds',             'gauge',   'Seconds since start', time.time() - self.started),
+			('startup_seconds',            'gauge',   'Seconds from start until the first frame', self.get_startup_time()),
+			('frame_time_seconds',         'summary', 'Time spent on frames, by quantile over recent ones',
+				{'quantiles': quantiles, 'sum': self.frame_time_total, 'count': self.frame_count}),
+			('frame_interval_seconds',     'gauge',   'Desired time between frames', self.get_frame_interval() / 1000),
+			('loop_wakeups_total',         'counter', 'Number of main loop runs', self.frame_count),
+			('program_active',             'gauge',   'Program currently on display', [({'program': self.get_active().get_name()}, 1)]),
+			('surface_cache_bytes',        'gauge',   'Memory held by loaded and rescaled images', cache_bytes),
+			('surface_cache_hits_total',   'counter', 'Image requests served from a cached size', cache_hits),
+			('surface_cache_misses_total', 'counter', 'Image requests that needed rescaling', cache_misses),
+			('images',                     'gauge',   'Images in the library', self.images.get_count()),
+			('import_pending',             'gauge',   'Uploads waiting for the importer', self.images.get_import_pending()),
+			('imports_total',              'counter', 'Uploads imported', self.images.get_import_total()),
+			('import_latency_seconds',     'gauge',   'Median time from upload until displayable', self.images.get_import_latency()),
+			('save_duration_seconds',      'gauge',   'Duration of the latest data save', self.data.get_save_duration()),
+			('saves_total',                'counter', 'Data saves', self.data.get_save_total()),
+			('http_requests_total',        'counter', 'HTTP requests by background services, including retries', self.services.get_request_total()),
+			('http_retries_total',         'counter', 'HTTP requests retried after a failure', self.services.get_retry_total()),
+			('http_failures_total',        'counter', 'HTTP requests that failed after all retries', self.services.get_failure_total()),
+			('task_runs_total',            'counter', 'Runs of scheduled tasks', task_runs),
+			('task_lateness_seconds',      'gauge',   'Time between a task being due and running, at its latest run', task_lateness),
+			('task_lateness_max_seconds',  'gauge',   'Time between a task being due and running, at most', task_lateness_max),
+			('sensor_readings_total',      'counter', 'Distance sensor readings', self.distance.get_reading_total()),
+			('sensor_sample_rate',         'gauge',   'Distance sensor readings per second, recently', self.distance.get_sample_rate()),
+			('sensor_distance_meters',     'gauge',   'Latest distance reading', self.get_sensor_distance()),
+			('presence_state',             'gauge',   'Presence, 0 for absent, 1 for approaching, 2 for present', self.presence.get_state()),
+			('memory_available_bytes',     'gauge',   'System memory available', memory_available),
+			('process_resident_bytes',     'gauge',   'Memory used by the display process', self.process_info.memory_info().rss),
+			('worker_resident_bytes',      'gauge',   'Memory used by worker processes', worker_resident),
+			('worker_unique_bytes',        'gauge',   'Memory used by worker processes, not shared with others', worker_unique),
+			('temperature_celsius',        'gauge',   'CPU temperature', snapshot['temperature']),
+			('disk_usage_ratio',           'gauge',   'Share of disk space in use', snapshot['disk_usage'] / 100),
+			('backlight',                  'gauge',   'Raw backlight value [0,255]', snapshot['backlight'])
+		]
+
 """ SelfUpdater looks online for newer versions of this code and replaces itself with such a file.
 	Upon a restart the new code should be used, thus establishing a simple update mechanism. """
 class SelfUpdater ():
@@ -404,126 +736,83 @@ class SelfUpdater ():
 		self.core            = core
 		self.use_updater     = use_updater
 		self.update_interval = 7200  # in seconds, how often does it check for updates?
-		self.last_update     = time.time() - self.update_interval + 10  # allow the code to start before 1st update
+		self.online_path     = 'https://project.sinds1984.nl/phototype/'
 
+	""" Starts checking for updates, as a periodic background service """
+	def start (self):
 		if (self.use_updater):
-			# start the importer process in another thread
-			self.updater_queue = mp.Queue()
-			self.process_queue = mp.Queue()
-			self.process       = mp.Process(target=self.run_updater)
-			self.process.start()
+			# allow the code to start before the first check
+			self.core.services.every(self.update_interval, self.check, 'updater.check', delay=10)
 
-	def update (self):
-		if (self.use_updater):
-			# check if updater is triggered by importer process
-			try:
-				# get without blocking (as that wouldn't go anywhere)
-				# raises Empty if no items in queue
-				item = self.updater_queue.get(block=False)
-				if (item is not None):
-					# call for exit to trigger a restart
-					# (relies on a systemd service that restarts this code upon closing)
-					self.core.set_exit()
-			except QueueEmpty:
-				pass
+	""" Checks for a newer version, and installs it if available (runs on the services loop) """
+	async def check (self):
+		# wait until there's a connection
+		while (not self.core.network.is_connected()):
+			await asyncio.sleep(60)
 
-	def close (self):
-		if (self.use_updater):
-			# signal to process it should close
-			self.process_queue.put(True)
-			# wait until it does so
-			print('Signalled and waiting for self-updater to close...')
-			self.process.join()
-
-	""" This is the code that the updater background process will run """
-	def run_updater (self):
-		while (True):
-			try:
-				# first, check if this process received a request to stop
-				try:
-					# get without blocking (as that wouldn't go anywhere)
-					# raises Empty if no items in queue
-					item = self.process_queue.get(block=False)
-					if (item is not None):
-						break
-				except QueueEmpty:
-					pass
-
-				# check for updates to this code - - - - - - - - - -
-
-				if (self.core.network.is_connected()):
-					if (self.last_update < time.time() - self.update_interval):
-						if (self.core.is_debug):
-							print('Updater: looking for a newer version...')
-
-						# do a request for a file with version number current + 1
-						online_path = 'https://project.sinds1984.nl/phototype/'
-						path        = 'photocore_v{0}.py'.format(version+1)
-						r = requests.get(online_path + path, stream=True)
-
-						# if successful, store the response as a file with the same name
-						if (r.status_code == 200):
-							success = False
-							
-							with open(path, 'wb') as f:
-								r.raw.decode_content = True
-								f.write(r.raw.read())
-								success = True
-
-							if (success):
-								success = False  # assume the worst, again
-
-								# check integrity of the file
-								file_hash = 'something'
-								checksum  = 'different'
-								with open(path) as file_to_check:
-									data = file_to_check.read()    
-									file_hash = md5(data.encode('utf-8')).hexdigest()
-
-								# get checksum
-								rc = requests.get(online_path + path.replace('.py', '_checksum.txt'), stream=True)
-								if (rc.status_code == 200):
-									rc.raw.decode_content = True
-									checksum = rc.raw.read().decode('utf-8')
-
-									#print(file_hash, checksum)
-									if (file_hash == checksum):
-										success = True
-							
-							if (success):
-								try:
-									# if saving is also successful, set the proper privileges
-									chown(path, user='pi', group='pi')
-									os.chmod(path, 0o777)  # pass as octal
-									
-									# rename current photocore.py to photocore_vX.py, as a backup
-									os.rename('photocore.py', 'photocore_v{0}.py'.format(version))
-									# rename the new file to photocore.py, effectively replacing it
-									os.replace(path, 'photocore.py')
-
-									# log the successful update
-									self.core.data.log('Updated photocore to version {0}.'.format(version+1))
-									# notify main thread of successful update (should trigger a restart)
-									self.updater_queue.put(True)
-								except Exception as e:
-									logging(e)
-						else:
-							if (self.core.is_debug):
-								print('Updater: no new version found at this time.')
+		if (self.core.is_debug):
+			print('Updater: looking for a newer version...')
+		tracing.instant('updater.check')
+
+		# do a request for a file with version number current + 1
+		path = 'photocore_v{0}.py'.format(version+1)
+		r    = await self.core.services.request('GET', self.online_path + path)
+
+		if (r.status_code == 200):
+			# get checksum, to check the integrity of the file
+			rc = await self.core.services.request('GET', self.online_path + path.replace('.py', '_checksum.txt'))
+			if (rc.status_code == 200):
+				success = await self.core.services.run_blocking(self.install, path, r.content, rc.content.decode('utf-8'))
+				if (success):
+					# let the main thread finish up
+					self.core.services.call_in_main(self.finish, version+1)
+		elif (self.core.is_debug):
+			print('Updater: no new version found at this time.')
+
+	""" Stores the new code as a file, and replaces the current file with it if it is intact """
+	def install (self, path, content, checksum):
+		with open(path, 'wb') as f:
+			f.write(content)
+
+		# check integrity of the file
+		with open(path) as file_to_check:
+			data = file_to_check.read()
+			file_hash = md5(data.encode('utf-8')).hexdigest()
+		if (file_hash != checksum):
+			return False
 
-						# update the time
-						self.last_update = time.time()
+		try:
+			# if saving is also successful, set the proper privileges
+			chown(path, user='pi', group='pi')
+			os.chmod(path, 0o777)  # pass as octal
+
+			# rename current photocore.py to photocore_vX.py, as a backup
+			os.rename('photocore.py', 'photocore_v{0}.py'.format(version))
+			# rename the new file to photocore.py, effectively replacing it
+			os.replace(path, 'photocore.py')
+			return True
+		except Exception as e:
+			logging(e)
+		return False
 
-				# end of useful code - - - - - - - - - - - - - - - -
+	""" Wraps up a successful update (on the main thread) """
+	def finish (self, new_version):
+		# log the successful update
+		self.core.data.log('Updated photocore to version {0}.'.format(new_version))
+		# call for exit to trigger a restart
+		# (relies on a systemd service that restarts this code upon closing)
+		self.core.set_exit()
 
-				# wait until next round (keep short to enable quick shutdown)
-				time.sleep(3)
-			# ignore any key input (handled by main thread)
-			except KeyboardInterrupt:
-				pass
 
-		# finally, after exiting while loop, it ends here
-		#print('Terminating updater process')
+"""
+Loads data saved while photocore.py ran as the main script (before start.py), which refers
+to its classes as __main__.Image and such. These are found in this module instead.
+"""
+class DataUnpickler (pickle.Unpickler):
+	def find_class (self, module, name):
+		if (module == '__main__'):
+			module = __name__
+		return super().find_class(module, name)
 
 
 class DataManager ():
@@ -540,11 +829,15 @@ class DataManager ():
 		self.last_export = time.time()  # timestamp at now, to avoid immediate export
 		self.min_time_between_saves  = 180   # avoid excessive writing to disk
 		self.min_time_between_export = 7200  # once every 2 hours
+		self.save_duration = None  # in seconds, for the latest save
+		self.save_total    = 0
+		self.save_task     = None  # scheduled once there are changes to save
+		self.image_index   = None  # file path: image data, made when first needed
 
 		# os.uname().nodename
 		try:
 			with open('data.bin', 'rb') as f:
-				loaded_data = pickle.load(f)
+				loaded_data = DataUnpickler(f).load()
 				for key in ('log', 'programs', 'images', 'interactions'):
 					if (key in loaded_data):
 						self.data[key] = loaded_data[key]
@@ -555,10 +848,14 @@ class DataManager ():
 		except Exception as e:
 			raise e
 
+	""" Saves changes, run as a task once changes have been made (see set_dirty) """
 	def update (self):
-		if (self.dirty and self.last_save < time.time() - self.min_time_between_saves):
+		self.save_task = None
+
+		if (self.dirty):
 			# for images reference to a list
 			self.data['images'] = self.core.images.images
+			self.image_index    = None
 
 			# programs do not get referenced/stored in full
 			# instead, keep track through simpler objects
@@ -604,7 +901,14 @@ class DataManager ():
 			self.data['log'].append(t + message)
 		self.dirty = True
 
+		# save once some time has passed since the last save, to avoid excessive writing to disk
+		if (self.save_task is None):
+			delay = max(self.last_save + self.min_time_between_saves - time.time(), 0)
+			self.save_task = self.core.scheduler.after(delay, self.update, 'data.save')
+
 	def save (self, export=False):
+		t0 = time.time()
+
 		# regular save
 		with open('data.bin', 'wb') as f:
 			pickle.dump(self.data, f)
@@ -636,36 +940,50 @@ class DataManager ():
 			if (self.core.use_network):
 				self.save_external()
 
+		self.save_duration = time.time() - t0
+		self.save_total   += 1
+
+	def get_save_duration (self):
+		return self.save_duration
+
+	def get_save_total (self):
+		return self.save_total
+
+	""" Uploads data files to an external location, as a background service """
 	def save_external (self):
 		if (self.core.is_debug):
 			print('DataManager: uploading data...')
-		
-		success = False
-		self.hostname = 'test'  # by default, macOS gives convulated hostname
+
+		hostname = 'test'  # by default, macOS gives convulated hostname
 		if (sys.platform != 'darwin'):
-			self.hostname = gethostname()
+			hostname = gethostname()
 
-		self.save_external_process = mp.Process(target=self.save_external_uploader)
-		self.save_external_process.start()
-		
-	def save_external_uploader (self):
-		try:
-			for filename in ['data.log', 'data.bin', 'errors.log']:
-				with open(filename, 'rb') as datafile:
-					r = requests.post('http://project.sinds1984.nl/phototype/data_uploader.php', files={'f': ('{0}_{1}'.format(self.hostname, filename), datafile)})
-
-					if (r.status_code == 200):
-						response = r.json()
-						if (response['success']):
-							if (self.core.is_debug):
-								print('DataManager: uploading of {0} successful.'.format(filename))
-						else:
-							logging('DataManager: uploading data failed. - ' + str(response))
-		# ignore any key input (handled by main thread)
-		except KeyboardInterrupt:
-			pass
-		except Exception as e:
-			logging('DataManager: uploading data failed. - ' + str(e))
+		self.core.services.submit(self.upload(hostname, ['data.log', 'data.bin', 'errors.log']), 'data.upload')
+
+	""" Uploads files (runs on the services loop) """
+	async def upload (self, hostname, filenames):
+		for filename in filenames:
+			try:
+				# read in full, as a retry needs it again (on the thread pool, as the loop shouldn't wait on disk)
+				data = await self.core.services.run_blocking(self.read_file, filename)
+
+				r = await self.core.services.request('POST', 'http://project.sinds1984.nl/phototype/data_uploader.php',
+					files={'f': ('{0}_{1}'.format(hostname, filename), data)})
+
+				if (r.status_code == 200):
+					response = r.json()
+					if (response['success']):
+						if (self.core.is_debug):
+							print('DataManager: uploading of {0} successful.'.format(filename))
+					else:
+						logging('DataManager: uploading data failed. - ' + str(response))
+			except Exception as e:
+				logging('DataManager: uploading data failed. - ' + str(e))
+				break
+
+	def read_file (self, filename):
+		with open(filename, 'rb') as datafile:
+			return datafile.read()
 
 	def get_program_match (self, name):
 		for program in self.data['programs']:
@@ -676,16 +994,130 @@ class DataManager ():
 
 	""" Return a matching image based on file path """
 	def get_image_match (self, file_path):
-		for img in self.data['images']:
-			if (img.file == file_path):
-				return img
-		# without a match
-		return None
+		# index the images by path, rather than going through all on every call
+		if (self.image_index is None):
+			self.image_index = {}
+			for img in self.data['images']:
+				self.image_index.setdefault(img.file, img)
+		return self.image_index.get(file_path)
+
+
+""" MetricsCollector samples system state (temperature, memory, disk, network, backlight)
+	on a background thread, each at its own interval. Every round publishes a fresh
+	snapshot dictionary, so readers on the main thread never wait or lock. """
+class MetricsCollector ():
+	def __init__ (self, intervals={}, net_types=(), thermal_path='/sys/class/thermal/thermal_zone0/temp',
+		backlight_path='/sys/class/backlight/rpi_backlight/actual_brightness'):
+		self.net_types      = net_types
+		self.thermal_path   = thermal_path
+		self.backlight_path = backlight_path
+
+		# seconds between samples, per metric
+		self.intervals = {
+			'temperature': 5,
+			'memory'     : 10,
+			'disk'       : 30,
+			'network'    : 10,
+			'backlight'  : 10
+		}
+		self.intervals.update(intervals)
+
+		self.samplers = {
+			'temperature': self.sample_temperature,
+			'memory'     : self.sample_memory,
+			'disk'       : self.sample_disk,
+			'network'    : self.sample_network,
+			'backlight'  : self.sample_backlight
+		}
+
+		# the snapshot is only ever replaced as a whole, never changed in place
+		self.snapshot = {
+			'timestamp'       : 0,
+			'temperature'     : 0,     # degrees Celsius
+			'memory_available': None,  # in MB
+			'memory_total'    : None,  # in MB
+			'disk_usage'      : 0,     # percentage
+			'network'         : {},    # per interface: (ip address, netmask)
+			'backlight'       : None   # raw backlight value [0,255]
+		}
+
+		self.stop_event = threading.Event()
+		self.thread     = threading.Thread(target=self.run_collector, name='metrics')
+		self.thread.daemon = True
+		self.thread.start()
+
+	def close (self):
+		self.stop_event.set()
+		self.thread.join(1)
+
+	""" Returns a value from the latest snapshot """
+	def get (self, key, default=None):
+		value = self.snapshot.get(key)
+		if (value is None):
+			return default
+		return value
+
+	def get_snapshot (self):
+		return self.snapshot
+
+	""" This is the code that the collector thread will run """
+	def run_collector (self):
+		next_sample = dict.fromkeys(self.samplers, 0)
+
+		while (not self.stop_event.is_set()):
+			now      = time.time()
+			snapshot = dict(self.snapshot)
+
+			for name in self.samplers:
+				if (next_sample[name] <= now):
+					try:
+						snapshot.update(self.samplers[name]())
+					except Exception as e:
+						# not critical to the functioning, so warn and continue
+						print('Warning: {0} cannot be read ({1})'.format(name, e))
+					next_sample[name] = now + self.intervals[name]
+
+			snapshot['timestamp'] = now
+			self.snapshot = snapshot  # swap in as a whole
+
+			# sleep until the next sample is due (or until asked to stop)
+			self.stop_event.wait(max(min(next_sample.values()) - time.time(), 0.1))
+
+	def sample_temperature (self):
+		if (sys.platform == 'darwin'):
+			return {'temperature': 0}
+		# file contains CPU temperature in millidegrees Celsius (> 42774)
+		with open(self.thermal_path, 'r') as f:
+			return {'temperature': round(int(f.read()) / 1000.0, 1)}
+
+	def sample_memory (self):
+		memory = psutil.virtual_memory()
+		return {
+			'memory_available': round(memory.available / (1024*1024)),
+			'memory_total'    : round(memory.total / (1024*1024))
+		}
+
+	def sample_disk (self):
+		return {'disk_usage': psutil.disk_usage('/').percent}
+
+	def sample_network (self):
+		net_state = psutil.net_if_addrs()
+		network   = {}
+		for net in self.net_types:
+			if (net in net_state):
+				network[net] = (net_state[net][0].address, net_state[net][0].netmask)
+		return {'network': network}
+
+	def sample_backlight (self):
+		if (sys.platform == 'darwin'):
+			return {}
+		with open(self.backlight_path, 'r') as f:
+			return {'backlight': int(f.read())}
 
 
 class NetworkManager ():
-	def __init__ (self):
-		self.last_update = 0
+	def __init__ (self, core=None):
+		self.core      = core
 		self.net_types = ('eth0','wlan0')
 		if (sys.platform == 'darwin'):
 			self.net_types = ('en1','en0')
@@ -703,25 +1135,21 @@ class NetworkManager ():
 			}
 		}
 
-	def update (self, regular=True):
-		now = time.time()
+		self.core.scheduler.every(10, self.update, 'network.update', delay=0, jitter=1)
 
-		if (not regular or self.last_update < now - 10):
-			# update network state
-			net_state = psutil.net_if_addrs()
-
-			for net in self.net_types:
-				ip      = net_state[net][0].address
-				netmask = net_state[net][0].netmask
-				# check 'symptoms' to deduce network status
-				if ('.' in ip and netmask is not None):
-					self.state[net]['connected'] = True
-					self.state[net]['ip']        = ip
-				else:
-					self.state[net]['connected'] = False
-					self.state[net]['ip']        = ''
+	""" Updates network state (from addresses last sampled by metrics collector), run as a periodic task """
+	def update (self):
+		net_state = self.core.metrics.get('network', {})
 
-			self.last_update = now
+		for net in self.net_types:
+			ip, netmask = net_state.get(net, ('', None))
+			# check 'symptoms' to deduce network status
+			if ('.' in ip and netmask is not None):
+				self.state[net]['connected'] = True
+				self.state[net]['ip']        = ip
+			else:
+				self.state[net]['connected'] = False
+				self.state[net]['ip']        = ''
 
 	def close (self):
 		pass
@@ -736,11 +1164,8 @@ class NetworkManager ():
 
 	""" Returns True if any network is up and running, False if none are """
 	def is_connected (self):
-		# note: uses direct stats from psutil, as a call from another process has no
-		#       access to live state info after it starts.
-		state = psutil.net_if_stats()
 		for net in self.net_types:
-			if (state[net].isup):
+			if (self.state[net]['connected']):
 				return True
 		return False
 
@@ -752,8 +1177,8 @@ class NetworkManager ():
 		return False
 
 	def get_state_summary (self):
-		# first, force an update
-		self.update(False)
+		# first, force an update (cheap, as it only reads the latest sampled state)
+		self.update()
 
 		# generate a one line summary
 		summary = ''
@@ -769,34 +1194,38 @@ class NetworkManager ():
 
 
 class DisplayManager ():
-	def __init__ (self):
+	def __init__ (self, core=None):
+		self.core        = core
 		self.brightness  = 255
 		self.is_on       = True
+		self.is_dimmed   = False
+		self.dim_value   = 13   # backlight value while dimmed, [0,255]
 		self.path        = "/sys/class/backlight/rpi_backlight/"
 		self.last_change = 0
 		self.last_manual_change = 0
 
+		# auto adjust once a minute
+		self.core.scheduler.every(60, self.update, 'display.update', delay=0)
+
 	def update (self):
 		now = time.time()
 
 		# only automatically adjust display brightness if user hasn't overridden this
 		# this the past n seconds (30 min)
 		if (self.last_manual_change < now - 1800):
-			# only auto adjust when some time has passed since the last change
-			if (self.last_change < now - 60):
-				# derive value between high and low based on current time
-				low             = 5
-				high            = 70
-				auto_brightness = low
-
-				# take current time, convert to [0-pi], then take sin to get [20-80]
-				current_time = time.localtime()
-				tt = current_time.tm_hour + current_time.tm_min/60.0  # [0-23.98]
-
-				# at night (21.5 -> 6) just use low value
-				if (tt > 6 and tt < 21.5):
-					auto_brightness = (high - low) * sin(((tt-6) / (21.5-6)) * pi) + low
-				self.set_brightness(auto_brightness)
+			# derive value between high and low based on current time
+			low             = 5
+			high            = 70
+			auto_brightness = low
+
+			# take current time, convert to [0-pi], then take sin to get [20-80]
+			current_time = time.localtime()
+			tt = current_time.tm_hour + current_time.tm_min/60.0  # [0-23.98]
+
+			# at night (21.5 -> 6) just use low value
+			if (tt > 6 and tt < 21.5):
+				auto_brightness = (high - low) * sin(((tt-6) / (21.5-6)) * pi) + low
+			self.set_brightness(auto_brightness)
 
 	def close (self):
 		pass
@@ -808,12 +1237,12 @@ class DisplayManager ():
 	def set_on (self, on=True):
 		self._set_value("bl_power", int(not on))
 
-	""" Returns brightness on a scale of [0,100] """
+	""" Returns brightness on a scale of [0,100]
+		This process is the only one setting the backlight, so the last value set is returned. """
 	def get_brightness (self):
 		if (self.is_on is False):
 			return 0
 		else:
-			self.brightness = int(self._get_value("actual_brightness"))
 			return round(self.brightness / 2.55)
 
 	""" Input is in range [0,100] """
@@ -822,12 +1251,24 @@ class DisplayManager ():
 		self.is_on = (self.brightness > 0)
 
 		# set state accordingly
-		self._set_value("brightness", self.brightness)
+		self._set_value("brightness", self.get_backlight_value())
 
 		if (user_initiated):
 			self.last_manual_change = time.time()
 		self.last_change = time.time()
 
+	""" Dims the backlight (without losing the set brightness) or restores it """
+	def set_dimmed (self, dimmed=True):
+		if (dimmed != self.is_dimmed):
+			self.is_dimmed = dimmed
+			self._set_value("brightness", self.get_backlight_value())
+
+	""" Returns the value the backlight should be at, [0,255] """
+	def get_backlight_value (self):
+		if (self.is_dimmed):
+			return min(self.brightness, self.dim_value)
+		return self.brightness
+
 	# ----- functions below via: https://github.com/linusg/rpi-backlight/ --------
 
 	def _get_value (self, name):
@@ -850,37 +1291,31 @@ class DisplayManager ():
 		
 
 class DistanceSensor ():
-	def __init__ (self):
+	def __init__ (self, backend='gpio', use_mock=False):
 		self.distance = 2  # in meters
 		self.distance_direction = True  # True if >, False if <
 		
-		# setup  connection
+		# setup  connection (on macOS, GPIO is mocked so it's only used when explicitly asked for)
+		self.backend    = backend
+		self.use_mock   = use_mock
 		self.use_sensor = True
-		if (sys.platform == 'darwin'):
+		if (sys.platform == 'darwin' and not use_mock):
 			self.use_sensor = False
 
-		# start the input measurement process in another thread
+		# readings are shared via memory (also for fake readings, so history is always available)
+		self.channel = SensorChannel()
+
+		# start the input measurement process, so reading never waits for the main loop
+		self.process = None
 		if (self.use_sensor):
-			self.sensor_queue  = mp.Queue()
-			self.process_queue = mp.Queue()
-			self.process       = mp.Process(target=self.run_sensor_input)
-			self.process.start()
+			self.stop_signal   = workers.StopSignal()
+			self.process       = workers.start(workers.run_sensor, name='sensor', args=(self.channel, self.stop_signal, self.backend))
 
-	""" Read distance sensor data over serial connection """
+	""" Read distance sensor data as published by the measurement process """
 	def update (self):
 		if (self.use_sensor):
-			# check if sensor measurement process has left a new reading
-			try:
-				# get without blocking (as that wouldn't go anywhere)
-				# raises Empty if no items in queue
-
-				# get all items to avoid delays (as items are put in faster than handled here)
-				while not self.sensor_queue.empty():
-					item = self.sensor_queue.get(block=False)
-					if (item is not None):
-						self.distance = item
-			except QueueEmpty:
-				pass
+			# only the latest reading is of interest, older ones are simply overwritten
+			self.distance = self.channel.get_latest(self.distance)
 		else:
 			# without sensor, fake the distance going up and down over time
 			if (self.distance_direction is True):
@@ -893,164 +1328,240 @@ class DistanceSensor ():
 				if (self.distance < 0.2):
 					self.distance = 0.2
 					self.distance_direction = True
+			self.channel.publish(self.distance)
 
 	def close (self):
 		# close serial connection
 		if (self.use_sensor):
-			# signal to process it should close
-			self.process_queue.put(True)
-			# wait until it does so
+			# signal to process it should close, and wait (for a little while) until it does so
 			print('Signalled and waiting for sensor process to close...')
-			self.process.join()
+			ended = workers.stop(self.process, self.stop_signal)
+			if (ended != 'stopped'):
+				logging('DistanceSensor: sensor process did not stop in time, so it was {0}.'.format(ended))
 
 	""" Returns distance in meters """
 	def get_distance (self):
 		return self.distance
 
-	""" This function is run as a separate process to avoid locking due to GPIO polling """
-	def run_sensor_input (self):
-		# setup variables
-		distance = 2  # in meters
-
-		# parameters for the low pass filter
-		# As k decreases, the low pass filter resolution improves but the bandwidth decreases.
-		acc = 0.5   # starting value
-		k   = 0.005  # default is .01
-
-		# initiate GPIO input
-		GPIO.setmode(GPIO.BCM)  # choose BCM or BOARD numbering schemes
-		# set pin to input
-		input_pin = 16  # outer row, 3rd from USB ports
-		if (gethostname() == 'protopi4'):
-			input_pin = 12  # pin 16 broke off for this one :'(
-		GPIO.setup(input_pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
-
-		# run this while loop forever, unless a signal tells otherwise
-		while (True):
-			try:
-				# first, check if this process received a request to stop
-				try:
-					# get without blocking (as that wouldn't go anywhere)
-					# raises Empty if no items in queue
-					item = self.process_queue.get(block=False)
-					if (item is not None):
-						break
-				except QueueEmpty:
-					pass
-
-				# useful code - - - - - - - - - - - - - - - - - - - - - - - - -
-
-				""" no analog or hardware PWM readings are possible on a RPi3.
-					However, we can undersample the PWM signal and take an average,
-					assuming we hit low and high measurements in a proportion approximating
-					the true PWM high/low proportion. This is undersampling so requires
-					averaging out over a period of time to get stable readings.
-				"""
-
-				# read from input
-				x = int(GPIO.input(input_pin))  # 1 or 0
-
-				# apply IIR low pass filter (undersampling, so it requires an average)
-				acc += k * (x - acc)
-
-				# convert from [0.1] to a value in meters
-				""" LV-MaxSonar data
-					PW: This pin outputs a pulse width representation of range.
-					The distance can be calculated using the scale factor of 147uS per inch.
-					PWM range is (0.88, 37.5) in mS
-				"""
-				distance = self.map_value(acc, 0, 1, 0.88, 37.5) / 0.147 * 2.51 / 100.0
-				
-				#print('PWM: {0:.2f}\t\tDistance: {1:.2f}m'.format(acc, distance))
-
-				# send the new measure to queue
-				self.sensor_queue.put(distance)
-
-				# wait until next round
-				time.sleep(0.02)
-			# ignore any key input (handled by main thread)
-			except KeyboardInterrupt:
-				pass
-
-		# finally, after exiting while loop, it ends here
-		#print('Terminating sensor measurement process')
-		GPIO.cleanup()
-
-	def map_value (self, value, inMin, inMax, outMin, outMax):
-		# Figure out how 'wide' each range is
-		inSpan = inMax - inMin
-		outSpan = outMax - outMin
+	""" Returns up to n recent readings as (timestamp, distance) tuples, oldest first """
+	def get_history (self, n=10):
+		return self.channel.get_history(n)
 
-		# Convert the in range into a 0-1 range (float)
-		valueScaled = float(value - inMin) / float(inSpan)
+	""" Returns the number of readings so far """
+	def get_reading_total (self):
+		return self.channel.get_sequence()
 
-		# Convert the 0-1 range into a value in the out range.
-		return outMin + (valueScaled * outSpan)
+	""" Returns the number of readings per second, over the most recent ones """
+	def get_sample_rate (self, n=20):
+		history = self.channel.get_history(n)
+		if (len(history) < 2 or history[-1][0] <= history[0][0]):
+			return 0
+		return (len(history) - 1) / (history[-1][0] - history[0][0])
 
 
 class ImageManager ():
 	def __init__ (self, image_folder='', upload_folder='', core=None, use_import=True):
 		self.core          = core
 		self.images        = []
+		self.image_index   = {}  # file path: Image, for quick lookups
 		self.recent        = []
 		self.image_folder  = image_folder
 		self.upload_folder = upload_folder
 
-		# for importer process
-		self.use_importer  = use_import
-		self.do_delete     = True
-		self.last_update   = 0
+		# the library gets scanned in the background, with files found passed on via the scan queue
+		self.scan_queue    = queue.Queue()
+		self.scan_thread   = None
+		self.scan_complete = False
+		self.scan_batch    = 500  # max number of files added per frame
+
+		# images get decoded ahead of use on a thread of their own, see preload
+		self.preload_queue  = queue.Queue()
+		self.preload_thread = None
 
+		# for importer process
+		self.use_importer     = use_import
+		self.do_delete        = True
+		self.scan_interval    = 60                # seconds between checks for files that weren't uploaded via the server
+		self.import_latencies = deque(maxlen=50)  # seconds from upload completion until displayable
+		self.import_total     = 0
+
+		# near-duplicates (e.g., the same photo at another size) are found via perceptual hashes
+		self.similar          = BKTree()
+		self.similar_distance = 6  # max number of differing bits (out of 64) for images to count as similar
+		self.dhash_requested  = set()    # files to be hashed by the importer (asked for already, or in the backlog)
+		self.dhash_backlog    = deque()  # files to hash, passed on to the importer a batch at a time (see update)
+		self.dhash_batch      = 4        # max number of hashes the importer works on at once
+		self.dhash_pending    = 0        # number of hashes asked for, but not returned yet
+		self.dhash_failed     = set()    # files that couldn't be hashed, which aren't asked for again
+
+		# uploads are announced via the import queue, results come back via the scanner queue
+		# (the importer process and upload server only start later on, see start_services)
+		self.process       = None
+		self.upload_server = None
+		if (self.use_importer):
+			self.scanner_queue  = workers.context.Queue()
+			self.import_queue   = workers.context.Queue()
+			# number of uploads announced but not yet imported, so the server can hold off new ones
+			# (a counter, as Queue.qsize() isn't available on macOS)
+			self.import_pending = workers.context.Value('i', 0)
+			self.stop_signal    = workers.StopSignal()
+
+	""" Starts the importer process and upload server """
+	def start_services (self):
 		if (self.use_importer):
-			# start the importer process in another thread
-			self.scanner_queue = mp.Queue()
-			self.process_queue = mp.Queue()
-			self.process       = mp.Process(target=self.run_importer)
-			self.process.start()
+			# only loaded now, as the server (and its dependencies) take a while to import
+			from simpleserver import SimpleServer, ContentIndex
+
+			# hashes of imported uploads, to recognise files that were uploaded before
+			self.content_index = ContentIndex(os.path.join(self.image_folder, 'hashes.txt'))
 
-			# also manage a simple webserver interface for image uploads
+			# start the importer process, which keeps a content index of its own
+			self.process = workers.start(workers.run_importer, name='importer', args=(self.image_folder, self.upload_folder,
+				self.import_queue, self.scanner_queue, self.import_pending, self.stop_signal, self.scan_interval, self.do_delete))
+
+			# also manage a simple webserver interface for image uploads (and browsing the library)
+			thumbnail_folder = os.path.join(os.path.dirname(self.image_folder), 'thumbnails')
 			if (os.geteuid() == 0):  # with root access
-				self.upload_server = SimpleServer(debug=self.core.is_debug, port=80, use_signals=False, regular_run=False)
+				self.upload_server = SimpleServer(debug=self.core.is_debug, port=80, use_signals=False, regular_run=False,
+					import_queue=self.import_queue, content_index=self.content_index, import_pending=self.import_pending,
+					catalog=self.get_catalog, image_folder=self.image_folder, thumbnail_folder=thumbnail_folder,
+					metrics=self.core.get_runtime_metrics)
 			else:
-				self.upload_server = SimpleServer(debug=self.core.is_debug, use_signals=False, regular_run=False)
-
-		# load images
-		self.scan_folder(self.image_folder, 'append')
+				self.upload_server = SimpleServer(debug=self.core.is_debug, use_signals=False, regular_run=False,
+					import_queue=self.import_queue, content_index=self.content_index, import_pending=self.import_pending,
+					catalog=self.get_catalog, image_folder=self.image_folder, thumbnail_folder=thumbnail_folder,
+					metrics=self.core.get_runtime_metrics)
+
+	""" Starts loading the library in the background """
+	def start_scan (self):
+		self.scan_thread = threading.Thread(target=self.run_scanner, name='scanner')
+		self.scan_thread.daemon = True
+		self.scan_thread.start()
+
+	""" This is the code that the scanner thread will run """
+	def run_scanner (self):
+		with tracing.span('images.scan'):
+			self.scan_folder(self.image_folder, 'queue')
+		self.scan_queue.put(None)  # signals the end of the scan
 
 	def update (self):
+		# add files found by the scanner, a batch at a time to keep frames going
+		if (self.scan_thread is not None):
+			for i in range(self.scan_batch):
+				try:
+					item = self.scan_queue.get(block=False)
+				except QueueEmpty:
+					break
+
+				if (item is None):
+					# done scanning
+					self.scan_thread.join()
+					self.scan_thread   = None
+					self.scan_complete = True
+					self.core.data.log_action('images.scan', 'loaded {0}'.format(self.get_count()))
+					self.request_dhashes()
+					break
+				self.append(*item)
+
 		if (self.use_importer):
-			# check if scanner is triggered by importer process
-			try:
-				# get without blocking (as that wouldn't go anywhere)
-				# raises Empty if no items in queue
-				item = self.scanner_queue.get(block=False)
-				if (item is not None):
+			# check for results from the importer process
+			while (True):
+				try:
+					# get without blocking (as that wouldn't go anywhere)
+					# raises Empty if no items in queue
+					item = self.scanner_queue.get(block=False)
+				except QueueEmpty:
+					break
+
+				if (item is True):
+					# new files were found by a periodic check, so rescan
 					additions = abs(self.get_count() - self.scan_folder(self.image_folder, 'append'))
 					self.core.data.log_action('images.scan', '+{0}, for a total of {1}'.format(additions, self.get_count()))
-			except QueueEmpty:
-				pass
+					self.request_dhashes()
+				elif (item is not None and item[0] == 'dhash'):
+					# a hash was calculated for an image already in the library
+					kind, file_path, dhash = item
+					self.dhash_pending -= 1
+					self.dhash_requested.discard(file_path)
+					if (dhash is None):
+						self.dhash_failed.add(file_path)
+					elif (file_path in self.image_index):
+						self.set_dhash(self.image_index[file_path], dhash)
+				elif (item is not None and item[0] == 'image'):
+					# a single upload was imported, add it directly
+					kind, file_path, uploaded_at, dhash = item
+					with tracing.span('images.append', args={'file': file_path}):
+						tracing.flow('upload', int(uploaded_at * 1e6), 'f')
+						image = self.append(os.path.dirname(file_path), os.path.basename(file_path))
+						if (image is not None):
+							self.set_dhash(image, dhash)
+
+					# keep track of the time it took to get here
+					latency = time.time() - uploaded_at
+					self.import_latencies.append(latency)
+					self.import_total += 1
+					self.core.data.log_action('images.import', '{0}, after {1:.2f}s, for a total of {2}'.format(file_path, latency, self.get_count()))
+
+			# hashes for the library are asked for a few at a time, and only while no uploads wait to be imported,
+			# so an upload never queues up behind a library's worth of hashing (see request_dhashes)
+			if (self.dhash_backlog and self.dhash_pending == 0 and self.import_pending.value == 0):
+				while (self.dhash_backlog and self.dhash_pending < self.dhash_batch):
+					self.import_queue.put(('dhash', self.dhash_backlog.popleft()))
+					self.dhash_pending += 1
 
 	def close (self):
 		self.check_use(0) # unload all images unused since now
-		self.images = []  # reset to severe memory links
+		self.images      = []  # reset to severe memory links
+		self.image_index = {}
 
-		if (self.use_importer):
-			# signal upload server to shutdown
+		if (self.preload_thread is not None):
+			self.preload_queue.put(None)
+			self.preload_thread.join()
+
+		# signal upload server to shutdown
+		if (self.upload_server is not None):
 			self.upload_server.shutdown()
 
-			# signal to process it should close
-			self.process_queue.put(True)
-			# wait until it does so
+		if (self.process is not None):
+			# signal to process it should close (with None waking it if waiting for an upload)
 			print('Signalled and waiting for importer to close...')
-			self.process.join()
+			self.import_queue.put(None)
+			ended = workers.stop(self.process, self.stop_signal)
+			if (ended != 'stopped'):
+				logging('ImageManager: importer did not stop in time, so it was {0}.'.format(ended))
 
-	""" Checks recent use of images, requests to unload those unused """
-	def check_use (self, seconds_ago=5):
+	""" Checks recent use of images, requests to unload those unused (except for any in keep) """
+	def check_use (self, seconds_ago=5, keep=[]):
 		recent = time.time() - seconds_ago  # n seconds ago
 		for image in self.images:
-			if (not image.check_use_since(recent)):
+			if (not image.check_use_since(recent) and image not in keep):
 				image.unload()
 
+	""" Has an image decoded in the background, so it's quick to load once needed """
+	def preload (self, image):
+		if (self.preload_thread is None):
+			self.preload_thread = threading.Thread(target=self.run_preloader, name='preloader')
+			self.preload_thread.daemon = True
+			self.preload_thread.start()
+
+		image.is_preloading = True
+		self.preload_queue.put(image)
+
+	""" This is the code that the preload thread will run """
+	def run_preloader (self):
+		while (True):
+			image = self.preload_queue.get()
+			if (image is None):
+				break
+
+			try:
+				with tracing.span('images.preload', args={'file': image.file}):
+					image.preload()
+			except pygame.error as e:
+				print('Could not preload {0}: {1}'.format(image.file, e))
+			finally:
+				image.is_preloading = False
+
 	def scan_folder (self, folder=None, call='append'):
 		num_of_files_found = 0
 
@@ -1063,11 +1574,12 @@ class ImageManager ():
 
 			# check all filenames, act on valid ones
 			for filename in filenames:
-				if filename.lower().endswith(('.jpg', '.jpeg')):
+				# (skipping hidden files, such as a partly saved import)
+				if filename.lower().endswith(('.jpg', '.jpeg')) and not filename.startswith('.'):
 					if (call == 'append'):
 						self.append(dirname, filename)
-					elif (call == 'check_and_resize'):
-						self.check_and_resize(dirname, filename)
+					elif (call == 'queue'):
+						self.scan_queue.put((dirname, filename))
 
 					num_of_files_found += 1
 
@@ -1075,15 +1587,9 @@ class ImageManager ():
 
 	def append (self, dirname, filename):
 		file_path = os.path.join(dirname, filename)
-		# check if file_path is already in list
-		duplicate = False
-
-		for image in self.images:
-			if (image.file == file_path):
-				duplicate = True
 
 		# if new, append the list
-		if (duplicate == False):
+		if (file_path not in self.image_index):
 			p = Image(file_path)
 			# also check if data is available on this image
 			file_match = self.core.data.get_image_match(file_path)
@@ -1091,12 +1597,58 @@ class ImageManager ():
 				p.set_shown(file_match.shown)
 				p.set_rate(file_match.rate)
 				p.hide(file_match.hidden)
+				# data saved by older versions has no hash yet
+				dhash = getattr(file_match, 'dhash', None)
+				if (dhash is not None):
+					p.set_dhash(dhash)
+					self.similar.add(dhash, p)
 			# add to list
 			self.images.append(p)
+			self.image_index[file_path] = p
+			return p
+
+		return None
+
+	""" Adds images without a perceptual hash to the backlog for the importer to calculate (see update) """
+	def request_dhashes (self):
+		if (self.use_importer):
+			for image in self.images:
+				if (image.dhash is None and image.file not in self.dhash_requested and image.file not in self.dhash_failed):
+					self.dhash_requested.add(image.file)
+					self.dhash_backlog.append(image.file)
+
+	""" Stores an image's perceptual hash, and flags any near-duplicates already in the library """
+	def set_dhash (self, image, dhash):
+		if (dhash is None or image.dhash is not None):
+			return
+		image.set_dhash(dhash)
+
+		for distance, other in self.similar.find(dhash, self.similar_distance):
+			self.core.data.log_action('images.similar', '{0} ~ {1}, distance {2}'.format(image.file, other.file, distance))
+		self.similar.add(dhash, image)
+
+	""" Returns True if an image is similar to any of the given image files
+		These are the few images on display, so comparing to each is quicker than a search of the whole library. """
+	def is_similar_to_any (self, image, files=[]):
+		if (image.dhash is None):
+			return False
+		return any(hamming_distance(image.dhash, self.image_index[f].dhash) <= self.similar_distance for f in files
+			if f in self.image_index and self.image_index[f] is not image and self.image_index[f].dhash is not None)
 
 	def get_images (self):
 		return self.images
 
+	""" Returns the image with file path, or None if not in the library """
+	def get_image (self, file_path):
+		return self.image_index.get(file_path)
+
+	""" Returns the file paths of images loaded into memory """
+	def get_loaded_paths (self):
+		return [image.file for image in self.images if image.is_loaded]
+
+	def is_scan_complete (self):
+		return self.scan_complete
+
 	def get_random (self):
 		return self.images[ random.randint(0, len(self.images)-1) ]
 
@@ -1105,12 +1657,19 @@ class ImageManager ():
 		# get an image to return, and make sure it wasn't returned recently
 		now = time.time()
 		acceptable = False
+		tries      = 0
 
 		while not acceptable:
+			tries += 1
 			img = self.get_random()
 			if (img.hidden < now and img.file not in self.recent and img.file not in current_images):
 				acceptable = True
 
+				# avoid showing two copies of the same photo side by side
+				# (unless there seems to be little else, to avoid searching forever)
+				if (tries < 100 and self.is_similar_to_any(img, current_images)):
+					acceptable = False
+
 				# also consider the image rating to determine whether to accept it
 				# (so higher rating => higher chance of acceptance)
 				if (rated):
@@ -1132,353 +1691,54 @@ class ImageManager ():
 	def get_count (self):
 		return len(self.images)
 
-	""" This is the code that the importer background process will run """
-	def run_importer (self):
-		# run this while loop forever, unless a signal tells otherwise
-		while (True):
-			try:
-				# first, check if this process received a request to stop
-				try:
-					# get without blocking (as that wouldn't go anywhere)
-					# raises Empty if no items in queue
-					item = self.process_queue.get(block=False)
-					if (item is not None):
-						break
-				except QueueEmpty:
-					pass
-
-				# check for new images
-				if (time.time() > self.last_update + 10):
-					new_images = self.scan_folder(self.upload_folder, 'check_and_resize')
-					
-					# indicate we have new images to scan
-					if (new_images > 0):
-						self.scanner_queue.put(True)
-
-					self.last_update = time.time()
-
-				time.sleep(5)
-			# ignore any key input (handled by main thread)
-			except KeyboardInterrupt:
-				pass
-
-		# finally, after exiting while loop, it ends here
-		#print('Terminating importer process')
-
-	""" Takes in an image filepath, checks if a resize is possible, then deletes original """
-	def check_and_resize (self, dirname, filename):
-		# decide on in/output path
-		in_file_path        = os.path.join(dirname, filename)
-		in_file_size        = os.stat(in_file_path).st_size
-		marked_for_deletion = False
-
-		# consider a unique filename based on original filename and filesize (to avoid same names across folders mixups)
-		# use only the first 12 characters to keep it sane / legible
-		out_filename = md5(filename.encode('utf-8') + str(in_file_size).encode('utf-8')).hexdigest()[:12] + '.jpg'
-		out_file_path = os.path.join(self.image_folder, out_filename)
-
-		# check if resized image already exists, otherwise take action
-		if (os.path.exists(out_file_path) is True):
-			marked_for_deletion = True
-		else:
-			# use photocore's Image class for resizing and saving
-			p = Image(in_file_path, use_convert=False)
-			surface, size_string = p.get((800,480), fill_box=True, remove_black=True, check_orientation=True)
-			#print('Resizing: ', in_file_path, surface.get_size())
-			result = p.save_to_file(size_string, out_file_path)
-
-			if (result is False):
-				print('Warning, could not save: ', in_file_path)
-			else:
-				# the original may now be deleted
-				marked_for_deletion = True
-
-		if (self.do_delete and marked_for_deletion):
-			# consider removing the original file
-			try:
-				#print('Deleting:', in_file_path)
-				os.remove(in_file_path)
-				pass
-			except OSError as ose:
-				print(ose)
-
-
-class Image ():
-	def __init__ (self, file=None, shown=[], rate=0, use_convert=True):
-		self.file        = file
-		self.image       = {'full': None}  # only load when necessary
-		self.size        = (0,0)           # in pixels x,y
-		self.is_loaded   = False
-		self.last_use    = 0
-		self.use_convert = use_convert     # set to False if class is used without a display available
-
-		self.hidden    = 0      # timestamp until when image is hidden
-		self.rate      = rate   # default is 0, range is [-1, 1]
-		self.shown     = list(shown)  # list, each item denotes for how long image has been shown
-
-	def get (self, size, fill_box=False, fit_to_square=False, circular=False, smooth=True, remove_black=False, check_orientation=False):
-		self.last_use = time.time()
-		size        = (round(size[0]), round(size[1]))
-		size_string = 'full'
-		do_convert  = False
-
-		# if orientation needs checking, do it here before regular loading
-		# as any changes are done to base file
-		if (check_orientation):
-			if (self.is_loaded):
-				self.unload()
-			self.correct_orientation()
-
-		# load if necessary
-		if (not self.is_loaded):
-			self.load()
-
-		# check the required size and make it available
-		# a request size >= image size is normally ignored, unless it has to be made circular
-		if (size[0] < self.size[0] or size[1] < self.size[1] or circular):
-			# create unique identifier string for this size
-			size_string = '{0}x{1}'.format(size[0], size[1])
-			if (circular):
-				size_string = size_string.replace('x','c')
-			elif (fit_to_square):
-				size_string = size_string.replace('x','s')
-			elif (fill_box):
-				size_string = size_string.replace('x','f')
-
-			# check if this resizing is cached already
-			# if so, ready to return that
-			if (not size_string in self.image):
-				# scale and keep for future use
-				img = None
-				if (circular):
-					img = self.scale(size, fill_box=True, fit_to_square=True, smooth=smooth)
-					img = self.make_circular(img)
-				else:
-					img = self.scale(size, fill_box, fit_to_square, smooth)
-				self.image[size_string] = img
-				do_convert = True
-				# ready to return now
+	""" Returns the total number of images, and a list with details on count images from offset onwards
+		Note: this gets called from the upload server's threads. """
+	def get_catalog (self, offset=0, count=48):
+		images  = self.images  # keep hold of the current list, as it may get replaced meanwhile
+		now     = time.time()
+		catalog = []
 
-		# if pure blacks need to be removed, do it here after rescaling (smaller file = quicker)
-		if (remove_black):
-			self.image[size_string] = self.remove_pure_black(self.image[size_string])
-			do_convert = True
-
-		# convert to display pixel layout for improved performance
-		if (do_convert and self.use_convert):
-			self.image[size_string] = self.image[size_string].convert()
-
-		return self.image[size_string], size_string
-
-	def load (self):
-		# load image (also call convert for a speed-up)
-		self.image['full'] = pygame.image.load(self.file)
-		if (self.use_convert):
-			self.image['full'] = self.image['full'].convert()
-		self.size          = self.image['full'].get_size()
-		self.is_loaded = True
-
-	""" Free up memory by unloading an image no longer needed """
-	def unload (self, since=None):
-		self.is_loaded = False
-
-		# also record time this image was shown
-		if (since is not None):
-			self.was_shown(time.time() - since)  # now - timestamp of its first showing
-
-		# set image to None if a default size
-		# or delete if non-default
-		sizes_to_delete = []
-		for s in self.image:
-			if (s == 'full'):
-				self.image[s] = None
-			else:
-				sizes_to_delete.append(s)
-		# finally, delete sizes (separate loop avoids dict size changes during iteration)
-		for sd in sizes_to_delete:
-			del self.image[sd]
-
-	""" Checks if image has been requested since threshold_time, False if not """
-	def check_use_since (self, threshold_time):
-		if (self.last_use < threshold_time):
-			return True
-		return False
-
-	""" Save a version of this image to path. Size_string is assumed to exist, returns False otherwise. """
-	def save_to_file (self, size_string, output_path):
-		if (size_string in self.image):
+		for image in images[offset:offset + count]:
 			try:
-				pygame.image.save(self.image[size_string], output_path)
-				return True
-			except Exception as e:
-				print(e)
-		# return here if saving fails
-		return False
-
-	""" Scales 'img' to fit into box bx/by.
-		This method will retain the original image's aspect ratio
-	    Based on: http://www.pygame.org/pcr/transform_scale/ """
-	def scale (self, box_size, fill_box=False, fit_to_square=False, smooth=True):
-		ix,iy = self.image['full'].get_size()
-		bx,by = box_size
-		fill_box = fill_box
-		# square images always fill out the box, so make sure it's square in shape
-		if (fit_to_square):
-			fill_box = True
-			bx = min(bx,by)
-			by = min(bx,by)
-
-		# determine scale factor
-		if ix > iy:
-			# fit to width
-			scale_factor = bx/float(ix)
-			sy = scale_factor * iy
-			if sy > by:
-				scale_factor = by/float(iy)
-				sx = scale_factor * ix
-				sy = by
-			else:
-				sx = bx
-		else:
-			# fit to height
-			scale_factor = by/float(iy)
-			sx = scale_factor * ix
-			if sx > bx:
-				scale_factor = bx/float(ix)
-				sx = bx
-				sy = scale_factor * iy
-			else:
-				sy = by
-
-		if (fill_box):
-			if (bx == sx and by == sy):
-				pass  # s'all good man!
-			elif (bx/sx > by/sy):
-				sy = (bx / sx) * sy
-				sx = bx
-			else:
-				sx = (by / sy) * sx
-				sy = by
-
-		scaled_img = None
-
-		if (smooth is True):
-			scaled_img = pygame.transform.smoothscale(self.image['full'], (int(sx), int(sy)))
-		else:
-			scaled_img = pygame.transform.scale(self.image['full'], (int(sx), int(sy)))
-		
-		# a to-be-squared image will get the excess part taken off
-		if (fit_to_square and sx != sy):
-			s_left, s_top, s_width, s_height = 0, 0, sx, sy
-			if (sx > sy):
-				s_width = sy
-				s_left  = (sx - sy) / 2  # making sure we get the middle
-			else:
-				s_height = sx
-				s_top    = (sy - sx) / 2
-			scaled_img = scaled_img.subsurface( Rect(s_left, s_top, s_width, s_height) )
-
-		return scaled_img
-
-	""" Returns a surface that is 'circular' (has a black background with image as circle in it) """
-	def make_circular (self, img):
-		size = img.get_size()
-
-		# make a surface that is equal in size
-		surface = pygame.Surface(size)
-		# fill it black
-		surface.fill([0,0,0])
-		# draw white circle on top and set white color to transparent
-		pygame.draw.circle(surface, [255,255,255], (int(size[0]/2), int(size[1]/2)), int(min(size)/2), 0)
-		surface.set_colorkey([255,255,255])
-
-		# draw the black 'vignette' on top of the image, white parts won't overwrite original
-		surface_rect = surface.get_rect()
-		surface_rect.topleft = (0,0)
-		img.blit(surface, surface_rect)
-		# set pure black as the transparent color
-		img.set_colorkey([0,0,0])
-
-		return img
-
-	""" Prepare image to avoid pure black parts being set to transparent elsewhere.
-		This should only be done when files are first imported to reduce computation later on. """
-	def remove_pure_black (self, img):
-		size = img.get_size()
-		grey_surface = pygame.Surface(size)
-		# get a surface and fill it almost pure black (1/255)
-		grey_surface.fill([1,1,1])
-		# draw image on top with pure black set to transparent
-		img.set_colorkey([0,0,0])
-		img_rect = img.get_rect()
-		img_rect.topleft = (0,0)
-		grey_surface.blit(img, img_rect)
-		img = grey_surface
-		# all pure black pixels have now been replaced with almost black
-		return img
-
-	""" Opens a file, checks it orientation and rotates appropriately, saves, and closes.
-		This should only be done when files are first imported, as it's unnecessary later. """
-	def correct_orientation (self):
-		try:
-			image = PIL_Image.open(self.file)
-			for orientation in ExifTags.TAGS.keys():
-				if ExifTags.TAGS[orientation]=='Orientation':
-					break
-			exif = dict(image._getexif().items())
-
-			if exif[orientation] == 3:
-				image = image.rotate(180, expand=True)
-			elif exif[orientation] == 6:
-				image = image.rotate(270, expand=True)
-			elif exif[orientation] == 8:
-				image = image.rotate(90, expand=True)
-			image.save(self.file)
-			image.close()
-		except (AttributeError, KeyError, IndexError):
-			# cases: image don't have getexif
-			pass
-
-	""" Up or downvotes an image """
-	def do_rate (self, positive=True, delta=0.2):
-		if (positive):
-			self.rate += delta
-		else:
-			self.rate -= delta
-		# limit to [-1,1] range
-		self.rate = max(min(self.rate, 1), -1)
-
-		return self.rate
-
-	def set_rate (self, rate=0):
-		self.rate = rate
+				modified = int(os.path.getmtime(image.file))
+			except OSError:
+				modified = 0
+			catalog.append({
+				'id':           os.path.basename(image.file),
+				'rate':         round(image.rate, 2),
+				'hidden_until': int(image.hidden) if image.hidden > now else None,
+				'shown':        len(image.shown),
+				'shown_time':   sum(image.shown),
+				'modified':     modified
+			})
 
-	""" sets image to be hidden until indicated timestamp (default is very far into future) """
-	def hide (self, until=9999999999):
-		self.hidden = int(until)  # ensure this is just an integer, not a float, for simplicity
-		# if permanently hiding this image, also set its rating to the lowest possible
-		if (until == 9999999999):
-			self.do_rate(False, 2)
+		return (len(images), catalog)
 
-	""" Adds viewings of this image to a list """
-	def was_shown (self, time=0):
-		if (time > 0):
-			self.shown.append(int(time))  # no need for more precision than int
+	""" Returns the number of uploads announced to the importer but not yet imported """
+	def get_import_pending (self):
+		if (not self.use_importer):
+			return 0
+		return self.import_pending.value
 
-	def set_shown (self, shown=[]):
-		self.shown = list(shown)  # avoids referencing to inbound list object
+	def get_import_total (self):
+		return self.import_total
 
-	""" Gives a default str(this instance) output """
-	def __str__ (self):
-		return '{0}; rate: {1:.2f}; hidden: {2}; shown: {3}'.format(self.file, self.rate, self.hidden, self.shown)
+	""" Returns bytes held by image surfaces, and the number of cache hits and misses for rescaled sizes """
+	def get_cache_stats (self):
+		cache_bytes  = 0
+		cache_hits   = 0
+		cache_misses = 0
+		for image in self.images:
+			cache_bytes  += image.get_cache_bytes()
+			cache_hits   += image.cache_hits
+			cache_misses += image.cache_misses
+		return (cache_bytes, cache_hits, cache_misses)
 
-	""" when pickling, this method provides an alternative to the regular __dict__ function """
-	def __getstate__ (self):
-		state = self.__dict__.copy()
-		# get rid of any unpicklable elements (e.g., image objects, pygame surfaces, file handlers)
-		state['image']     = {'full': None}
-		state['is_loaded'] = False  # triggers a reload after unpickling
-		return state
+	""" Returns the median time (in seconds) from upload completion until displayable, or None """
+	def get_import_latency (self):
+		if (len(self.import_latencies) == 0):
+			return None
+		return sorted(self.import_latencies)[len(self.import_latencies) // 2]
 
 
 class Vector4 ():
@@ -1710,6 +1970,8 @@ class GUI ():
 		self.dirty_areas  = []    # partial display updates can indicate pygame rectangles to redraw
 		self.display_size = (800,480)
 		self.screenshot_counter = 0
+		self.last_screen_path     = 'last_screen.bmp'  # shown at the next start, until the first frame is ready
+		self.last_screen_interval = 3600               # in seconds, also saved this often (in case of a power cut)
 
 		self.colors = {
 			'foreground'  : pygame.Color(255, 255, 255),  # white
@@ -1731,25 +1993,37 @@ class GUI ():
 			self.gui_font       = pygame.font.Font('/usr/share/fonts/truetype/freefont/FreeSansBold.ttf', 16)
 			self.gui_font_large = pygame.font.Font('/usr/share/fonts/truetype/freefont/FreeSansBold.ttf', 30)
 			self.screen = pygame.display.set_mode((0,0), pygame.FULLSCREEN)
+
+		self.core.scheduler.every(self.last_screen_interval, self.save_last_screen, 'gui.save_last_screen', jitter=60)
 		
 	def update (self):
 		# core will already request active program to update, which may set dirty flag
 		# once updated, check if redraw of GUI is necessary
 		if (self.dirty):
-			if (self.dirty_full):
-				self.screen.fill(self.colors['background'])
-			# let active program draw itself
-			self.core.get_active().draw()
+			program = self.core.get_active()
 
-			# also call default draw function
-			self.draw()
+			if (not self.dirty_full and program.is_status_panel_covering()):
+				# only the status panel is visible, so only its changed widgets are redrawn
+				program.draw_status_panel(full=False)
+				self.draw()
 
-			# update display: partial redraw only if rectangles indicated
-			if (self.dirty_full or len(self.dirty_areas) == 0):
-				pygame.display.update()
+				if (len(self.dirty_areas) > 0):
+					pygame.display.update(self.dirty_areas)
 			else:
-				pygame.display.update(self.dirty_areas)
-			
+				if (self.dirty_full):
+					self.screen.fill(self.colors['background'])
+				# let active program draw itself
+				program.draw()
+
+				# also call default draw function
+				self.draw()
+
+				# update display: partial redraw only if rectangles indicated
+				if (self.dirty_full or len(self.dirty_areas) == 0):
+					pygame.display.update()
+				else:
+					pygame.display.update(self.dirty_areas)
+
 		# reset for next round
 		self.dirty       = False
 		self.dirty_full  = False
@@ -1862,7 +2136,7 @@ class GUI ():
 			ypos = y
 
 		# draw background rectangle (whole width)
-		self.draw_rectangle(o=o, x=xpos, y=ypos, w=w, h=h, c=bg, a=a, r=False)
+		slider_rect = self.draw_rectangle(o=o, x=xpos, y=ypos, w=w, h=h, c=bg, a=a, r=False)[1]
 		
 		# draw foreground rectangle (partial width)
 		self.draw_rectangle(o=o, x=xpos, y=ypos, w=r*w, h=h, c=fg, a=a, r=False)
@@ -1878,6 +2152,9 @@ class GUI ():
 		# set flags
 		self.dirty = True
 
+		# return the affected area (handles remain within the background rectangle)
+		return slider_rect
+
 	""" Helper function to draw text on screen """
 	def draw_text (self, text="", o='center', x=-1, y=-1, has_back=True, padding=2, fg='foreground', bg='background', s='small', onto=None):
 		xpos = self.display_size[0]/2
@@ -1914,7 +2191,7 @@ class GUI ():
 			elif (o == 'right'):
 				pos_x = xpos + padding
 				pos_y = ypos - padding
-			self.draw_rectangle(o=o, x=pos_x, y=pos_y, w=size_x, h=size_y, c=bg, r=False)
+			back_rect = self.draw_rectangle(o=o, x=pos_x, y=pos_y, w=size_x, h=size_y, c=bg, r=False)[1]
 
 		if (onto != None):
 			# draw onto the provided surface
@@ -1927,6 +2204,11 @@ class GUI ():
 			self.dirty = True
 			self.dirty_areas.append(text_rect)
 
+		# return the affected area (including background) for future reference if need be
+		if (has_back):
+			return text_rect.union(back_rect)
+		return text_rect
+
 	def draw_image (self, img=None, o='center', pos=(0.5,0.5), size=(1,1), mask=None, a=1, rs=True, fill=False, sq=False, ci=False, smooth=True):
 		# decide on place and size
 		img_size = size
@@ -2015,8 +2297,22 @@ class GUI ():
 			self.dirty = True
 			self.dirty_areas.append(affected_rect)
 
+			return affected_rect
+
+	""" Redraws an area of a surface previously drawn at offset (x,y), erasing anything drawn on top since """
+	def restore_area (self, surf=None, rect=None, offset=(0,0)):
+		area          = rect.move(-offset[0], -offset[1])
+		affected_rect = self.screen.blit(surf, rect.topleft, area=area)
+
+		# set flags (include the full rect, as the blit may have been clipped)
+		self.dirty = True
+		self.dirty_areas.append(rect.union(affected_rect))
+
 	""" Returns pygame image of QR code """
 	def get_qrcode_image (self, string="no-data"):
+		# only loaded when first needed, as it takes a while to import
+		import qrcode
+
 		qr = qrcode.QRCode(
 			version=None,
 			error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -2032,6 +2328,23 @@ class GUI ():
 		# convert to pygame Surface and return
 		return pygame.image.fromstring(qr_image.tobytes(), qr_image.size, qr_image.mode).convert()
 
+	""" Shows the screen saved at the end of a previous run, returns True if successful """
+	def show_last_screen (self):
+		try:
+			self.screen.blit(pygame.image.load(self.last_screen_path), (0,0))
+		except (IOError, pygame.error):
+			return False
+		pygame.display.update()
+		return True
+
+	""" Saves the current screen, to show first at the next start """
+	def save_last_screen (self):
+		try:
+			# bitmaps are larger, but load the quickest
+			pygame.image.save(self.screen, self.last_screen_path)
+		except pygame.error:
+			pass
+
 	def save_screen (self):
 		while (os.path.exists(str(self.screenshot_counter) + '.png')):
 			self.screenshot_counter += 1
@@ -2039,6 +2352,76 @@ class GUI ():
 		pygame.image.save(self.screen, str(self.screenshot_counter) + '.png')
 
 
+"""
+Status panel widgets are retained: each keeps the value it last drew and only
+redraws its own area of the screen once it receives a different value.
+"""
+class StatusWidget ():
+	def __init__ (self, gui=None, x=0, y=0):
+		self.gui   = gui
+		self.x     = x
+		self.y     = y
+		self.value = None
+		self.rect  = None  # area of the screen covered by the last draw
+		self.dirty = True
+
+	""" Returns True if the widget needs redrawing """
+	def set_value (self, value):
+		if (value != self.value):
+			self.value = value
+			self.dirty = True
+		return self.dirty
+
+	""" Draws at vertical offset (in pixels) if changed, or always when forced.
+		The background surface is used to erase the previously drawn area first. """
+	def draw (self, offset=0, background=None, force=False):
+		if (self.value is not None and (self.dirty or force)):
+			if (not force and background is not None and self.rect is not None):
+				self.gui.restore_area(background, self.rect, (0, offset))
+			self.rect  = self.render(offset)
+			self.dirty = False
+
+	""" Subclasses do the actual drawing here, returning the affected rectangle """
+	def render (self, offset=0):
+		return None
+
+
+class StatusText (StatusWidget):
+	def __init__ (self, gui=None, x=0, y=0, fmt='{0}', has_back=True):
+		super().__init__(gui, x, y)
+		self.fmt      = fmt
+		self.has_back = has_back
+
+	def render (self, offset=0):
+		return self.gui.draw_text(self.fmt.format(self.value), o='left', x=self.x, y=self.y + offset, has_back=self.has_back)
+
+
+""" A slider with a text label, together covering one area so both redraw as one """
+class StatusSlider (StatusWidget):
+	def __init__ (self, gui=None, x=0, y=0, w=110, h=5, scale=100.0, bg='subtle', is_ui=False, text_y=0, fmt='{0}%', text_back=True):
+		super().__init__(gui, x, y)
+		self.w         = w
+		self.h         = h
+		self.scale     = scale
+		self.bg        = bg
+		self.is_ui     = is_ui
+		self.text_y    = text_y
+		self.fmt       = fmt
+		self.text_back = text_back
+
+	def render (self, offset=0):
+		ratio       = min(max(self.value / self.scale, 0), 1)
+		slider_rect = self.gui.draw_slider(o='left', x=self.x, y=self.y + offset, w=self.w, h=self.h, r=ratio, bg=self.bg, is_ui=self.is_ui)
+		text_rect   = self.gui.draw_text(self.fmt.format(self.value), o='left', x=self.x, y=self.text_y + offset, has_back=self.text_back)
+		return slider_rect.union(text_rect)
+
+
+""" Shows a surface at a relative position; a new surface object counts as a new value """
+class StatusImage (StatusWidget):
+	def render (self, offset=0):
+		return self.gui.draw_simple_image(self.value, pos=(self.x, self.y + offset / self.gui.display_size[1]))
+
+
 class ProgramBase ():
 	def __init__ (self, core=None):
 		# general variables
@@ -2057,14 +2440,27 @@ class ProgramBase ():
 		self.shown               = []     # list, each item denotes for how long program has been active
 		self.images              = []     # empty list available by default
 
+		# things prepared before becoming active (see prepare)
+		self.assets_loaded       = False
+		self.prepare_sizes       = []     # (relative) size of each first image to prepare, or None to only load it
+		self.prepared_images     = []     # first images to show, in order
+		self.prepared_count      = 0      # number of those ready to be drawn
+
+		# state continued from the previous run (see set_state)
+		self.restore_state       = None
+		self.state_keys          = []     # names of variables that are saved along with the image slots
+
 		# status panel variables
+		self.status_panel             = None
 		self.current_address          = ''
 		self.current_address_text     = ''
-		self.address_qr_image         = self.gui.get_qrcode_image('https://project.sinds1984.nl')
+		self.address_qr_image         = None  # made once the status panel is used
 		self.status_panel_pos         = -32
 		self.status_panel_neutral_pos = -32
 		self.status_panel_active      = False
 		self.status_open              = False
+		self.status_widgets           = {}
+		self.status_last_refresh      = 0
 		self.po                       = 0
 		self.por                      = 0
 
@@ -2122,6 +2518,7 @@ class ProgramBase ():
 			interactive = True
 
 		# check if the bottom bar is used to drag
+		settled_now = False
 		if (self.core.input.state >= self.core.input.DRAGGING):
 			relative_y = abs(self.core.input.drag[0].y - (self.status_panel_neutral_pos + 16))
 			if (relative_y < 22):  # 16px (half height of bar) + 6px margin
@@ -2154,6 +2551,7 @@ class ProgramBase ():
 			if (abs(self.status_panel_pos - self.status_panel_neutral_pos) < 0.1):
 				self.status_panel_pos = self.status_panel_neutral_pos
 				self.status_panel_active = False
+				settled_now = True
 
 		# if the status panel is open, update its UI code
 		if (self.status_open):
@@ -2170,6 +2568,7 @@ class ProgramBase ():
 					# 459 is left edge, 331 is 341 range - 10 edge margin (so it's easier to get 100%)
 					value = round(100 * max(min((self.core.input.pos.x - 459) / 331, 1), 0))
 					self.core.set_display_brightness(value, True)
+					self.status_widgets['brightness'].set_value(value)
 
 			# also check for button (128x128px) presses
 			if (self.core.input.state == self.core.input.RELEASED_TAP):
@@ -2211,13 +2610,42 @@ class ProgramBase ():
 					self.current_address_text = 'IP: ' + new_address
 				self.address_qr_image = self.gui.get_qrcode_image('https://' + self.current_address)
 
+			# refresh the values shown (widgets will only flag themselves if a value changed)
+			if (now > self.status_last_refresh + 0.25):
+				self.refresh_status_widgets()
+
 		# update on change or every 1/4 second
-		if (self.status_panel_active):
+		if (self.status_panel_active or settled_now):
 			return 2  # full update required
+		elif (self.is_status_panel_covering()):
+			# nothing but the panel is visible, so only redraw if any of its values changed
+			for widget in self.status_widgets.values():
+				if (widget.dirty):
+					return 1
+			return 0
 		elif (self.dirty or now > self.last_update + 0.25):
 			return 1  # regular update required
 		return 0      # no update required
 
+	""" reads the values shown on the status panel (all are cached, so cheap to get) """
+	def refresh_status_widgets (self):
+		w = self.status_widgets
+
+		w['images'].set_value(self.core.get_images_count())
+		w['disk'].set_value(self.core.get_disk_space())
+		w['time'].set_value(self.core.get_time())
+		w['distance'].set_value(round(self.core.get_sensor_distance(), 2))
+		w['memory'].set_value(self.core.get_memory_usage())
+		w['temperature'].set_value(self.core.get_temperature())
+		w['brightness'].set_value(self.core.get_display_brightness())
+		w['network'].set_value(self.current_address_text)
+		w['address'].set_value(self.address_qr_image)
+		self.status_last_refresh = time.time()
+
+	""" returns True if the status panel is fully open and settled, hiding all else """
+	def is_status_panel_covering (self):
+		return (self.status_open and not self.status_panel_active)
+
 	""" code to run when program becomes active """
 	def make_active (self):
 		self.is_active    = True
@@ -2226,8 +2654,35 @@ class ProgramBase ():
 		self.first_run    = True
 		self.gui.set_dirty_full()
 
-		# --- status panel surface initialisation
-		
+		# anything not prepared ahead of time gets done now
+		if (self.status_panel is None):
+			self.make_status_panel()
+		if (not self.assets_loaded):
+			self.load_assets()
+			self.assets_loaded = True
+
+		# continue where the previous run left off, if asked to
+		if (self.restore_state is not None):
+			self.apply_state(self.restore_state)
+			self.restore_state = None
+
+		# --- status panel widgets (values are drawn on top of the panel surface)
+
+		self.status_widgets = {
+			'images'     : StatusText(self.gui, x=86, y=44),
+			'disk'       : StatusSlider(self.gui, x=86, y=128, text_y=106),
+			'time'       : StatusText(self.gui, x=86, y=169),
+			'distance'   : StatusSlider(self.gui, x=283, y=66, scale=6.5, text_y=44, fmt='{0:.2f} m'),
+			'memory'     : StatusSlider(self.gui, x=283, y=128, text_y=106),
+			'temperature': StatusText(self.gui, x=283, y=169, fmt='{0}ºC'),
+			'brightness' : StatusSlider(self.gui, x=459, y=42, w=341, h=24, bg='background', is_ui=True, text_y=44, text_back=False),
+			'network'    : StatusText(self.gui, x=459, y=169),
+			'address'    : StatusImage(self.gui, x=0.791, y=0.313)
+		}
+		self.refresh_status_widgets()
+
+	""" draws the status panel surface, with all its fixed elements """
+	def make_status_panel (self):
 		self.status_panel = pygame.Surface((800, 480))
 		self.status_panel.fill(self.gui.colors['background'])
 		# because panel surface also includes the fullscreen black background, draw the bottom bar on top
@@ -2286,6 +2741,147 @@ class ProgramBase ():
 		# prepare for blitting
 		self.status_panel.convert()
 
+	""" loads any surfaces (icons and such) this program needs while active """
+	def load_assets (self):
+		pass
+
+	""" frees the surfaces loaded by load_assets """
+	def unload_assets (self):
+		pass
+
+	""" does a step towards becoming active, returns True once all is ready
+		Called once per frame while this program is up next, so the switch itself takes a single frame.
+		Images are decoded in the background, other steps are kept short to not hold up a frame. """
+	def prepare (self):
+		if (self.status_panel is None):
+			self.make_status_panel()
+		elif (not self.assets_loaded):
+			self.load_assets()
+			self.assets_loaded = True
+		elif (len(self.prepared_images) < len(self.prepare_sizes)):
+			# pick the first images to show, and get them decoded
+			for size in self.prepare_sizes:
+				image = self.core.images.get_next(current_images=self.get_prepared_image_paths(), rated=True)
+				self.prepared_images.append(image)
+				self.core.images.preload(image)
+		elif (self.prepared_count < len(self.prepared_images)):
+			image = self.prepared_images[self.prepared_count]
+			if (image.is_preloading):
+				return False  # not decoded yet, check again next frame
+
+			# converting and scaling is done here, as surfaces are tied to the display
+			size = self.prepare_sizes[self.prepared_count]
+			if (size is None):
+				if (not image.is_loaded):
+					image.load()
+			else:
+				image.get((size[0] * self.dsize[0], size[1] * self.dsize[1]))
+			self.prepared_count += 1
+		else:
+			return True
+		return False
+
+	""" frees anything prepared ahead of becoming active, in case it is not needed after all """
+	def release_prepared (self):
+		for image in self.prepared_images:
+			image.unload()
+		self.prepared_images = []
+		self.prepared_count  = 0
+
+		if (not self.is_active):
+			self.status_panel = None
+			if (self.assets_loaded):
+				self.unload_assets()
+				self.assets_loaded = False
+
+	""" returns the next image prepared ahead of becoming active, or a new pick if none are left """
+	def get_prepared_image (self):
+		if (len(self.prepared_images) > 0):
+			self.prepared_count = max(self.prepared_count - 1, 0)
+			return self.prepared_images.pop(0)
+		return self.core.images.get_next(current_images=self.get_current_image_paths(), rated=True)
+
+	def get_prepared_image_paths (self):
+		return [image.file for image in self.prepared_images]
+
+	""" returns the state of the image slots (and variables named by state_keys), to continue from on a restart
+		Images are kept as file paths, vectors as tuples, and times as seconds ago (as the clock moves on meanwhile). """
+	def get_state (self):
+		now   = time.time()
+		slots = []
+		for i in self.images:
+			slot = {}
+			for key, value in i.items():
+				if (isinstance(value, Image)):
+					value = ('image', value.file)
+				elif (isinstance(value, Vector4)):
+					value = ('vector', (value.x, value.y, value.z, value.w))
+				elif (key == 'since'):
+					value = now - value
+				slot[key] = value
+			slots.append(slot)
+
+		values = {}
+		for key in self.state_keys:
+			values[key] = getattr(self, key)
+		return {'slots': slots, 'values': values}
+
+	""" returns the file paths of images in state """
+	def get_state_paths (self, state):
+		paths = []
+		for slot in state['slots']:
+			for value in slot.values():
+				if (isinstance(value, tuple) and value[0] == 'image' and value[1] is not None):
+					paths.append(value[1])
+		return paths
+
+	""" takes a state saved by get_state to continue from once active, returns False if it can't be used
+		The images on display get prepared meanwhile, like the ones picked otherwise (see prepare). """
+	def set_state (self, state):
+		images = []
+		for slot in state['slots']:
+			value = slot.get('image')
+			image = None
+			if (isinstance(value, tuple)):
+				image = self.core.images.get_image(value[1])
+			if (image is None):
+				return False
+			images.append(image)
+
+		self.release_prepared()
+		self.prepared_images = images[:len(self.prepare_sizes)]
+		for image in self.prepared_images:
+			self.core.images.preload(image)
+		self.restore_state = state
+		return True
+
+	""" fills the image slots (and other variables) from a state saved by get_state """
+	def apply_state (self, state):
+		now = time.time()
+		self.images = []
+		for saved in state['slots']:
+			slot = {}
+			for key, value in saved.items():
+				if (isinstance(value, tuple) and value[0] == 'image'):
+					value = self.core.images.get_image(value[1])
+					if (value is None):
+						# an upcoming image may no longer be around, so pick another
+						value = self.core.images.get_next(current_images=self.get_current_image_paths(), rated=True)
+				elif (isinstance(value, tuple) and value[0] == 'vector'):
+					value = Vector4(*value[1])
+				elif (key == 'since'):
+					value = now - value
+				slot[key] = value
+			self.images.append(slot)
+
+		for key, value in state['values'].items():
+			setattr(self, key, value)
+
+		# the prepared images are in the slots now, and the slots need no filling on a first run
+		self.prepared_images = []
+		self.prepared_count  = 0
+		self.first_run       = False
+
 	""" code to run when this program ceases to be active """
 	def make_inactive (self):
 		self.is_active = False
@@ -2297,12 +2893,13 @@ class ProgramBase ():
 
 		# reset status panel state and clear related surfaces
 		self.set_status_panel_state(False, force=True)
-		self.status_panel = None
+		self.status_widgets = {}
 
 		self.dirty          = False
 		self.first_run      = True
 		self.run_count     += 1
 		self.images         = []  # reset to empty
+		self.release_prepared()
 		self.gui.set_dirty_full()
 
 	def close (self):
@@ -2311,40 +2908,18 @@ class ProgramBase ():
 
 	""" by default, no draw calls are made except for the status panel """
 	def draw (self):
+		self.draw_status_panel()
+
+	""" draws the status panel; unless a full redraw is requested, only widgets with changed values are drawn """
+	def draw_status_panel (self, full=True):
 		# status panel bottom bar
-		if (self.status_panel_pos > -32):
+		if (full and self.status_panel_pos > -32):
 			self.gui.draw_surface(self.status_panel, o='left', x=0, y=self.status_panel_pos - 448, r=False)
 
 		if (self.status_open):
-			# number of photos in system
-			self.gui.draw_text(str(self.core.get_images_count()),       o='left', x=86, y=44 + self.po)
-
-			# storage (% available/used)
-			self.gui.draw_slider(o='left', x=86, y=128 + self.po, w=110, h=5, r=(self.core.get_disk_space() / 100.0), bg='subtle')
-			self.gui.draw_text(str(self.core.get_disk_space()) + "%",   o='left', x=86, y=106 + self.po)
-
-			# time
-			self.gui.draw_text(str(self.core.get_time()),               o='left', x=86, y=169 + self.po)
-
-			# distance (+plus sensor state)
-			self.gui.draw_slider(o='left', x=283, y=66 + self.po, w=110, h=5, r=(self.core.get_sensor_distance() / 6.5), bg='subtle')
-			self.gui.draw_text("{0:.2f} m".format(self.core.get_sensor_distance()), o='left', x=283, y=44 + self.po)
+			for widget in self.status_widgets.values():
+				widget.draw(self.po, self.status_panel, force=full)
 
-			# memory usage
-			self.gui.draw_slider(o='left', x=283, y=128 + self.po, w=110, h=5, r=(self.core.get_memory_usage() / 100.0), bg='subtle')
-			self.gui.draw_text(str(self.core.get_memory_usage()) + "%", o='left', x=283, y=106 + self.po)
-
-			# temperature
-			self.gui.draw_text(str(self.core.get_temperature()) + "ºC", o='left', x=283, y=169 + self.po)
-			
-			# display brightness
-			self.gui.draw_slider(o='left', x=459, y=42 + self.po, w=341, h=24, r=(self.core.get_display_brightness() / 100.0), is_ui=True)
-			self.gui.draw_text(str(self.core.get_display_brightness()) + "%", o='left', x=459, y=44 + self.po, has_back=False)
-
-			# network (connected, IP)
-			self.gui.draw_text(self.current_address_text,      o='left', x=459, y=169 + self.po)
-			self.gui.draw_simple_image(self.address_qr_image, pos=(0.791, 0.313 + self.por))
-			
 	def get_max_time (self):
 		return self.max_time
 
@@ -2397,8 +2972,8 @@ class BlankScreen (ProgramBase):
 		self.max_time = 7200  # in seconds, 2h
 		super().make_active()
 
-		# open with status panel visible on first run
-		if (self.run_count <= 1):
+		# open with status panel visible on first run (unless another program is about to continue)
+		if (self.run_count <= 1 and self.core.restoring is None):
 			self.set_status_panel_state(True, True)
 
 
@@ -2408,6 +2983,7 @@ class DualDisplay (ProgramBase):
 		
 		self.default_time    = 30  # seconds before switching to next photo
 		self.switch_time     = 4   # seconds taken to switch between photos
+		self.prefetch_time   = 3   # seconds before switching that the next photo gets loaded
 		self.max_time        = 3.0 * 3600  # n hours
 		if (self.core.is_debug):
 			self.max_time = 600
@@ -2426,6 +3002,7 @@ class DualDisplay (ProgramBase):
 		self.picker_alpha       = 1
 		self.preferred_image    = None
 		self.last_swap          = 0
+		self.prepare_sizes      = [(1,1), (1,1)]
 
 	def update (self):
 		if (self.first_run or self.status_open is False):
@@ -2531,12 +3108,18 @@ class DualDisplay (ProgramBase):
 			for index, i in enumerate(self.images):
 				if (self.first_run):
 					# make sure there is an image
-					i['image']     = self.core.images.get_next(current_images=self.get_current_image_paths(), rated=True)
+					i['image']     = self.get_prepared_image()
 					i['image_new'] = self.core.images.get_next(current_images=self.get_current_image_paths(), rated=True)
 					i['since']     = now
 					if (index == 1):
 						i['max_time'] *= 1.5
 
+				# load the next image ahead of its fade-in, to avoid a hiccup once it starts
+				# (not needed while nobody is near, as it will be loaded on demand anyway)
+				if (i['image_new'] is not None and not i['image_new'].is_loaded and self.core.is_someone_near()
+					and i['since'] < now - i['max_time'] + self.switch_time + self.prefetch_time):
+					i['image_new'].get(self.gui.display_size)
+
 				# if an image has been on long enough, swap over
 				# but don't do so if user is interacting with the device
 				if (i['swap'] is False and interactive):
@@ -2581,13 +3164,21 @@ class DualDisplay (ProgramBase):
 		else:
 			super().update(ignore=True)
 
-	def make_active (self):
+	def load_assets (self):
 		# get the picker surfaces in advance for later reference
 		self.picker_plus_surf_n = self.gui.open_simple_image('assets/icon_arrow_up_w.png',   remove_black=True)
 		self.picker_plus_surf_a = self.gui.open_simple_image('assets/icon_arrow_up_r.png',   remove_black=True)
 		self.picker_min_surf_n  = self.gui.open_simple_image('assets/icon_arrow_down_w.png', remove_black=True)
 		self.picker_min_surf_a  = self.gui.open_simple_image('assets/icon_arrow_down_r.png', remove_black=True)
 
+	def unload_assets (self):
+		# reset variables to None to free memory
+		self.picker_plus_surf_n = None
+		self.picker_plus_surf_a = None
+		self.picker_min_surf_n  = None
+		self.picker_min_surf_a  = None
+
+	def make_active (self):
 		for x in range(0,2):
 			self.images.append({
 				'image'    : None,
@@ -2601,12 +3192,6 @@ class DualDisplay (ProgramBase):
 		super().make_active()
 
 	def make_inactive (self):
-		# reset variables to None to free memory
-		self.picker_plus_surf_n = None
-		self.picker_plus_surf_a = None
-		self.picker_min_surf_n  = None
-		self.picker_min_surf_a  = None
-
 		for i in self.images:
 			if (i['image'] is not None):
 				i['image'].unload( i['since'] )
@@ -2696,6 +3281,8 @@ class PhotoSoup (ProgramBase):
 		self.corner_bottom_right  = Vector4(800, 480)
 		self.button_add_photo     = None
 		self.button_trash         = None
+		self.prepare_sizes        = [None] * self.default_num_images  # sizes vary, so only decode these
+		self.state_keys           = ['goal_num_images', 'base_size']
 
 	def update (self):
 		if (self.first_run or self.status_open is False):
@@ -2850,7 +3437,7 @@ class PhotoSoup (ProgramBase):
 
 						else:
 							# renew this image slot
-							i['image'] = self.core.images.get_next(current_images=self.get_current_image_paths(), rated=True)
+							i['image'] = self.get_prepared_image()
 							i['since'] = now
 							# set x, y, direction, speed
 							i['v'].set(
@@ -2869,6 +3456,10 @@ class PhotoSoup (ProgramBase):
 					# adjust the size
 					i['size'] = 1 + (i['image'].rate / 3.0)  # potential range is thus [0.66, 1.33]
 
+					# without anyone around, images stay put (user-controlled ones always move)
+					if (not i['user_control'] and not self.core.is_someone_near()):
+						continue
+
 					# non-user-controlled images update based on relative position to other images
 					if (not i['user_control']):
 						# adjust angle if far from center (aim to pull it in to avoid images huddling at edge)
@@ -2891,21 +3482,9 @@ class PhotoSoup (ProgramBase):
 
 					# calculate influence of other images
 					if (not i['user_control']):
-						"""
-						each other image has influence, through attraction Fa and repulsion Fr
-						those two forces are from x,y towards the other x,y with radian angle ß and -ß
-						so the sum of the two forces influence the default force
-						"""
-						for img in self.images:
-							if (img is not i):
-								# calculate influence
-								f = self.get_force_attraction(i, img) - self.get_force_repulsion(i, img)
-								a = i['v'].get_angle_2D(img['v'])
-
-								# add this vector to the base
-								vi_x += f * cos(a)
-								vi_y += f * sin(a) * -1
-								#print(round(vi_x), round(vi_y), f, a)
+						f_x, f_y = self.get_force(i)
+						vi_x += f_x
+						vi_y += f_y
 
 					# for all, add the resultant vector to get the new position
 					#print('3', vi_x, vi_y)
@@ -2921,10 +3500,17 @@ class PhotoSoup (ProgramBase):
 		else:
 			super().update(ignore=True)
 
-	def make_active (self):
-		self.goal_num_images  = self.default_num_images
+	def load_assets (self):
 		self.button_add_photo = self.gui.open_simple_image('assets/icon_plus.png', keep_transparency=True)
 		self.button_trash     = self.gui.open_simple_image('assets/icon_trash.png', keep_transparency=True)
+
+	def unload_assets (self):
+		# reset variables to None to free memory
+		self.button_add_photo = None
+		self.button_trash     = None
+
+	def make_active (self):
+		self.goal_num_images  = self.default_num_images
 		super().make_active()
 
 	def make_inactive (self):
@@ -2932,8 +3518,6 @@ class PhotoSoup (ProgramBase):
 		for i in self.images:
 			if (i['image'] is not None):
 				i['image'].unload( i['since'] )
-		self.button_add_photo = None
-		self.button_trash     = None
 		super().make_inactive()
 
 	def is_on_sceen (self, a):
@@ -2945,6 +3529,24 @@ class PhotoSoup (ProgramBase):
 	def get_diameter (self, a):
 		return a['size'] * self.base_size * self.dsize[1]
 
+	""" returns the sum of forces other images exert on image a, as an (x, y) vector
+		each other image has influence, through attraction Fa and repulsion Fr
+		those two forces are from x,y towards the other x,y with radian angle ß and -ß
+		so the sum of the two forces influence the default force """
+	def get_force (self, a):
+		f_x = 0
+		f_y = 0
+		for img in self.images:
+			if (img is not a):
+				# calculate influence
+				f     = self.get_force_attraction(a, img) - self.get_force_repulsion(a, img)
+				angle = a['v'].get_angle_2D(img['v'])
+
+				# add this vector to the sum
+				f_x += f * cos(angle)
+				f_y += f * sin(angle) * -1
+		return (f_x, f_y)
+
 	""" attractive force scales linearly with the distance between a and b """
 	def get_force_attraction (self, a, b):
 		return 0.0001 * a['v'].get_distance_2D(b['v'])
@@ -2992,7 +3594,8 @@ class PhotoPatterns (ProgramBase):
 		if (self.core.is_debug):
 			self.default_time = 10
 			self.switch_time  = 1
-		self.last_swap    = 0
+		self.last_swap     = 0
+		self.prepare_sizes = [(0.8, 1)] + [(0.1875, 0.234)] * 4  # main image, and those on the side
 
 	def update (self):
 		if (self.first_run or self.status_open is False):
@@ -3036,7 +3639,7 @@ class PhotoPatterns (ProgramBase):
 				# decide whether to swap this image
 				if (i['image'] is None or self.first_run):
 					# make sure there is an image
-					i['image']     = self.core.images.get_next(current_images=self.get_current_image_paths(), rated=True)
+					i['image']     = self.get_prepared_image()
 					i['image_new'] = self.core.images.get_next(current_images=self.get_current_image_paths(), rated=True)
 					i['since']     = now
 				elif (index == tapped_index or (index == 0 and tapped_index != -1)):
@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+# coding: utf-8
+
+# ----- IMPORT LIBRARIES ------------------------------------------------------
+
+import heapq
+import random
+import time
+
+import tracing
+
+# ----- CLASSES ---------------------------------------------------------------
+
+
+""" Task is a callback the scheduler runs once it is due, either once or periodically """
+class Task ():
+	def __init__ (self, callback, name=None, interval=None, jitter=0, priority=0):
+		self.callback  = callback
+		self.name      = name or callback.__name__
+		self.interval  = interval  # in seconds, None for a one-shot task
+		self.jitter    = jitter    # in seconds, randomly added to or taken off each interval
+		self.priority  = priority  # higher runs first when several tasks are due at once
+		self.due       = 0         # timestamp
+		self.cancelled = False
+
+	def is_periodic (self):
+		return (self.interval is not None)
+
+	""" Returns the interval until the next run, with jitter applied """
+	def get_interval (self):
+		if (self.jitter > 0):
+			return max(self.interval + random.uniform(-self.jitter, self.jitter), 0)
+		return self.interval
+
+	def cancel (self):
+		self.cancelled = True
+
+
+"""
+Scheduler runs tasks once they are due, so the parts of the program don't each need
+to check the time on every frame. Tasks are kept in a heap ordered by due time, so
+checking for due tasks costs next to nothing while none are.
+
+The scheduler doesn't have a thread of its own: run_pending is called from the main loop,
+so tasks can safely use the display and other state of the main process.
+
+It keeps track of how late tasks ran (compared to when they were due), which tells whether
+the main loop keeps up with its housekeeping. These stats are kept by task name, so
+one-shot tasks that get scheduled time and again add up.
+"""
+class Scheduler ():
+	def __init__ (self):
+		self.heap     = []  # (due, -priority, sequence, task)
+		self.sequence = 0   # keeps the order of tasks that are otherwise equal
+		self.stats    = {}  # name: [runs, lateness of latest run, max lateness, duration of latest run]
+
+	""" Runs callback every interval seconds, first after delay seconds (or an interval, if None) """
+	def every (self, interval, callback, name=None, delay=None, jitter=0, priority=0):
+		task = Task(callback, name, interval, jitter, priority)
+		if (delay is None):
+			delay = task.get_interval()
+		self.add(task, time.time() + delay)
+		return task
+
+	""" Runs callback once, after delay seconds """
+	def after (self, delay, callback, name=None, priority=0):
+		task = Task(callback, name, priority=priority)
+		self.add(task, time.time() + delay)
+		return task
+
+	def add (self, task, due):
+		task.due       = due
+		self.sequence += 1
+		heapq.heappush(self.heap, (due, -task.priority, self.sequence, task))
+		self.stats.setdefault(task.name, [0, 0, 0, 0])
+
+	""" Stops a task from running again (it is dropped from the heap once it comes up) """
+	def cancel (self, task):
+		task.cancel()
+
+	""" Returns the number of seconds until the next task is due (or None if there are none) """
+	def get_time_to_next (self, now=None):
+		if (now is None):
+			now = time.time()
+		while (self.heap and self.heap[0][3].cancelled):
+			heapq.heappop(self.heap)
+		if (not self.heap):
+			return None
+		return max(self.heap[0][0] - now, 0)
+
+	""" Runs the tasks that are due, highest priority first, returns the number run
+		With a budget (in seconds), tasks left once it is spent wait until the next call,
+		so a frame isn't held up by housekeeping that can as well be done a frame later. """
+	def run_pending (self, now=None, budget=None):
+		if (now is None):
+			now = time.time()
+
+		# take all tasks that are due off the heap, then sort those by priority
+		due = []
+		while (self.heap and self.heap[0][0] <= now):
+			entry = heapq.heappop(self.heap)
+			if (not entry[3].cancelled):
+				due.append(entry)
+		if (not due):
+			return 0
+		due.sort(key=lambda entry: (entry[1], entry[0], entry[2]))
+
+		count = 0
+		for entry in due:
+			task = entry[3]
+			if (budget is not None and count > 0 and time.time() > now + budget):
+				# out of time, put it back as it was
+				heapq.heappush(self.heap, entry)
+				continue
+
+			self.run(task)
+			count += 1
+
+			if (task.is_periodic() and not task.cancelled):
+				# keep to the original schedule (to avoid drift), unless it fell behind by more than an interval
+				next_due = task.due + task.get_interval()
+				if (next_due < now):
+					next_due = now + task.get_interval()
+				self.add(task, next_due)
+
+		return count
+
+	def run (self, task):
+		t0       = time.time()
+		lateness = t0 - task.due
+
+		with tracing.span('task.' + task.name, args={'lateness': round(lateness, 4)}):
+			task.callback()
+
+		stats    = self.stats[task.name]
+		stats[0] += 1
+		stats[1] = lateness
+		stats[2] = max(stats[2], lateness)
+		stats[3] = time.time() - t0
+
+	""" Returns a list with a (name, runs, lateness, max lateness, duration) tuple per task name """
+	def get_stats (self):
+		stats = []
+		for name, (runs, lateness, lateness_max, duration) in list(self.stats.items()):
+			stats.append((name, runs, lateness, lateness_max, duration))
+		return stats
@@ -0,0 +1,327 @@
+#!/usr/bin/python3
+# coding: utf-8
+
+# ----- IMPORT LIBRARIES ------------------------------------------------------
+
+from collections import deque
+import multiprocessing as mp
+import os
+import select
+from statistics import median
+import sys
+import termios
+import time
+
+if (sys.platform == 'darwin'):
+	from mocking import GPIO
+else:
+	import RPi.GPIO as GPIO
+
+# ----- CONSTANTS -------------------------------------------------------------
+
+""" LV-MaxSonar data
+	PW: This pin outputs a pulse width representation of range.
+	The distance can be calculated using the scale factor of 147uS per inch.
+	PWM range is (0.88, 37.5) in mS
+"""
+PW_SECONDS_PER_INCH = 0.000147
+PW_MIN              = 0.00088  # in seconds
+PW_MAX              = 0.0375
+METERS_PER_INCH     = 0.0254
+
+""" LV-MaxSonar serial output (TX pin) runs at 9600 baud, 8 bits, no parity, one stop bit.
+	The output is an ASCII capital "R", followed by three ASCII character digits
+	representing the range in inches up to a maximum of 255, followed by a
+	carriage return (ASCII 13).
+"""
+FRAME_START  = b'R'
+FRAME_END    = b'\r'
+FRAME_LENGTH = 5
+
+# ----- CLASSES ---------------------------------------------------------------
+
+
+"""
+SensorChannel passes sensor readings from one process to another via shared memory.
+Each reading is written into a ring buffer slot, after which a sequence counter is
+increased to make it visible. Readers get the latest value or a short history without
+pickling, and without any build-up of readings when the reading side stalls.
+
+Only a single process (or thread) should publish to a channel.
+"""
+class SensorChannel ():
+	def __init__ (self, size=64):
+		self.size     = size                   # keep a power of 2, so indices survive sequence wrap-around
+		self.values   = mp.RawArray('d', size)  # ring buffer of readings
+		self.times    = mp.RawArray('d', size)  # timestamps of those readings
+		self.sequence = mp.RawValue('L', 0)     # number of readings published so far
+
+	""" Adds a reading to the buffer (writer side) """
+	def publish (self, value, timestamp=None):
+		if (timestamp is None):
+			timestamp = time.time()
+		sequence = self.sequence.value
+		index    = sequence % self.size
+
+		self.values[index] = value
+		self.times[index]  = timestamp
+		# only now is the new slot made visible to readers
+		self.sequence.value = sequence + 1
+
+	""" Returns the number of readings published so far """
+	def get_sequence (self):
+		return self.sequence.value
+
+	""" Returns the latest reading, or default if nothing has been published yet """
+	def get_latest (self, default=None):
+		sequence = self.sequence.value
+		if (sequence == 0):
+			return default
+		return self.values[(sequence - 1) % self.size]
+
+	""" Returns up to n recent readings as (timestamp, value) tuples, oldest first """
+	def get_history (self, n=10):
+		sequence = self.sequence.value
+		# leave out the oldest slot, as that one is the next to be overwritten
+		n = min(n, sequence, self.size - 1)
+
+		history = []
+		for s in range(sequence - n, sequence):
+			index = s % self.size
+			history.append((self.times[index], self.values[index]))
+		return history
+
+
+"""
+PulseWidthSensor reads the LV-MaxSonar pulse width (PW) output on a GPIO pin.
+Rising and falling edges are timestamped in an edge callback, so every reading is based
+on the time between edges (rather than on estimating it by sampling the pin level).
+Callbacks run with some delay, which adds jitter to each width, but as both edges are
+delayed alike this mostly cancels out. A median over the last few pulses filters out
+glitches, and impossible widths are dropped.
+"""
+class PulseWidthSensor ():
+	def __init__ (self, channel=None, pin=16, window=5, gpio=None):
+		self.channel   = channel
+		self.pin       = pin
+		self.gpio      = gpio
+		if (self.gpio is None):
+			self.gpio  = GPIO
+		self.widths    = deque(maxlen=window)  # recent valid pulse widths, in seconds
+		self.rise_time = None
+		self.level     = False  # pin level after the latest edge, see handle_edge
+
+	def start (self):
+		self.gpio.setmode(self.gpio.BCM)  # choose BCM or BOARD numbering schemes
+		self.gpio.setup(self.pin, self.gpio.IN, pull_up_down=self.gpio.PUD_DOWN)
+		# edges are tracked from the current level onwards
+		self.level = bool(self.gpio.input(self.pin))
+		self.gpio.add_event_detect(self.pin, self.gpio.BOTH, callback=self.handle_edge)
+
+	def stop (self):
+		self.gpio.remove_event_detect(self.pin)
+		self.gpio.cleanup()
+
+	""" Called (on a GPIO thread) for every rising and falling edge
+		A short pulse may be over by the time its rising edge gets here, so the pin level
+		can't tell which edge this is. Instead, edges are taken to alternate. """
+	def handle_edge (self, pin):
+		now        = time.perf_counter()
+		self.level = not self.level
+
+		if (self.level):
+			self.rise_time = now
+		elif (self.rise_time is not None):
+			width          = now - self.rise_time
+			self.rise_time = None
+			if (width > PW_MAX):
+				# longer than any pulse, so an edge was missed and this was the gap in between pulses
+				# this edge is a rising one then, which gets edges back in step
+				self.level     = True
+				self.rise_time = now
+			else:
+				self.add_pulse(width)
+
+	""" Filters a measured pulse width and publishes the resulting distance """
+	def add_pulse (self, width):
+		# a glitch gives an impossible width, so leave those out altogether
+		if (width < PW_MIN or width > PW_MAX):
+			return
+
+		self.widths.append(width)
+		self.channel.publish(self.width_to_distance(median(self.widths)))
+
+	""" Returns distance in meters """
+	def width_to_distance (self, width):
+		return width / PW_SECONDS_PER_INCH * METERS_PER_INCH
+
+
+"""
+MaxSonarFrameParser turns a stream of serial bytes into range readings (in inches).
+Data may arrive in arbitrary pieces, so incomplete frames are kept until the next feed.
+Bytes that do not form a valid frame are skipped up to the next "R", which gets
+the parser back in sync after line noise or when starting mid-frame.
+"""
+class MaxSonarFrameParser ():
+	def __init__ (self):
+		self.buffer  = bytearray()
+		self.dropped = 0  # number of bytes skipped while resyncing
+
+	""" Adds received bytes, returns a list of complete readings """
+	def feed (self, data):
+		self.buffer.extend(data)
+		readings = []
+
+		while (True):
+			start = self.buffer.find(FRAME_START)
+			if (start == -1):
+				self.dropped += len(self.buffer)
+				self.buffer.clear()
+				break
+			elif (start > 0):
+				self.dropped += start
+				del self.buffer[:start]
+
+			if (len(self.buffer) < FRAME_LENGTH):
+				break  # wait for the rest of this frame
+
+			frame = bytes(self.buffer[:FRAME_LENGTH])
+			if (frame[1:4].isdigit() and frame[4:5] == FRAME_END):
+				readings.append(int(frame[1:4]))
+				del self.buffer[:FRAME_LENGTH]
+			else:
+				# not a frame after all, so look for the next start from here on
+				self.dropped += 1
+				del self.buffer[:1]
+
+		return readings
+
+
+"""
+SerialSensor reads the LV-MaxSonar serial output, giving exact range readings at the
+sensor's own rate. The port is opened non-blocking and waited upon with select, so
+no time is spent when there is nothing to read.
+"""
+class SerialSensor ():
+	def __init__ (self, channel=None, port='/dev/ttyS0'):
+		self.channel = channel
+		self.port    = port
+		self.fd      = None
+		self.parser  = MaxSonarFrameParser()
+
+	def start (self):
+		self.fd = os.open(self.port, os.O_RDONLY | os.O_NOCTTY | os.O_NONBLOCK)
+
+		# raw mode at 9600 baud, 8N1
+		iflag, oflag, cflag, lflag, ispeed, ospeed, cc = termios.tcgetattr(self.fd)
+		iflag = 0
+		oflag = 0
+		lflag = 0
+		cflag = termios.CS8 | termios.CREAD | termios.CLOCAL
+		cc[termios.VMIN]  = 0
+		cc[termios.VTIME] = 0
+		termios.tcsetattr(self.fd, termios.TCSANOW, [iflag, oflag, cflag, lflag, termios.B9600, termios.B9600, cc])
+		termios.tcflush(self.fd, termios.TCIFLUSH)
+
+	def stop (self):
+		if (self.fd is not None):
+			os.close(self.fd)
+			self.fd = None
+
+	""" Waits up to timeout seconds for data, returns the number of readings published
+		A timeout of None waits until there is data, or until wake (anything with fileno) is readable. """
+	def read (self, timeout=0.5, wake=None):
+		waiting_on = [self.fd]
+		if (wake is not None):
+			waiting_on.append(wake)
+		readable, _, _ = select.select(waiting_on, [], [], timeout)
+		if (self.fd not in readable):
+			return 0
+
+		try:
+			data = os.read(self.fd, 256)
+		except BlockingIOError:
+			return 0
+
+		readings = self.parser.feed(data)
+		for inches in readings:
+			self.channel.publish(inches * METERS_PER_INCH)
+		return len(readings)
+
+
+"""
+PresenceModel interprets distance readings (and touches) as someone being around or not.
+	PRESENT:     someone is close by, or touched the screen recently
+	APPROACHING: someone is in view of the sensor, or moving towards it
+	ABSENT:      nobody has been seen for a while
+Going up is immediate, so the device is responsive as soon as someone shows up.
+Going down is slow: once present, a person counts as such until beyond the far distance
+(hysteresis), and then only after a timeout. This keeps a jittery reading or someone
+standing still for a moment from turning the device down.
+"""
+class PresenceModel ():
+	ABSENT      = 0
+	APPROACHING = 1
+	PRESENT     = 2
+	NAMES       = ('absent', 'approaching', 'present')
+
+	def __init__ (self, near=1.2, far=2.5, approach_speed=0.3, touch_timeout=30, present_timeout=20, absent_timeout=120):
+		self.near            = near             # in meters, closer than this means present
+		self.far             = far              # in meters, closer than this means at least approaching
+		self.approach_speed  = approach_speed   # in m/s, moving closer faster than this means approaching
+		self.touch_timeout   = touch_timeout    # in seconds, a touch counts as presence for this long
+		self.present_timeout = present_timeout  # in seconds, presence lasts this long after someone moves away
+		self.absent_timeout  = absent_timeout   # in seconds, absence only sets in after this long
+
+		# assume someone is there at start, so nothing is held back at first
+		now             = time.time()
+		self.state      = self.PRESENT
+		self.last_near  = now
+		self.last_seen  = now
+		self.readings   = deque(maxlen=30)  # recent (timestamp, distance) tuples
+
+	""" Takes in the latest distance (in meters) and touch timestamp, returns True if state changed """
+	def update (self, distance, last_touch=0, now=None):
+		if (now is None):
+			now = time.time()
+		self.readings.append((now, distance))
+
+		near = (distance < self.near or last_touch > now - self.touch_timeout)
+		# once present, only moving beyond the far distance counts as leaving
+		if (self.state == self.PRESENT and distance < self.far):
+			near = True
+		if (near):
+			self.last_near = now
+		if (near or distance < self.far or self.get_speed() < -self.approach_speed):
+			self.last_seen = now
+
+		new_state = self.ABSENT
+		if (self.last_near > now - self.present_timeout):
+			new_state = self.PRESENT
+		elif (self.last_seen > now - self.absent_timeout):
+			new_state = self.APPROACHING
+
+		changed    = (new_state != self.state)
+		self.state = new_state
+		return changed
+
+	""" Returns change in distance over the recent readings in m/s (negative if getting closer) """
+	def get_speed (self):
+		# only consider the past second, and expect at least some time to have passed
+		t1, d1 = self.readings[-1]
+		for t0, d0 in self.readings:
+			if (t0 > t1 - 1):
+				break
+		if (t1 - t0 < 0.3):
+			return 0
+		return (d1 - d0) / (t1 - t0)
+
+	def get_state (self):
+		return self.state
+
+	def get_state_name (self):
+		return self.NAMES[self.state]
+
+	""" Returns True unless nobody has been around for a while """
+	def is_someone_near (self):
+		return (self.state != self.ABSENT)
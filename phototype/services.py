@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+# coding: utf-8
+
+# ----- IMPORT LIBRARIES ------------------------------------------------------
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait as wait_for_futures
+import queue
+import random
+import threading
+
+import tracing
+
+# ----- CLASSES ---------------------------------------------------------------
+
+
+"""
+ServiceLoop runs network-bound background work (such as checking for updates and uploading data)
+on an asyncio event loop, in a thread of its own. In between tasks that thread simply waits,
+rather than polling for something to do.
+
+HTTP requests go via a single session, so connections get reused, and failed requests are retried
+with a growing delay in between (backoff). As requests blocks, these are handed to a small pool
+of threads while the loop continues with other tasks.
+
+Results meant for the main thread (which owns the display and most state) get passed back
+as callbacks via a thread-safe queue, see call_in_main and update.
+"""
+class ServiceLoop ():
+	def __init__ (self, http_threads=2, timeout=30, retries=3, backoff=2):
+		self.timeout   = timeout  # in seconds, per HTTP request
+		self.retries   = retries  # number of tries after a first failed request
+		self.backoff   = backoff  # in seconds, doubles with every retry
+		self.session   = None     # made on the first request, see send
+		self.lock      = threading.Lock()
+		self.executor  = ThreadPoolExecutor(max_workers=http_threads, thread_name_prefix='http')
+		self.callbacks = queue.Queue()  # (callback, args) to run on the main thread
+		self.pending   = set()          # futures of one-off work, which gets a chance to finish on close
+		self.closing   = False          # no more retries once set
+
+		self.request_total = 0
+		self.retry_total   = 0
+		self.failure_total = 0
+
+		# work may be submitted right away, it runs once the thread has started the loop
+		self.loop   = asyncio.new_event_loop()
+		self.thread = threading.Thread(target=self.run_loop, name='services')
+		self.thread.daemon = True
+		self.thread.start()
+
+	""" Stops the loop, after giving one-off work (such as an upload) up to timeout seconds to finish """
+	def close (self, timeout=2):
+		self.closing = True
+		pending      = list(self.pending)
+		if (pending):
+			print('Waiting for background services to finish...')
+			wait_for_futures(pending, timeout)
+
+		self.loop.call_soon_threadsafe(self.loop.stop)
+		self.thread.join(1)
+		self.executor.shutdown(wait=False)
+		if (self.session is not None):
+			self.session.close()
+
+	""" This is the code that the services thread will run """
+	def run_loop (self):
+		asyncio.set_event_loop(self.loop)
+		try:
+			self.loop.run_forever()
+		finally:
+			# cancel whatever is left waiting
+			tasks = asyncio.all_tasks(self.loop)
+			for task in tasks:
+				task.cancel()
+			self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+			self.loop.close()
+
+	""" Runs coroutine on the loop, returns a (concurrent.futures) Future
+		Note: like the other methods below, this is safe to call from any thread. """
+	def submit (self, coroutine, name=None):
+		future = asyncio.run_coroutine_threadsafe(self.guard(coroutine, name or coroutine.__qualname__), self.loop)
+		self.pending.add(future)
+		future.add_done_callback(self.pending.discard)
+		return future
+
+	""" Runs coroutine function func every interval seconds, first after delay seconds (or an interval, if None) """
+	def every (self, interval, func, name=None, delay=None):
+		if (delay is None):
+			delay = interval
+		return asyncio.run_coroutine_threadsafe(self.run_periodic(interval, func, name or func.__name__, delay), self.loop)
+
+	""" Runs coroutine function func once, after delay seconds """
+	def after (self, delay, func, name=None):
+		return self.submit(self.run_delayed(delay, func), name or func.__name__)
+
+	""" Queues callback(*args) to run on the main thread, once it calls update """
+	def call_in_main (self, callback, *args):
+		self.callbacks.put((callback, args))
+
+	""" Runs callbacks queued for the main thread (only call this from the main thread) """
+	def update (self):
+		while (not self.callbacks.empty()):
+			callback, args = self.callbacks.get()
+			callback(*args)
+
+	async def guard (self, coroutine, name):
+		try:
+			return await coroutine
+		except asyncio.CancelledError:
+			raise
+		except Exception as e:
+			# not critical to the functioning, so warn and continue
+			print('Warning: service {0} failed ({1})'.format(name, e))
+
+	async def run_periodic (self, interval, func, name, delay):
+		while (True):
+			await asyncio.sleep(delay)
+			await self.guard(func(), name)
+			delay = interval
+
+	async def run_delayed (self, delay, func):
+		await asyncio.sleep(delay)
+		await func()
+
+	""" Runs func(*args) on the thread pool, so blocking work (e.g., file access) doesn't hold up the loop """
+	async def run_blocking (self, func, *args):
+		return await self.loop.run_in_executor(self.executor, func, *args)
+
+	""" Does an HTTP request without holding up the loop, returns the response
+		Connection errors and server errors (5xx) are retried with backoff (unless closing). When all tries fail,
+		the last server response is returned, or the last connection error is raised. """
+	async def request (self, method, url, **kwargs):
+		kwargs.setdefault('timeout', self.timeout)
+		attempt = 0
+
+		while (True):
+			self.request_total += 1
+			try:
+				response = await self.run_blocking(self.send, method, url, kwargs)
+				if (response.status_code < 500):
+					return response
+				if (attempt >= self.retries or self.closing):
+					self.failure_total += 1
+					return response
+			except OSError:  # includes the errors raised by requests
+				if (attempt >= self.retries or self.closing):
+					self.failure_total += 1
+					raise
+
+			# wait a little longer after every try (with some randomness, to avoid retrying in step with others)
+			attempt          += 1
+			self.retry_total += 1
+			await asyncio.sleep(self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+
+	""" Sends a request via the shared session (this runs on the thread pool) """
+	def send (self, method, url, kwargs):
+		with self.lock:
+			if (self.session is None):
+				# only loaded here, as it takes a while to import and is only of use to the services
+				import requests
+				self.session = requests.Session()
+
+		with tracing.span('http.' + method.lower(), args={'url': url}):
+			return self.session.request(method, url, **kwargs)
+
+	def get_request_total (self):
+		return self.request_total
+
+	def get_retry_total (self):
+		return self.retry_total
+
+	def get_failure_total (self):
+		return self.failure_total
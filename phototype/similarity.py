@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+# coding: utf-8
+
+# ----- FUNCTIONS -------------------------------------------------------------
+
+""" Returns a 64-bit difference hash (dHash) of an image file, or None if it can't be read
+	The image is reduced to 9x8 greyscale pixels, and each bit tells whether a pixel is
+	brighter than its right-hand neighbour. Resizing or re-encoding a photo hardly changes
+	this, so similar photos have hashes that differ in only a few bits. """
+def get_dhash (file_path):
+	# only loaded here, as only the importer calculates hashes (the display process just compares them)
+	from PIL import Image as PIL_Image
+
+	try:
+		image = PIL_Image.open(file_path)
+		# let the JPEG decoder scale down already, which is much quicker than a full decode
+		image.draft('L', (64, 64))
+		image = image.convert('L').resize((9, 8), PIL_Image.BILINEAR)
+		pixels = list(image.getdata())
+		image.close()
+	except (IOError, OSError, SyntaxError):
+		return None
+
+	dhash = 0
+	for row in range(8):
+		for col in range(8):
+			dhash <<= 1
+			if (pixels[row * 9 + col] > pixels[row * 9 + col + 1]):
+				dhash |= 1
+	return dhash
+
+""" Returns the number of bits that differ between two hashes """
+def hamming_distance (a, b):
+	return bin(a ^ b).count('1')
+
+# ----- CLASSES ---------------------------------------------------------------
+
+
+"""
+BKTree finds hashes within a given Hamming distance without comparing to each one.
+Every node keeps its children by their distance to it, and thanks to the triangle
+inequality a search only has to descend into children within (distance +/- max).
+"""
+class BKTree ():
+	def __init__ (self):
+		self.root  = None  # node: [hash, list of items, {distance: child node}]
+		self.count = 0
+
+	def add (self, dhash, item):
+		self.count += 1
+		if (self.root is None):
+			self.root = [dhash, [item], {}]
+			return
+
+		node = self.root
+		while (True):
+			distance = hamming_distance(dhash, node[0])
+			if (distance == 0):
+				node[1].append(item)
+				return
+			elif (distance in node[2]):
+				node = node[2][distance]
+			else:
+				node[2][distance] = [dhash, [item], {}]
+				return
+
+	def remove (self, dhash, item):
+		node = self.root
+		while (node is not None):
+			distance = hamming_distance(dhash, node[0])
+			if (distance == 0):
+				if (item in node[1]):
+					# the node itself stays, as it still guides the search to its children
+					node[1].remove(item)
+					self.count -= 1
+				return
+			node = node[2].get(distance)
+
+	""" Returns a list of (distance, item) tuples for all items within max_distance """
+	def find (self, dhash, max_distance=6):
+		results = []
+		if (self.root is None):
+			return results
+
+		nodes = [self.root]
+		while (nodes):
+			node     = nodes.pop()
+			distance = hamming_distance(dhash, node[0])
+			if (distance <= max_distance):
+				for item in node[1]:
+					results.append((distance, item))
+			for child_distance, child in node[2].items():
+				if (distance - max_distance <= child_distance <= distance + max_distance):
+					nodes.append(child)
+
+		return results
+
+	def __len__ (self):
+		return self.count
@@ -4,12 +4,17 @@
 # via: http://www.opensource.apple.com/source/python/python-3/python/Lib/SimpleHTTPServer.py
 # note: BaseHTTPServer is different in Python 3+
 
+from email.utils import parsedate_tz, mktime_tz
+import gzip
+from hashlib import sha256
 from http.server import BaseHTTPRequestHandler
 from io import BytesIO
 import json
 import mimetypes
 import os
+from PIL import Image as PIL_Image
 import posixpath
+import queue
 import re
 import shutil
 import signal
@@ -18,12 +23,14 @@ from threading import Thread
 import sys
 import threading
 import time
-from urllib.parse import unquote as url_unquote
+import tracing
+from urllib.parse import parse_qs, unquote as url_unquote
 
 # ----- PRIMARY FUNCTIONS --------------------------------------------
 
 class SimpleServer ():
-	def __init__ (self, debug=True, port=None, use_signals=True, regular_run=True):
+	def __init__ (self, debug=True, port=None, use_signals=True, regular_run=True, workers=8, max_uploads=3, import_queue=None, content_index=None,
+		import_pending=None, max_pending=20, min_free_mb=250, catalog=None, image_folder=None, thumbnail_folder=None, metrics=None):
 		self.is_debug    = debug
 		self.regular_run = regular_run
 
@@ -37,11 +44,27 @@ class SimpleServer ():
 
 		# initiate server
 		print('HTTP server: starting on port ' + str(self.server_port))
-		self.server = socketserver.TCPServer(("", self.server_port), ResponseHandler)
-		# try to set reuse of the socket
-		#  enabling faster restarts without 90sec cooldown
-		#  before reuse of socket is allowed
-		#server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.server = PooledTCPServer(("", self.server_port), ResponseHandler, workers=workers, max_uploads=max_uploads)
+		# completed uploads get announced here as (path, timestamp, hashes) tuples, if given
+		self.server.import_queue  = import_queue
+		# uploads with content that's known already are dropped, if given
+		self.server.content_index = content_index
+		# uploads are turned away while the importer lags behind, or when disk space runs low
+		self.server.import_pending = import_pending  # shared counter of uploads not yet imported, if given
+		self.server.max_pending    = max_pending
+		self.server.min_free_mb    = min_free_mb
+		# the image library can be browsed if given, with catalog(offset, count) returning (total, [details])
+		self.server.catalog          = catalog
+		self.server.image_folder     = image_folder
+		self.server.thumbnail_folder = thumbnail_folder
+		# runtime metrics of the application are added to /metrics if given, see Photocore.get_runtime_metrics()
+		self.server.metrics          = metrics
+
+		# thumbnails of images gone from the library since the last run get removed (in the background, as there may be many)
+		if (image_folder is not None and thumbnail_folder is not None):
+			cleanup_thread = Thread(target=self.server.remove_stale_thumbnails, name='thumbnail-cleanup')
+			cleanup_thread.daemon = True
+			cleanup_thread.start()
 
 		# before starting setup hanlding signals to be able to terminate gracefully
 		if (use_signals):
@@ -51,6 +74,7 @@ class SimpleServer ():
 
 		# run server on separate thread
 		self.server_thread = Thread(target=self.server.serve_forever)
+		self.server_thread.daemon = True
 		if (self.is_debug):
 			print('HTTP server: starting server thread')
 		self.server_thread.start()
@@ -72,7 +96,7 @@ class SimpleServer ():
 		self.server.shutdown()  # this stops serve_forever, this is a blocking function
 
 		if (not self.regular_run):
-			time.sleep(1)
+			# serve_forever has returned by now, so no need to wait any longer
 			self.cleanup()
 
 	def cleanup (self):
@@ -86,11 +110,308 @@ class SimpleServer ():
 		print('HTTP server: shut down on port ' + str(self.server_port))
 
 
+""" TCPServer that handles connections on a fixed number of worker threads,
+	so a slow client (e.g., an upload over poor Wi-Fi) doesn't hold up anyone else.
+	Connections beyond the number of workers wait in line until a worker is free. """
+class PooledTCPServer (socketserver.TCPServer):
+	# reuse of the socket enables faster restarts without 90sec cooldown
+	allow_reuse_address = True
+
+	def __init__ (self, server_address, handler_class, workers=8, max_uploads=3):
+		self.import_queue     = None
+		self.content_index    = None
+		self.import_pending   = None
+		self.max_pending      = 20
+		self.min_free_mb      = 250
+		self.catalog          = None
+		self.image_folder     = None
+		self.thumbnail_folder = None
+		self.thumbnail_sizes  = (120, 240, 480)  # in pixels, any other size asked for is rounded up to one of these
+		self.metrics          = None
+		self.request_queue    = queue.Queue()
+		# guards the records of chunked uploads, as chunks may arrive on several workers
+		self.chunk_lock       = threading.Lock()
+		# uploads take long and write to disk, so only allow a few at a time
+		self.upload_slots     = threading.BoundedSemaphore(max_uploads)
+		# thumbnails are made one at a time, to keep decoding photos from hogging the CPU
+		self.thumbnail_lock   = threading.Lock()
+		self.workers          = []
+
+		# upload counts since start, see count()
+		self.counters = {
+			'uploads'   : 0,  # files received completely
+			'duplicates': 0,  # files dropped as their content was known already
+			'failed'    : 0,  # requests that couldn't be handled
+			'refused'   : 0,  # requests turned away as the device is busy or full
+			'bytes'     : 0   # size of upload requests
+		}
+		self.counter_lock = threading.Lock()
+
+		super().__init__(server_address, handler_class)
+
+		for i in range(workers):
+			worker = Thread(target=self.run_worker, name='http-{0}'.format(i))
+			worker.daemon = True
+			worker.start()
+			self.workers.append(worker)
+
+	""" Called by serve_forever for each new connection, hands it over to a worker """
+	def process_request (self, request, client_address):
+		self.request_queue.put((request, client_address))
+
+	def run_worker (self):
+		while (True):
+			item = self.request_queue.get()
+			if (item is None):
+				break
+
+			request, client_address = item
+			try:
+				self.finish_request(request, client_address)
+			except Exception:
+				self.handle_error(request, client_address)
+			finally:
+				self.shutdown_request(request)
+
+	def count (self, name, amount=1):
+		with self.counter_lock:
+			self.counters[name] += amount
+
+	def get_counters (self):
+		with self.counter_lock:
+			return dict(self.counters)
+
+	""" Removes the thumbnails of a library image, see ResponseHandler.get_thumbnail_path """
+	def remove_thumbnails (self, image_id):
+		name = os.path.splitext(image_id)[0]
+		with self.thumbnail_lock:
+			for size in self.thumbnail_sizes:
+				try:
+					os.remove(os.path.join(self.thumbnail_folder, '{0}-{1}.jpg'.format(name, size)))
+				except OSError:
+					pass
+
+	""" Removes thumbnails of images no longer in the library, and of sizes no longer made """
+	def remove_stale_thumbnails (self):
+		sizes = [str(size) for size in self.thumbnail_sizes]
+		with self.thumbnail_lock:
+			try:
+				names      = set(os.path.splitext(filename)[0] for filename in os.listdir(self.image_folder))
+				thumbnails = os.listdir(self.thumbnail_folder)
+			except OSError:
+				return
+
+			for filename in thumbnails:
+				name, dash, size = os.path.splitext(filename)[0].rpartition('-')
+				if (not filename.endswith('.jpg') or name not in names or size not in sizes):
+					try:
+						os.remove(os.path.join(self.thumbnail_folder, filename))
+					except OSError:
+						pass
+
+	def server_close (self):
+		super().server_close()
+		# signal workers to stop (each takes one item off the queue)
+		for worker in self.workers:
+			self.request_queue.put(None)
+
+
+""" ContentIndex keeps track of the SHA-256 hashes of uploaded files that got imported.
+	The importer process appends to the index file, others reload it once it changes.
+	Hashes of uploads that are still on their way to the importer are kept as pending,
+	so a duplicate is caught even if it arrives right after the original. """
+class ContentIndex ():
+	def __init__ (self, path):
+		self.path    = path
+		self.hashes  = {}  # hash: filename of imported image
+		self.pending = {}  # hash: timestamp
+		self.mtime   = None
+		self.lock    = threading.Lock()
+
+	""" Reads the index file, if it changed since last time """
+	def reload (self):
+		try:
+			mtime = os.stat(self.path).st_mtime_ns
+		except OSError:
+			return
+		if (mtime == self.mtime):
+			return
+
+		hashes = {}
+		with open(self.path, 'r') as f:
+			for line in f:
+				parts = line.split()
+				if (len(parts) == 2):
+					hashes[parts[0]] = parts[1]
+		self.hashes = hashes
+		self.mtime  = mtime
+
+	""" Returns True if content with this hash was uploaded before """
+	def contains (self, digest):
+		with self.lock:
+			self.reload()
+			# only trust pending hashes for a while, in case their import fails
+			if (self.pending.get(digest, 0) > time.time() - 3600):
+				return True
+			if (digest in self.hashes):
+				# only if the image is still around
+				image_path = os.path.join(os.path.dirname(self.path), self.hashes[digest])
+				return os.path.exists(image_path)
+		return False
+
+	def add_pending (self, digests):
+		with self.lock:
+			for digest in digests:
+				self.pending[digest] = time.time()
+
+	""" Records hashes for an imported image (filename within the index folder) """
+	def add (self, digests, filename):
+		with self.lock:
+			with open(self.path, 'a') as f:
+				for digest in digests:
+					f.write('{0} {1}\n'.format(digest, filename))
+					self.hashes[digest] = filename
+
+
+""" Passes writes on to a file, while calculating a hash of all data written """
+class HashingWriter ():
+	def __init__ (self, out):
+		self.out  = out
+		self.hash = sha256()
+
+	def write (self, data):
+		self.hash.update(data)
+		return self.out.write(data)
+
+	def hexdigest (self):
+		return self.hash.hexdigest()
+
+
+class MultipartError (Exception):
+	pass
+
+
+""" Reads multipart/form-data bodies in fixed-size chunks, never more than the request length.
+	Part bodies stream to a file object as they arrive, with the boundary being looked for
+	across chunk edges, so memory use stays bounded no matter how large a file is. """
+class MultipartParser ():
+	def __init__ (self, rfile, boundary, length, chunk_size=65536):
+		self.rfile      = rfile
+		self.remaining  = length
+		self.chunk_size = chunk_size
+		# the first boundary may come without the leading CRLF, so pretend it had one
+		self.buffer     = bytearray(b'\r\n')
+		self.delimiter  = b'\r\n--' + boundary
+		self.done       = False
+
+	""" Reads more data into the buffer, returns False once the request body is exhausted """
+	def fill (self):
+		if (self.remaining <= 0):
+			return False
+		data = self.rfile.read(min(self.chunk_size, self.remaining))
+		if (not data):
+			raise MultipartError("Unexpected end of data.")
+		self.remaining -= len(data)
+		self.buffer.extend(data)
+		return True
+
+	""" Moves to the next part, returns its headers (lowercase names) or None if no parts are left """
+	def next_part (self):
+		if (self.done):
+			return None
+
+		# find the delimiter (skips the preamble, or anything left of a previous part)
+		while (True):
+			index = self.buffer.find(self.delimiter)
+			if (index != -1):
+				del self.buffer[:index + len(self.delimiter)]
+				break
+			# keep enough to match a delimiter that's split across chunks
+			del self.buffer[:max(len(self.buffer) - len(self.delimiter) + 1, 0)]
+			if (not self.fill()):
+				raise MultipartError("Content does NOT begin with boundary")
+
+		# what follows the delimiter tells whether another part comes, or this was the last one
+		while (len(self.buffer) < 2):
+			if (not self.fill()):
+				raise MultipartError("Unexpected end of data.")
+		if (self.buffer[:2] == b'--'):
+			self.finish()
+			return None
+
+		# read the part headers, up to the empty line
+		while (True):
+			index = self.buffer.find(b'\r\n\r\n')
+			if (index != -1):
+				break
+			if (len(self.buffer) > 16384):
+				raise MultipartError("Part headers are too long")
+			if (not self.fill()):
+				raise MultipartError("Unexpected end of data.")
+
+		headers = {}
+		for line in bytes(self.buffer[:index]).decode('utf-8', 'replace').split('\r\n'):
+			if (':' in line):
+				key, value = line.split(':', 1)
+				headers[key.strip().lower()] = value.strip()
+		del self.buffer[:index + 4]
+
+		return headers
+
+	""" Reads the body of the current part, up to (but not including) the next delimiter
+		It gets written to out if given, else returned as bytes if limit is set, else discarded """
+	def read_body (self, out=None, limit=None):
+		collected = bytearray()
+		keep      = len(self.delimiter) - 1
+
+		while (True):
+			index = self.buffer.find(self.delimiter)
+			if (index != -1):
+				self.write(self.buffer[:index], out, collected, limit)
+				# leave the delimiter itself in the buffer for next_part()
+				del self.buffer[:index]
+				return bytes(collected)
+
+			# everything but a potential partial delimiter at the end can be passed on
+			if (len(self.buffer) > keep):
+				self.write(self.buffer[:-keep], out, collected, limit)
+				del self.buffer[:-keep]
+			if (not self.fill()):
+				raise MultipartError("Unexpected end of data.")
+
+	def write (self, data, out, collected, limit):
+		if (out is not None):
+			out.write(data)
+		elif (limit is not None):
+			if (len(collected) + len(data) > limit):
+				raise MultipartError("Form field is too long")
+			collected.extend(data)
+
+	""" Discards anything after the final boundary, so the connection can be reused """
+	def finish (self):
+		self.done = True
+		self.buffer.clear()
+		while (self.remaining > 0):
+			data = self.rfile.read(min(self.chunk_size, self.remaining))
+			if (not data):
+				break
+			self.remaining -= len(data)
+
+
 # This class handles the server response
 class ResponseHandler (BaseHTTPRequestHandler):
 	global version
 
-	server_version = "PiHTTP/" + str(0.1)
+	server_version   = "PiHTTP/" + str(0.1)
+	# keep connections open for subsequent requests (every response sets its Content-Length)
+	protocol_version = "HTTP/1.1"
+	# seconds a connection may be idle (or stall mid-request) before it's closed
+	timeout          = 20
+	# headers and body go out in separate writes, don't let the body wait for an ACK
+	disable_nagle_algorithm = True
+
+	# text-based files are worth compressing, a gzipped copy is kept next to the original
+	compressible_types = ('text/html', 'text/css', 'application/javascript', 'application/json')
 
 	extensions_map = mimetypes.types_map.copy()
 	extensions_map.update({
@@ -121,10 +442,11 @@ class ResponseHandler (BaseHTTPRequestHandler):
 
 	def do_GET (self):
 		"""Serve a GET request."""
-		f = self.send_head()
-		if f:
-			self.copyfile(f, self.wfile)
-			f.close()
+		with tracing.span('http.get', args={'path': self.path}):
+			f = self.send_head()
+			if f:
+				self.copyfile(f, self.wfile)
+				f.close()
 
 	def send_head (self):
 		"""Common code for GET and HEAD commands.
@@ -143,40 +465,81 @@ class ResponseHandler (BaseHTTPRequestHandler):
 		
 		# decide on static or dynamic response
 		if (self.path == '/upload' or self.path == '/upload/'):
-			# handle a dynamic response
+			# handle a dynamic response, with upload counts since start
+			f = BytesIO()
+			f.write( json.dumps(self.server.get_counters()).encode('utf-8') )
+			f.seek(0)
+			content_type = 'application/json'
+			content_length = len(f.getvalue())
+		elif (self.path == '/trace.json' and tracing.is_enabled()):
+			# a trace of all processes up to now, to open in chrome://tracing or Perfetto
+			f = BytesIO()
+			f.write( json.dumps(tracing.get_trace()).encode('utf-8') )
+			f.seek(0)
+			content_type = 'application/json'
+			content_length = len(f.getvalue())
+		elif (self.path == '/metrics' or self.path == '/metrics.json'):
+			# runtime metrics, in Prometheus text format (or as JSON)
+			metrics = self.get_metrics()
+			f = BytesIO()
+			if (self.path.endswith('.json')):
+				f.write( json.dumps(self.format_metrics_json(metrics)).encode('utf-8') )
+				content_type = 'application/json'
+			else:
+				f.write( self.format_metrics_text(metrics).encode('utf-8') )
+				content_type = 'text/plain; version=0.0.4; charset=utf-8'
+			f.seek(0)
+			content_length = len(f.getvalue())
+		elif (self.path.startswith('/upload/check?')):
+			# whether a file with this hash is on the device already (so a client may skip it)
+			query  = parse_qs(self.path.split('?', 1)[1])
+			digest = query.get('sha256', [''])[0].lower()
+			exists = False
+			if (self.server.content_index is not None and self.is_valid_hash(digest)):
+				exists = self.server.content_index.contains(digest)
+
+			f = BytesIO()
+			f.write( json.dumps({'exists': exists}).encode('utf-8') )
+			f.seek(0)
+			content_type = 'application/json'
+			content_length = len(f.getvalue())
+		elif (self.path.startswith('/upload/status?')):
+			# which chunks of an upload have arrived already (so a client may resume)
+			query  = parse_qs(self.path.split('?', 1)[1])
+			uuid   = query.get('uuid', [''])[0]
+			status = {'received': [], 'complete': False}
+			if (self.is_valid_uuid(uuid)):
+				status = self.get_chunk_status(uuid)
+
+			f = BytesIO()
+			f.write( json.dumps(status).encode('utf-8') )
+			f.seek(0)
+			content_type = 'application/json'
+			content_length = len(f.getvalue())
+		elif (self.path == '/api/images' or self.path.startswith('/api/images?')):
+			# a page of the image library, with details on each image
+			if (self.server.catalog is None):
+				return self.send_error(404, "File not found")
+			query    = parse_qs(self.path.split('?', 1)[1] if '?' in self.path else '')
+			page     = max(self.get_int(query, 'page', 1), 1)
+			per_page = min(max(self.get_int(query, 'per_page', 48), 1), 200)
+			total, images = self.server.catalog((page - 1) * per_page, per_page)
+
 			f = BytesIO()
-			f.write('<html><head><title>Status for %s</title></head>\n' % self.path)
-			f.write('<body>\n<h2>Status update</h2>\n')
-			f.write('<pre style="white-space: pre-wrap;"><code>%s</code></pre>\n' % json.dumps({'TODO': 'something'}).encode('utf-8') )
-			f.write('</body>\n</html>')
+			f.write( json.dumps({'total': total, 'page': page, 'per_page': per_page, 'images': images}).encode('utf-8') )
 			f.seek(0)
-			content_type = 'text/html'
+			content_type = 'application/json'
 			content_length = len(f.getvalue())
+		elif (self.path.startswith('/api/thumbnail?')):
+			# a small version of an image, made once and kept on disk
+			query = parse_qs(self.path.split('?', 1)[1])
+			path  = self.get_thumbnail_path(query.get('id', [''])[0], self.get_int(query, 'size', 240))
+			if (path is None):
+				return self.send_error(404, "File not found")
+			return self.send_file_head(path)
 		else:
 			# handle a static response (return a file)
-			path = self.translate_path(self.path)
-			if ('/phototype' in path):
-				path = path.replace('/phototype','/phototype/uploader')
-
-			if os.path.isdir(path):
-				for index in "index.html", "index.htm":
-					index = os.path.join(path, index)
-					if os.path.exists(index):
-						path = index
-						break
-				else:
-					return self.send_error(403, "Nothing to see here")
-			content_type = self.guess_type(path)
-			if content_type.startswith('text/'):
-				mode = 'rb'
-			else:
-				mode = 'rb'
-			try:
-				f = open(path, mode)
-				content_length = os.stat(path).st_size
-			except IOError:
-				self.send_error(404, "File not found")
-				return None
+			return self.send_static_head()
 
 		# common code to respond
 		self.send_response(200)
@@ -186,16 +549,188 @@ class ResponseHandler (BaseHTTPRequestHandler):
 		self.end_headers()
 		return f
 
+	def send_static_head (self):
+		"""Sends headers for a static file, returns the file or None.
+
+		Files are sent with an ETag and Last-Modified date, so a browser
+		can check back and get a 304 Not Modified instead of the file.
+		Versioned URLs (with ?v=...) never change and are cached for long.
+
+		"""
+		path = self.translate_path(self.path)
+		if ('/phototype' in path):
+			path = path.replace('/phototype','/phototype/uploader')
+
+		if os.path.isdir(path):
+			for index in "index.html", "index.htm":
+				index = os.path.join(path, index)
+				if os.path.exists(index):
+					path = index
+					break
+			else:
+				return self.send_error(403, "Nothing to see here")
+		return self.send_file_head(path)
+
+	""" Sends headers for a file at the given path, returns the file or None """
+	def send_file_head (self, path):
+		content_type = self.guess_type(path)
+
+		try:
+			stat = os.stat(path)
+		except OSError:
+			self.send_error(404, "File not found")
+			return None
+
+		# use a compressed copy if the client can handle it
+		encoding = None
+		if (content_type in self.compressible_types and 'gzip' in self.headers.get('Accept-Encoding', '')):
+			gzip_path = self.get_gzip_path(path, stat)
+			if (gzip_path is not None):
+				path     = gzip_path
+				encoding = 'gzip'
+
+		etag          = '"{0:x}-{1:x}{2}"'.format(stat.st_mtime_ns, stat.st_size, '-gz' if encoding else '')
+		last_modified = self.date_time_string(stat.st_mtime)
+		cache_control = 'no-cache'  # may be kept, but check back each time
+		if ('?v=' in self.path or '&v=' in self.path):
+			cache_control = 'public, max-age=31536000, immutable'
+
+		if (self.is_not_modified(etag, stat.st_mtime)):
+			self.send_response(304)
+			self.send_header("ETag", etag)
+			self.send_header("Cache-Control", cache_control)
+			self.end_headers()
+			return None
+
+		try:
+			f = open(path, 'rb')
+		except IOError:
+			self.send_error(404, "File not found")
+			return None
+
+		self.send_response(200)
+		self.send_header("Content-Type", content_type)
+		self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+		if (encoding is not None):
+			self.send_header("Content-Encoding", encoding)
+		if (content_type in self.compressible_types):
+			self.send_header("Vary", "Accept-Encoding")
+		self.send_header("ETag", etag)
+		self.send_header("Last-Modified", last_modified)
+		self.send_header("Cache-Control", cache_control)
+		self.end_headers()
+		return f
+
+	""" Returns True if the client's cached copy (if any) is still valid """
+	def is_not_modified (self, etag, mtime):
+		# ETag takes precedence, if given
+		if ('If-None-Match' in self.headers):
+			tags = [tag.strip() for tag in self.headers['If-None-Match'].split(',')]
+			return (etag in tags or '*' in tags)
+
+		if ('If-Modified-Since' in self.headers):
+			since = parsedate_tz(self.headers['If-Modified-Since'])
+			if (since is not None):
+				# the header has a resolution of seconds only
+				return (int(mtime) <= mktime_tz(since))
+
+		return False
+
+	""" Returns the path to an up-to-date gzipped copy of a file, creating one if necessary """
+	def get_gzip_path (self, path, stat):
+		gzip_path = path + '.gz'
+		try:
+			if (os.stat(gzip_path).st_mtime >= stat.st_mtime):
+				return gzip_path
+		except OSError:
+			pass
+
+		# (re)create it, via a temporary file so other threads never send a partial copy
+		temp_path = '{0}-{1}'.format(gzip_path, threading.get_ident())
+		try:
+			with open(path, 'rb') as f_in, gzip.open(temp_path, 'wb', compresslevel=9) as f_out:
+				shutil.copyfileobj(f_in, f_out)
+			os.replace(temp_path, gzip_path)
+			return gzip_path
+		except OSError:
+			# no write access, just send the original
+			if (os.path.exists(temp_path)):
+				os.remove(temp_path)
+			return None
+
+	""" Returns the path to an up-to-date thumbnail of a library image, making one if necessary
+		Returns None if there is no such image (or it can't be read). """
+	def get_thumbnail_path (self, image_id, size=240):
+		if (self.server.image_folder is None or self.server.thumbnail_folder is None):
+			return None
+		# only plain filenames of images in the library itself
+		if (re.match(r'^[\w.()+-]+\.jpe?g$', image_id, re.IGNORECASE) is None or image_id.startswith('.')):
+			return None
+		# only a few sizes are made, so an image never has more than a few thumbnails (rounded up, to stay sharp)
+		sizes = self.server.thumbnail_sizes
+		size  = min([s for s in sizes if s >= size] or [max(sizes)])
+
+		image_path = os.path.join(self.server.image_folder, image_id)
+		thumb_path = os.path.join(self.server.thumbnail_folder, '{0}-{1}.jpg'.format(os.path.splitext(image_id)[0], size))
+		try:
+			image_mtime = os.stat(image_path).st_mtime
+		except OSError:
+			# no longer in the library, so its thumbnails can go as well
+			self.server.remove_thumbnails(image_id)
+			return None
+
+		with self.server.thumbnail_lock:
+			# it may have been made while waiting for the lock
+			try:
+				if (os.stat(thumb_path).st_mtime >= image_mtime):
+					return thumb_path
+			except OSError:
+				pass
+
+			# (re)create it, via a temporary file so other threads never send a partial copy
+			temp_path = thumb_path + '-tmp'
+			try:
+				os.makedirs(self.server.thumbnail_folder, exist_ok=True)
+				image = PIL_Image.open(image_path)
+				# let the JPEG decoder scale down already, which is much quicker than a full decode
+				image.draft('RGB', (size, size))
+				image = image.convert('RGB')
+				image.thumbnail((size, size), PIL_Image.BILINEAR)
+				image.save(temp_path, 'JPEG', quality=80)
+				os.replace(temp_path, thumb_path)
+				return thumb_path
+			except (IOError, OSError, SyntaxError):
+				if (os.path.exists(temp_path)):
+					os.remove(temp_path)
+				return None
+
 	def do_POST (self):
 		"""Serve a POST request."""
+		with tracing.span('http.post', args={'path': self.path}):
+			self.handle_post()
+
+	def handle_post (self):
 		f = None
 		content_type   = 'text/plain'
 		content_length = 0
 
 		# handle a dynamic response
 		if (self.path == '/upload' or self.path == '/upload/'):
+			# rather than accepting more than can be handled, ask the client to come back later
+			refusal = self.check_admission()
+			if (refusal is None and not self.server.upload_slots.acquire(timeout=self.timeout)):
+				refusal = ("Too many uploads at once, try again later", 5)
+			if (refusal is not None):
+				self.server.count('refused')
+				if (not self.discard_body()):
+					self.close_connection = True  # as the request body is left unread
+				return self.send_busy(*refusal)
+
 			# first, handle the uploaded data
-			result, info = self.handle_post_data()
+			try:
+				result, info = self.handle_post_data()
+			finally:
+				self.server.upload_slots.release()
 			#print(result, info)
 
 			f = BytesIO()
@@ -204,6 +739,13 @@ class ResponseHandler (BaseHTTPRequestHandler):
 			content_type = 'application/json'
 			content_length = len(f.getvalue())
 
+			# any data left unread would be mistaken for the next request
+			if (result is False):
+				self.server.count('failed')
+				self.close_connection = True
+		else:
+			self.close_connection = True
+
 		# common code to respond
 		self.send_response(200)
 		self.send_header("Content-Type", content_type)
@@ -215,65 +757,367 @@ class ResponseHandler (BaseHTTPRequestHandler):
 			self.copyfile(f, self.wfile)
 			f.close()
 
-	# via: see: https://gist.github.com/UniIsland/3346170
+	""" Returns metrics of the application (if available) and of this server, see Photocore.get_runtime_metrics() """
+	def get_metrics (self):
+		metrics = []
+		if (self.server.metrics is not None):
+			metrics = self.server.metrics()
+
+		counters = self.server.get_counters()
+		metrics.extend([
+			('uploads_total',            'counter', 'Files uploaded', counters['uploads']),
+			('upload_duplicates_total',  'counter', 'Uploads dropped as duplicates', counters['duplicates']),
+			('upload_failures_total',    'counter', 'Upload requests that failed', counters['failed']),
+			('upload_refusals_total',    'counter', 'Upload requests turned away while busy or full', counters['refused']),
+			('upload_bytes_total',       'counter', 'Size of upload requests', counters['bytes']),
+			('http_connections_waiting', 'gauge',   'Connections waiting for a worker', self.server.request_queue.qsize())
+		])
+		return metrics
+
+	""" Returns metrics in the Prometheus text exposition format """
+	def format_metrics_text (self, metrics, prefix='phototype_'):
+		lines = []
+		for name, kind, description, value in metrics:
+			if (value is None):
+				continue
+			lines.append('# HELP {0}{1} {2}'.format(prefix, name, description))
+			lines.append('# TYPE {0}{1} {2}'.format(prefix, name, kind))
+			if (kind == 'summary'):
+				lines.extend(self.format_labelled_values(prefix + name, value['quantiles']))
+				lines.append('{0}{1}_sum {2}'.format(prefix, name, float(value['sum'])))
+				lines.append('{0}{1}_count {2}'.format(prefix, name, float(value['count'])))
+			elif (isinstance(value, list)):
+				lines.extend(self.format_labelled_values(prefix + name, value))
+			else:
+				lines.append('{0}{1} {2}'.format(prefix, name, float(value)))
+		return '\n'.join(lines) + '\n'
+
+	def format_labelled_values (self, name, values):
+		lines = []
+		for labels, labelled_value in values:
+			label_string = ','.join('{0}="{1}"'.format(k, str(v).replace('"', '\\"')) for k, v in sorted(labels.items()))
+			lines.append('{0}{{{1}}} {2}'.format(name, label_string, float(labelled_value)))
+		return lines
+
+	""" Returns metrics as a dictionary, with labelled values keyed by their label values """
+	def format_metrics_json (self, metrics):
+		result = {}
+		for name, kind, description, value in metrics:
+			if (kind == 'summary'):
+				summary = {'sum': value['sum'], 'count': value['count']}
+				for labels, labelled_value in value['quantiles']:
+					summary[labels['quantile']] = labelled_value
+				value = summary
+			elif (isinstance(value, list)):
+				value = {','.join(str(v) for k, v in sorted(labels.items())): labelled_value for labels, labelled_value in value}
+			result[name] = value
+		return result
+
+	""" Returns a (message, seconds to retry after) tuple if an upload can't be taken in now, or None """
+	def check_admission (self):
+		pending = self.server.import_pending
+		if (pending is not None and pending.value >= self.server.max_pending):
+			return ("Device is busy importing earlier uploads, try again later", 10)
+
+		try:
+			length = int(self.headers['content-length'])
+		except (TypeError, ValueError):
+			length = 0
+		try:
+			free_space = shutil.disk_usage(self.get_upload_folder()).free
+		except OSError:
+			return None
+		if (free_space - length < self.server.min_free_mb * 1024 * 1024):
+			return ("Device is running out of storage space", 300)
+
+		return None
+
+	""" Reads and drops a (chunk-sized) request body, so the client sees the response rather than
+		a reset connection. Returns False if the body is too large to bother, and is left unread. """
+	def discard_body (self, max_length=2097152):
+		try:
+			length = int(self.headers['content-length'])
+		except (TypeError, ValueError):
+			return False
+		if (length > max_length):
+			return False
+
+		while (length > 0):
+			data = self.rfile.read(min(length, 65536))
+			if (not data):
+				return False
+			length -= len(data)
+		return True
+
+	""" Responds with 503 Service Unavailable, telling the client when to try again """
+	def send_busy (self, message, retry_after):
+		body = json.dumps({'success': False, 'info': message}).encode('utf-8')
+
+		self.send_response(503, message)
+		self.send_header("Content-Type", 'application/json')
+		self.send_header("Content-Length", str(len(body)))
+		self.send_header("Retry-After", str(retry_after))
+		self.end_headers()
+		self.wfile.write(body)
+
 	def handle_post_data (self):
 		content_type = self.headers['content-type']
-		if not content_type:
+		boundary     = None
+		if (content_type):
+			boundary = re.search(r'boundary="?([^";]+)"?', content_type)
+		if (not boundary):
 			return (False, "Content-Type header doesn't contain boundary")
-		
-		boundary = content_type.split("=")[1].encode()
-		remaining_bytes = int(self.headers['content-length'])
-		line = self.rfile.readline()
-		remaining_bytes -= len(line)
-		if not boundary in line:
-			return (False, "Content does NOT begin with boundary")
-		
-		line = self.rfile.readline()
-		remaining_bytes -= len(line)
-		filename = re.findall(r'Content-Disposition.*name="file"; filename="(.*)"', line.decode())
-		if not filename:
+		boundary = boundary.group(1).encode()
+
+		try:
+			content_length = int(self.headers['content-length'])
+		except (TypeError, ValueError):
+			return (False, "Content-Length header is missing")
+		self.server.count('bytes', content_length)
+
+		path = self.get_upload_folder()
+
+		parser    = MultipartParser(self.rfile, boundary, content_length)
+		fields    = {}
+		filenames = []
+		part_path = None
+		try:
+			while (True):
+				headers = parser.next_part()
+				if (headers is None):
+					break
+
+				disposition = headers.get('content-disposition', '')
+				name        = re.findall(r'\bname="(.*?)"', disposition)
+				filename    = re.findall(r'\bfilename="(.*?)"', disposition)
+
+				if (not filename):
+					# a regular form field, keep its (limited) value
+					value = parser.read_body(limit=4096)
+					if (name):
+						fields[name[0]] = value.decode('utf-8', 'replace')
+					continue
+
+				filename = self.sanitize_filename(filename[0])
+				if (not filename):
+					parser.read_body(out=None)  # skip
+					continue
+
+				# a chunk of a larger file (as sent by Dropzone, with fields preceding the file)
+				if ('dzuuid' in fields):
+					result, info = self.handle_chunk(fields, filename, parser)
+					if (result is False):
+						return (result, info)
+					if (info is not None):
+						filenames.append(info)
+					continue
+
+				# filename gets -part added to its name, which is removed upon completion
+				# this avoids other processes potentially using a non-complete file
+				part_path = os.path.join(path, filename + '-part')
+				try:
+					out = open(part_path, 'wb')
+				except IOError as ioe:
+					#print(ioe)
+					parser.read_body(out=None)
+					part_path = None
+					return (False, "Can't create file to write, do you have permission to write?")
+				with out:
+					writer = HashingWriter(out)
+					parser.read_body(out=writer)
+
+				result, info = self.complete_upload(part_path, os.path.join(path, filename), writer.hexdigest(), fields)
+				part_path = None
+				if (result is False):
+					return (result, info)
+				if (info is not None):
+					filename += ' (duplicate)'
+				filenames.append(filename)
+		except MultipartError as me:
+			# remove what's left of an incomplete file
+			if (part_path is not None and os.path.exists(part_path)):
+				os.remove(part_path)
+			return (False, str(me))
+
+		if ('dzuuid' in fields and not filenames):
+			return (True, "Chunk received")
+		if (not filenames):
 			return (False, "Can't find out file name...")
-		
-		path = self.translate_path(self.path)
-		#print(self.path, path)
-		if (self.path == '/upload'):
-			path = path.replace('/phototype/upload','/uploads')
-		
-		# filename gets -part added to its name, which is removed upon completion
-		# this avoids other processes potentially using a non-complete file
-		filename = os.path.join(path, filename[0] + '-part')
-		line = self.rfile.readline()
-		remaining_bytes -= len(line)
-		line = self.rfile.readline()
-		remaining_bytes -= len(line)
+		return (True, "File '%s' upload success!" % "', '".join(filenames))
+
+	""" Writes a chunk into place within the -part file, and completes the file once all chunks are in
+		Received chunks are recorded in a .json file alongside, so an upload can be resumed later on.
+		Returns (True, filename) when the file is complete, (True, None) if not yet, or (False, reason). """
+	def handle_chunk (self, fields, filename, parser):
+		uuid = fields['dzuuid']
+		try:
+			index       = int(fields['dzchunkindex'])
+			chunk_count = int(fields['dztotalchunkcount'])
+			offset      = int(fields['dzchunkbyteoffset'])
+			total_size  = int(fields['dztotalfilesize'])
+		except (KeyError, ValueError):
+			return (False, "Chunk information is missing")
+		if (not self.is_valid_uuid(uuid) or not (0 <= index < chunk_count) or not (0 <= offset < total_size)):
+			return (False, "Chunk information is invalid")
+
+		part_path, record_path = self.get_chunk_paths(uuid)
+
+		with self.server.chunk_lock:
+			record = self.read_chunk_record(record_path)
+			if (record is None or record['size'] != total_size or record['count'] != chunk_count):
+				# new upload (or a different file under the same id), so start afresh
+				self.remove_stale_chunks()
+				record = {'filename': filename, 'size': total_size, 'count': chunk_count, 'received': [], 'complete': False}
+				if (os.path.exists(part_path)):
+					os.remove(part_path)
+			elif (record['complete']):
+				# already done, this chunk arrived again as its response got lost
+				parser.read_body(out=None)
+				return (True, None)
+
+		# chunks only ever cover their own range, so these writes need no lock
 		try:
-			out = open(filename, 'wb')
-		except IOError as ioe:
-			#print(ioe)
+			fd = os.open(part_path, os.O_WRONLY | os.O_CREAT, 0o644)
+		except OSError as ose:
+			#print(ose)
 			return (False, "Can't create file to write, do you have permission to write?")
-				
-		pre_line = self.rfile.readline()
-		remaining_bytes -= len(pre_line)
-		while remaining_bytes > 0:
-			line = self.rfile.readline()
-			remaining_bytes -= len(line)
-			if boundary in line:
-				pre_line = pre_line[0:-1]
-				if pre_line.endswith(b'\r'):
-					pre_line = pre_line[0:-1]
-				out.write(pre_line)
-				out.close()
-
-				# correct file by removing -part
-				os.rename(filename, filename.replace('-part',''))
-
-
-				return (True, "File '%s' upload success!" % filename)
-			else:
-				out.write(pre_line)
-				pre_line = line
-		
-		return (False, "Unexpected end of data.")
+		with os.fdopen(fd, 'wb') as out:
+			out.seek(offset)
+			parser.read_body(out=out)
+
+		with self.server.chunk_lock:
+			record = self.read_chunk_record(record_path) or record
+			if (index not in record['received']):
+				record['received'].append(index)
+			if (len(record['received']) < chunk_count or record['complete']):
+				self.write_chunk_record(record_path, record)
+				return (True, None)
+
+			# all chunks are in, which should add up to the whole file
+			if (os.path.getsize(part_path) != total_size):
+				os.remove(part_path)
+				os.remove(record_path)
+				return (False, "Chunks don't add up to the file size")
+
+			# chunks may have arrived in any order, so only now can the whole be hashed
+			content_hash = sha256()
+			with open(part_path, 'rb') as f:
+				for data in iter(lambda: f.read(65536), b''):
+					content_hash.update(data)
+
+			file_path    = os.path.join(self.get_upload_folder(), record['filename'])
+			result, info = self.complete_upload(part_path, file_path, content_hash.hexdigest(), fields)
+			if (result is False):
+				os.remove(record_path)
+				return (result, info)
+
+			record['complete'] = True
+			self.write_chunk_record(record_path, record)
+
+		return (True, record['filename'])
+
+	""" Checks a received file against its hashes, then moves it in place for the importer
+		Duplicates of known content are dropped (but count as a successful upload). """
+	def complete_upload (self, part_path, file_path, digest, fields):
+		# the client may have sent a hash of what it sent, which should match
+		if (fields.get('sha256', digest).lower() != digest):
+			os.remove(part_path)
+			return (False, "File is corrupted (hash mismatch)")
+
+		# a hash of the file before the client resized it helps recognise it next time
+		hashes = [digest]
+		source = fields.get('source_sha256', '').lower()
+		if (self.is_valid_hash(source) and source != digest):
+			hashes.append(source)
+
+		index = self.server.content_index
+		if (index is not None):
+			if (index.contains(digest)):
+				os.remove(part_path)
+				self.server.count('duplicates')
+				return (True, "Duplicate of a file uploaded before")
+			index.add_pending(hashes)
+
+		# correct file by removing -part
+		os.rename(part_path, file_path)
+		self.server.count('uploads')
+
+		# let the importer know right away
+		if (self.server.import_queue is not None):
+			if (self.server.import_pending is not None):
+				with self.server.import_pending.get_lock():
+					self.server.import_pending.value += 1
+			uploaded_at = time.time()
+			# the upload time identifies this upload in a trace, across processes
+			tracing.flow('upload', int(uploaded_at * 1e6), 's')
+			self.server.import_queue.put((file_path, uploaded_at, hashes))
+
+		return (True, None)
+
+	""" Returns which chunks of an upload have been received so far """
+	def get_chunk_status (self, uuid):
+		with self.server.chunk_lock:
+			record = self.read_chunk_record(self.get_chunk_paths(uuid)[1])
+		if (record is None):
+			return {'received': [], 'complete': False}
+		return {'received': sorted(record['received']), 'size': record['size'], 'complete': record['complete']}
+
+	def get_chunk_paths (self, uuid):
+		part_path = os.path.join(self.get_upload_folder(), uuid + '-part')
+		return (part_path, part_path + '.json')
+
+	def read_chunk_record (self, record_path):
+		try:
+			with open(record_path, 'r') as f:
+				return json.load(f)
+		except (IOError, ValueError):
+			return None
+
+	def write_chunk_record (self, record_path, record):
+		with open(record_path + '-tmp', 'w') as f:
+			json.dump(record, f)
+		os.replace(record_path + '-tmp', record_path)
+
+	""" Removes records and partial files of chunked uploads untouched for a day """
+	def remove_stale_chunks (self, max_age=86400):
+		folder = self.get_upload_folder()
+		now    = time.time()
+		for filename in os.listdir(folder):
+			if (filename.endswith(('-part', '-part.json'))):
+				file_path = os.path.join(folder, filename)
+				try:
+					if (os.path.getmtime(file_path) < now - max_age):
+						os.remove(file_path)
+				except OSError:
+					pass
+
+	""" Returns an integer query parameter, or default if it's missing or invalid """
+	def get_int (self, query, name, default):
+		try:
+			return int(query[name][0])
+		except (KeyError, ValueError):
+			return default
+
+	def is_valid_hash (self, digest):
+		return (re.match(r'^[0-9a-f]{64}$', digest) is not None)
+
+	def is_valid_uuid (self, uuid):
+		return (re.match(r'^[0-9a-f-]{8,64}$', uuid) is not None)
+
+	""" Returns the folder where uploads are stored """
+	def get_upload_folder (self):
+		return self.translate_path('/upload').replace('/phototype/upload','/uploads')
+
+	""" Returns a filename safe to use within the uploads folder, or None """
+	def sanitize_filename (self, filename):
+		# some browsers send the full client-side path, only keep the last bit
+		filename = filename.replace('\\', '/').split('/')[-1]
+		# leave out any characters that could upset the file system or shell
+		filename = re.sub(r'[^\w .()+-]', '_', filename).strip(' .')
+		if (not filename):
+			return None
+		return filename[:128]
+
 
 	def translate_path(self, path):
 		"""Translate a /-separated PATH to the local filename syntax.
@@ -283,6 +1127,8 @@ class ResponseHandler (BaseHTTPRequestHandler):
 		probably be diagnosed.)
 
 		"""
+		# leave out query or fragment (used for versioning, e.g. ?v=1)
+		path = path.split('?', 1)[0].split('#', 1)[0]
 		path = posixpath.normpath(url_unquote(path))
 		words = path.split('/')
 		words = filter(None, words)
@@ -302,8 +1148,14 @@ class ResponseHandler (BaseHTTPRequestHandler):
 		argument is a file object open for writing (or
 		anything with a write() method).
 
+		Data going to the client is sent with sendfile where possible,
+		leaving the copying to the kernel.
+
 		"""
-		shutil.copyfileobj(source, outputfile)
+		if (outputfile is self.wfile):
+			self.connection.sendfile(source)
+		else:
+			shutil.copyfileobj(source, outputfile)
 
 	def guess_type(self, path):
 		"""Guess the type of a file.
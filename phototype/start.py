@@ -0,0 +1,16 @@
+#!/usr/bin/python3
+# coding: utf-8
+
+"""
+This script starts photocore, and is the one to run (e.g., sudo python3 start.py -debug).
+
+Worker processes are spawned (see workers.py), and a spawned process imports the main
+script again. Kept this thin, that costs a worker next to nothing. With photocore.py as
+the main script instead, every worker would load all of photocore (pygame included).
+For the same reason, photocore is only imported once this runs as the main script.
+"""
+
+""" Unless this script is imported, do the following """
+if __name__ == '__main__':
+	import photocore
+	photocore.main()
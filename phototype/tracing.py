@@ -0,0 +1,253 @@
+#!/usr/bin/python3
+# coding: utf-8
+
+# ----- IMPORT LIBRARIES ------------------------------------------------------
+
+from collections import deque
+import json
+import os
+import threading
+import time
+
+# ----- CLASSES ---------------------------------------------------------------
+
+
+"""
+Tracer keeps the most recent trace events of a process in a ring buffer.
+Events follow the Chrome trace event format, so a merged trace opens in chrome://tracing
+or in Perfetto (ui.perfetto.dev). Each process writes its buffer to a file in the trace
+folder every few seconds, and the process that enabled tracing merges all on export.
+
+Tracing is off unless enabled, and then recording an event only appends to the buffer.
+Processes started later (via fork or spawn) continue tracing with a fresh buffer of their own.
+"""
+class Tracer ():
+	def __init__ (self):
+		self.enabled        = False
+		self.folder         = None
+		self.size           = 20000  # number of events kept per process
+		self.flush_interval = 2      # in seconds, for processes other than the main one
+		self.main_pid       = None
+		self.pid            = None
+		self.events         = deque(maxlen=self.size)
+		self.metadata       = []     # process and thread names, these don't get overwritten
+		self.threads        = set()  # ids of threads with a name in metadata
+		self.lock           = threading.Lock()
+		self.dirty          = False
+		self.flusher        = None
+
+		# processes started via spawn (rather than fork) pick up tracing via the environment
+		if (os.environ.get('PHOTOTYPE_TRACE')):
+			self.enable(os.environ['PHOTOTYPE_TRACE'], main_pid=int(os.environ.get('PHOTOTYPE_TRACE_PID', 0)))
+
+	""" Starts tracing, with per-process files kept in folder
+		The process calling this is the main one, unless main_pid says otherwise. """
+	def enable (self, folder='traces', size=None, main_pid=None):
+		if (size is not None):
+			self.size = size
+		self.folder   = folder
+		self.main_pid = main_pid or os.getpid()
+		self.enabled  = True
+		self.start_process(os.getpid())
+
+		if (self.is_main()):
+			os.makedirs(self.folder, exist_ok=True)
+			# files left by an earlier run would get mixed in
+			for filename in os.listdir(self.folder):
+				if (filename.startswith('trace-') and filename.endswith('.json')):
+					os.remove(os.path.join(self.folder, filename))
+
+			os.environ['PHOTOTYPE_TRACE']     = self.folder
+			os.environ['PHOTOTYPE_TRACE_PID'] = str(self.main_pid)
+
+	def is_main (self):
+		return (os.getpid() == self.main_pid)
+
+	""" Resets the buffer, as a forked process would otherwise carry over its parent's events """
+	def start_process (self, pid):
+		self.pid      = pid
+		self.events   = deque(maxlen=self.size)
+		self.metadata = []
+		self.threads  = set()
+		self.lock     = threading.Lock()
+		self.dirty    = False
+		self.flusher  = None
+
+		if (not self.is_main()):
+			self.flusher = threading.Thread(target=self.run_flusher, name='tracing')
+			self.flusher.daemon = True
+			self.flusher.start()
+
+	""" Adds an event, filling in process and thread """
+	def add (self, event):
+		pid = os.getpid()
+		if (pid != self.pid):
+			self.start_process(pid)
+
+		thread = threading.current_thread()
+		event['pid'] = pid
+		event['tid'] = thread.ident
+
+		with self.lock:
+			if (thread.ident not in self.threads):
+				self.threads.add(thread.ident)
+				self.metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread.ident,
+					'args': {'name': thread.name}})
+			self.events.append(event)
+			self.dirty = True
+
+	def span (self, name, category='phototype', args=None):
+		if (not self.enabled):
+			return NO_SPAN
+		return Span(self, name, category, args)
+
+	""" Marks a moment in time, rather than a duration """
+	def instant (self, name, category='phototype', args=None):
+		if (self.enabled):
+			self.add({'name': name, 'cat': category, 'ph': 'i', 's': 't', 'ts': time.time() * 1e6, 'args': args or {}})
+
+	""" Links spans across threads or processes (such as the steps of a single upload)
+		Phase is 's' for the first step, 't' for intermediate ones, and 'f' for the last.
+		Each step has to be called from within a span, which it then gets attached to. """
+	def flow (self, name, flow_id, phase='t', category='flow'):
+		if (self.enabled):
+			event = {'name': name, 'cat': category, 'ph': phase, 'id': flow_id, 'ts': time.time() * 1e6}
+			if (phase == 'f'):
+				event['bp'] = 'e'  # attach to the enclosing span, rather than the next one
+			self.add(event)
+
+	def set_process_name (self, name):
+		if (self.enabled):
+			pid = os.getpid()
+			if (pid != self.pid):
+				self.start_process(pid)
+			with self.lock:
+				self.metadata.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': name}})
+				self.dirty = True
+
+	""" Returns a copy of this process's events, metadata first """
+	def get_events (self):
+		with self.lock:
+			return self.metadata + list(self.events)
+
+	""" Writes this process's events to its file in the trace folder """
+	def flush (self):
+		if (not self.enabled):
+			return
+		path = os.path.join(self.folder, 'trace-{0}.json'.format(os.getpid()))
+		self.dirty = False
+		with open(path + '-tmp', 'w') as f:
+			json.dump(self.get_events(), f)
+		os.replace(path + '-tmp', path)
+
+	""" This is the code that the flusher thread (in processes other than the main one) will run """
+	def run_flusher (self):
+		while (True):
+			time.sleep(self.flush_interval)
+			if (self.dirty):
+				try:
+					self.flush()
+				except (IOError, OSError):
+					pass  # not critical, try again next time
+
+	""" Returns a merged trace of all processes, as a dictionary ready to be saved as JSON """
+	def get_trace (self):
+		events = self.get_events()
+		own    = 'trace-{0}.json'.format(os.getpid())
+
+		if (self.enabled):
+			for filename in sorted(os.listdir(self.folder)):
+				if (filename.startswith('trace-') and filename.endswith('.json') and filename != own):
+					try:
+						with open(os.path.join(self.folder, filename), 'r') as f:
+							events.extend(json.load(f))
+					except (IOError, ValueError):
+						pass  # a process may be writing it, or gone in the middle of it
+
+		return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+	""" Saves a merged trace of all processes to a file """
+	def export (self, path='trace.json'):
+		if (not self.enabled):
+			return
+		with open(path, 'w') as f:
+			json.dump(self.get_trace(), f)
+
+
+""" Span records the time spent within a with-block as a complete ('X') event """
+class Span ():
+	def __init__ (self, tracer, name, category, args):
+		self.tracer   = tracer
+		self.name     = name
+		self.category = category
+		self.args     = args
+		self.start    = 0
+
+	def __enter__ (self):
+		self.start = time.time()
+		return self
+
+	def __exit__ (self, exc_type, exc_value, exc_traceback):
+		end   = time.time()
+		event = {'name': self.name, 'cat': self.category, 'ph': 'X', 'ts': self.start * 1e6, 'dur': (end - self.start) * 1e6}
+		if (self.args):
+			event['args'] = self.args
+		self.tracer.add(event)
+		return False
+
+	""" Adds details that are only known within the span """
+	def set_arg (self, key, value):
+		if (self.args is None):
+			self.args = {}
+		self.args[key] = value
+
+
+""" NoSpan stands in for a span while tracing is off, so calling code doesn't need to check """
+class NoSpan ():
+	def __enter__ (self):
+		return self
+
+	def __exit__ (self, exc_type, exc_value, exc_traceback):
+		return False
+
+	def set_arg (self, key, value):
+		pass
+
+
+NO_SPAN = NoSpan()
+
+# ----- FUNCTIONS -------------------------------------------------------------
+
+# a single tracer per process, used via the functions below
+
+tracer = Tracer()
+
+def enable (folder='traces', size=None):
+	tracer.enable(folder, size)
+
+def is_enabled ():
+	return tracer.enabled
+
+""" Returns a context manager that records the time spent within it, e.g.:
+	with tracing.span('images.import', args={'file': path}):
+		... """
+def span (name, category='phototype', args=None):
+	return tracer.span(name, category, args)
+
+def instant (name, category='phototype', args=None):
+	tracer.instant(name, category, args)
+
+def flow (name, flow_id, phase='t', category='flow'):
+	tracer.flow(name, flow_id, phase, category)
+
+def set_process_name (name):
+	tracer.set_process_name(name)
+
+def flush ():
+	tracer.flush()
+
+def get_trace ():
+	return tracer.get_trace()
+
+def export (path='trace.json'):
+	tracer.export(path)
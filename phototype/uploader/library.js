@@ -0,0 +1,105 @@
+/**
+ * Image library UI
+ */
+
+// --- Main functions ----------------------------------------------------------
+
+var Library = {};
+
+Library.init = function () {
+	Library.page    = 1;
+	Library.perPage = 48;
+
+	// get elements
+	Library.summary  = document.getElementById('library_summary');
+	Library.grid     = document.getElementById('library_grid');
+	Library.previous = document.getElementById('previous_page');
+	Library.next     = document.getElementById('next_page');
+
+	// set event listeners
+	Library.previous.addEventListener('click', function () {
+		Library.load(Library.page - 1);
+	}, false);
+	Library.next.addEventListener('click', function () {
+		Library.load(Library.page + 1);
+	}, false);
+
+	Library.load(Library.page);
+};
+
+/**
+ * Gets a page of the library from the device, then shows it.
+ */
+Library.load = function (page) {
+	var request = new XMLHttpRequest();
+	request.open('GET', '/api/images?page=' + page + '&per_page=' + Library.perPage, true);
+	request.onload = function () {
+		if (request.status === 200) {
+			Library.show(JSON.parse(request.responseText));
+		} else {
+			Library.summary.textContent = 'The library is not available right now.';
+		}
+	};
+	request.onerror = function () {
+		Library.summary.textContent = 'Could not reach the device.';
+	};
+	request.send();
+};
+
+Library.show = function (result) {
+	var pages = Math.max(Math.ceil(result.total / result.per_page), 1);
+
+	Library.page = result.page;
+	Library.summary.textContent = result.total + ' images, page ' + result.page + ' of ' + pages;
+	Library.previous.disabled   = (result.page <= 1);
+	Library.next.disabled       = (result.page >= pages);
+
+	// replace the previous page
+	while (Library.grid.firstChild) {
+		Library.grid.removeChild(Library.grid.firstChild);
+	}
+
+	for (var i = 0; i < result.images.length; i++) {
+		var image   = result.images[i];
+		var item    = document.createElement('figure');
+		var img     = document.createElement('img');
+		var caption = document.createElement('figcaption');
+
+		item.className = 'library-item';
+		if (image.hidden_until) {
+			item.className += ' library-item-hidden';
+		}
+		// thumbnails change only with the image itself, so its date makes for a lasting url
+		img.src     = '/api/thumbnail?id=' + encodeURIComponent(image.id) + '&size=240&v=' + image.modified;
+		img.alt     = image.id;
+		img.loading = 'lazy';
+		caption.textContent = Library.describe(image);
+
+		item.appendChild(img);
+		item.appendChild(caption);
+		Library.grid.appendChild(item);
+	}
+
+	window.scrollTo(0, 0);
+};
+
+/**
+ * Returns a short description of an image's rating, use and whether it's hidden.
+ */
+Library.describe = function (image) {
+	var text = 'Rating ' + image.rate.toFixed(2) + ', shown ' + image.shown + (image.shown === 1 ? ' time' : ' times');
+	if (image.hidden_until) {
+		text += ', hidden until ' + new Date(image.hidden_until * 1000).toLocaleString();
+	}
+	return text;
+};
+
+// --- Initialise --------------------------------------------------------------
+
+/**
+ * Wait for whole page to load before setting up.
+ * Prevents problems with objects not loaded yet while trying to assign these.
+ */
+window.addEventListener('pageshow', function () {
+	Library.init();
+}, false);
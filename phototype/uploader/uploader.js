@@ -15,13 +15,27 @@ Uploader.init = function () {
 		Dropzone.instances[0].options.maxFilesize           = 25;   // in MB
 		Dropzone.instances[0].options.resizeHeight          = 1600; // resize to given height in pixels (2x800 to avoid quality issues)
 		Dropzone.instances[0].options.resizeQuality         = 1;    // in range 0..1 (default 0.8)
+		Dropzone.instances[0].options.chunking              = true; // send files in parts, so a dropped connection only costs one part
+		Dropzone.instances[0].options.chunkSize             = 500000; // in bytes
+		Dropzone.instances[0].options.retryChunks           = true;
+		Dropzone.instances[0].options.retryChunksLimit      = 5;
+		Dropzone.instances[0].options.accept                = Uploader.acceptFile;
+		Dropzone.instances[0].options.transformFile         = Uploader.transformFile;
+		Dropzone.instances[0].options.params                = Uploader.getChunkParams;
+
+		// skip chunks the server already has
+		Uploader.uploadData = Dropzone.instances[0]._uploadData;
+		Dropzone.instances[0]._uploadData = Uploader.uploadChunk;
+		// wait and try again when the device is busy
+		Uploader.handleError = Dropzone.instances[0]._handleUploadError;
+		Dropzone.instances[0]._handleUploadError = Uploader.handleUploadError;
 
 		// set events on Dropzone instance
 		Dropzone.instances[0].on("success", function (file) {
 			Uploader.onUploadSuccess();
 		});
 		Dropzone.instances[0].on("complete", function (file) {
-			if (file.upload.progress == 100) {
+			if (file.status === Dropzone.SUCCESS) {
 				this.removeFile(file);
 			}
 			// else something has gone wrong
@@ -44,6 +58,186 @@ Uploader.init = function () {
 	window.addEventListener('drop',      Uploader.onSourceFileDrop, false);
 };
 
+/**
+ * Checks whether the device has this file already, in which case it's not sent at all.
+ * Otherwise, gives a file an id that stays the same when it's added again (e.g., after a reload),
+ * then asks the server which of its chunks have arrived already, to resume from there.
+ */
+Uploader.acceptFile = function (file, done) {
+	file.upload.uuid      = Uploader.getFileId(file);
+	file.upload.received  = [];
+	file.upload.duplicate = false;
+
+	Uploader.hashFile(file, function (hash) {
+		file.upload.sourceHash = hash;
+		if (hash === null) {
+			return Uploader.getUploadStatus(file, done);
+		}
+
+		var request = new XMLHttpRequest();
+		request.open('GET', '/upload/check?sha256=' + hash, true);
+		request.onload = function () {
+			if (request.status === 200 && JSON.parse(request.responseText).exists) {
+				file.upload.duplicate = true;
+				done();
+			} else {
+				Uploader.getUploadStatus(file, done);
+			}
+		};
+		request.onerror = function () {
+			Uploader.getUploadStatus(file, done);
+		};
+		request.send();
+	});
+};
+
+Uploader.getUploadStatus = function (file, done) {
+	var request = new XMLHttpRequest();
+	request.open('GET', '/upload/status?uuid=' + file.upload.uuid, true);
+	request.onload = function () {
+		if (request.status === 200) {
+			var status = JSON.parse(request.responseText);
+			if (status.complete) {
+				// sent in full before, yet not on the device any more (or it would have been skipped),
+				// so send it again as a new upload, as the server takes chunks for this id as repeats
+				file.upload.uuid += '-' + Date.now().toString(16);
+			} else {
+				file.upload.received     = status.received;
+				file.upload.receivedSize = status.size;
+			}
+		}
+		done();
+	};
+	request.onerror = function () {
+		done();  // just upload everything
+	};
+	request.send();
+};
+
+/**
+ * Returns a hex id based on file name, modification date and size.
+ */
+Uploader.getFileId = function (file) {
+	var key  = file.name + '|' + file.lastModified;
+	var hash = 0x811c9dc5;  // FNV-1a
+	for (var i = 0; i < key.length; i++) {
+		hash = Math.imul(hash ^ key.charCodeAt(i), 0x01000193) >>> 0;
+	}
+	return ('0000000' + hash.toString(16)).slice(-8) + '-' + file.size.toString(16);
+};
+
+/**
+ * Resized files are smaller than the original, so base the chunks on the resized size.
+ */
+Uploader.transformFile = function (file, done) {
+	// no need to resize a file that won't be sent
+	if (file.upload.duplicate) {
+		return done(file);
+	}
+
+	Dropzone.prototype.defaultOptions.transformFile.call(this, file, function (transformedFile) {
+		var chunkSize = Dropzone.instances[0].options.chunkSize;
+		file.upload.transformedSize = transformedFile.size;
+		file.upload.totalChunkCount = Math.max(Math.ceil(transformedFile.size / chunkSize), 1);
+		// received chunks only count if they were part of the same file
+		if (file.upload.receivedSize !== transformedFile.size) {
+			file.upload.received = [];
+		}
+
+		// the server checks what it receives against this hash
+		Uploader.hashFile(transformedFile, function (hash) {
+			file.upload.hash = hash;
+			done(transformedFile);
+		});
+	});
+};
+
+/**
+ * Same as Dropzone's default, but with the size of the file as it's actually sent.
+ * Also adds the hashes of the file as sent, and as it was before resizing.
+ */
+Uploader.getChunkParams = function (files, xhr, chunk) {
+	var params = {};
+	if (files[0].upload.hash) {
+		params.sha256 = files[0].upload.hash;
+	}
+	if (files[0].upload.sourceHash) {
+		params.source_sha256 = files[0].upload.sourceHash;
+	}
+
+	if (chunk) {
+		params.dzuuid            = chunk.file.upload.uuid;
+		params.dzchunkindex      = chunk.index;
+		params.dztotalfilesize   = chunk.file.upload.transformedSize;
+		params.dzchunksize       = this.options.chunkSize;
+		params.dztotalchunkcount = chunk.file.upload.totalChunkCount;
+		params.dzchunkbyteoffset = chunk.index * this.options.chunkSize;
+	}
+	return params;
+};
+
+/**
+ * Replaces Dropzone's _uploadData, to leave out chunks the server already has.
+ */
+Uploader.uploadChunk = function (files, dataBlocks) {
+	var file = files[0];
+
+	// the device has this file already, so consider it done
+	if (file.upload.duplicate) {
+		var dropzone = this;
+		setTimeout(function () {
+			dropzone._finished(files, {'success': true, 'info': 'Duplicate of a file uploaded before'}, null);
+		}, 0);
+		return;
+	}
+
+	if (file.upload.chunked && file.upload.received.indexOf(dataBlocks[0].chunkIndex) !== -1) {
+		var chunk = file.upload.chunks[dataBlocks[0].chunkIndex];
+		chunk.progress  = 100;
+		chunk.total     = dataBlocks[0].data.size;
+		chunk.bytesSent = dataBlocks[0].data.size;
+		// continue as if the upload finished
+		setTimeout(function () {
+			file.upload.finishedChunkUpload(chunk);
+		}, 0);
+		return;
+	}
+
+	// kept to be able to send it again later
+	file.upload.dataBlocks = dataBlocks;
+	return Uploader.uploadData.call(this, files, dataBlocks);
+};
+
+/**
+ * Replaces Dropzone's _handleUploadError, to retry later if the device is too busy (503).
+ * The server tells how long to wait, otherwise the wait doubles with each try (up to a minute).
+ */
+Uploader.handleUploadError = function (files, xhr, response) {
+	var file = files[0];
+	if (xhr.status !== 503 || file.status === Dropzone.CANCELED) {
+		return Uploader.handleError.call(this, files, xhr, response);
+	}
+
+	var dropzone   = this;
+	var dataBlocks = file.upload.dataBlocks;
+	if (file.upload.chunked) {
+		dataBlocks = [this._getChunk(file, xhr).dataBlock];
+	}
+
+	file.upload.busyRetries = (file.upload.busyRetries || 0) + 1;
+	var delay = parseInt(xhr.getResponseHeader('Retry-After'), 10);
+	if (isNaN(delay)) {
+		delay = Math.min(Math.pow(2, file.upload.busyRetries), 60);
+	}
+	Uploader.uploadCounterFeedback.innerHTML = 'The device is busy, continuing in ' + delay + ' seconds.';
+
+	setTimeout(function () {
+		if (file.status !== Dropzone.CANCELED) {
+			dropzone._uploadData(files, dataBlocks);
+		}
+	}, delay * 1000);
+};
+
 Uploader.onUploadSuccess = function () {
 	Uploader.uploadCounter++;
 	Uploader.uploadCounterFeedback.innerHTML = Uploader.uploadCounter + ' already done!';
@@ -73,6 +267,127 @@ Uploader.onSourceFileDrop = function (inEvent) {
 	inEvent.preventDefault();
 };
 
+// --- Hashing -----------------------------------------------------------------
+
+/**
+ * Calls back with the SHA-256 hash (as hex string) of a file or blob.
+ * Browsers only offer crypto.subtle on secure (https) pages, which this isn't,
+ * so the hash is normally calculated by Uploader.sha256 below.
+ */
+Uploader.hashFile = function (file, callback) {
+	var reader = new FileReader();
+	reader.onload = function () {
+		if (window.crypto && window.crypto.subtle) {
+			window.crypto.subtle.digest('SHA-256', reader.result).then(function (digest) {
+				callback(Uploader.toHex(new Uint32Array(Uploader.swapBytes(digest))));
+			}, function () {
+				callback(Uploader.sha256(reader.result));
+			});
+		} else {
+			callback(Uploader.sha256(reader.result));
+		}
+	};
+	reader.onerror = function () {
+		callback(null);
+	};
+	reader.readAsArrayBuffer(file);
+};
+
+Uploader.SHA256_K = new Uint32Array([
+	0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+	0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+	0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+	0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+	0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+	0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+	0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+	0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2
+]);
+
+/**
+ * Returns the SHA-256 hash (as hex string) of an ArrayBuffer.
+ */
+Uploader.sha256 = function (buffer) {
+	var bytes  = new Uint8Array(buffer);
+	var length = bytes.length;
+	var blocks = (length + 9 + 63) >> 6;  // 64-byte blocks, including padding and length
+	var words  = new Uint32Array(blocks * 16);
+	var w      = new Uint32Array(64);
+	var k      = Uploader.SHA256_K;
+	var hash   = new Uint32Array([
+		0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19
+	]);
+	var i, t, a, b, c, d, e, f, g, h, s0, s1, t1, t2;
+
+	// big-endian words, followed by a 1 bit, zeros, and the length in bits
+	for (i = 0; i < length; i++) {
+		words[i >> 2] |= bytes[i] << (24 - (i & 3) * 8);
+	}
+	words[length >> 2] |= 0x80 << (24 - (length & 3) * 8);
+	words[blocks * 16 - 2] = Math.floor(length / 0x20000000);
+	words[blocks * 16 - 1] = length << 3;
+
+	for (i = 0; i < blocks * 16; i += 16) {
+		for (t = 0; t < 16; t++) {
+			w[t] = words[i + t];
+		}
+		for (t = 16; t < 64; t++) {
+			s0   = Uploader.rotr(w[t-15], 7) ^ Uploader.rotr(w[t-15], 18) ^ (w[t-15] >>> 3);
+			s1   = Uploader.rotr(w[t-2], 17) ^ Uploader.rotr(w[t-2], 19)  ^ (w[t-2] >>> 10);
+			w[t] = w[t-16] + s0 + w[t-7] + s1;
+		}
+
+		a = hash[0]; b = hash[1]; c = hash[2]; d = hash[3];
+		e = hash[4]; f = hash[5]; g = hash[6]; h = hash[7];
+
+		for (t = 0; t < 64; t++) {
+			s1 = Uploader.rotr(e, 6) ^ Uploader.rotr(e, 11) ^ Uploader.rotr(e, 25);
+			t1 = (h + s1 + ((e & f) ^ (~e & g)) + k[t] + w[t]) | 0;
+			s0 = Uploader.rotr(a, 2) ^ Uploader.rotr(a, 13) ^ Uploader.rotr(a, 22);
+			t2 = (s0 + ((a & b) ^ (a & c) ^ (b & c))) | 0;
+			h = g; g = f; f = e;
+			e = (d + t1) | 0;
+			d = c; c = b; b = a;
+			a = (t1 + t2) | 0;
+		}
+
+		hash[0] += a; hash[1] += b; hash[2] += c; hash[3] += d;
+		hash[4] += e; hash[5] += f; hash[6] += g; hash[7] += h;
+	}
+
+	return Uploader.toHex(hash);
+};
+
+Uploader.rotr = function (x, n) {
+	return (x >>> n) | (x << (32 - n));
+};
+
+/**
+ * Returns words as a hex string.
+ */
+Uploader.toHex = function (words) {
+	var hex = '';
+	for (var i = 0; i < words.length; i++) {
+		hex += ('0000000' + words[i].toString(16)).slice(-8);
+	}
+	return hex;
+};
+
+/**
+ * Returns a copy of a (big-endian) ArrayBuffer with bytes ordered for reading as Uint32Array.
+ */
+Uploader.swapBytes = function (buffer) {
+	var bytes   = new Uint8Array(buffer);
+	var swapped = new Uint8Array(bytes.length);
+	for (var i = 0; i < bytes.length; i += 4) {
+		swapped[i]     = bytes[i + 3];
+		swapped[i + 1] = bytes[i + 2];
+		swapped[i + 2] = bytes[i + 1];
+		swapped[i + 3] = bytes[i];
+	}
+	return swapped.buffer;
+};
+
 // --- Initialise --------------------------------------------------------------
 
 /**
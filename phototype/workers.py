@@ -0,0 +1,302 @@
+#!/usr/bin/python3
+# coding: utf-8
+
+# ----- IMPORT LIBRARIES ------------------------------------------------------
+
+from hashlib import md5, sha256
+import multiprocessing as mp
+import os
+from queue import Empty as QueueEmpty
+from socket import gethostname
+import sys
+import time
+
+import psutil
+
+import tracing
+
+# ----- GLOBAL FUNCTIONS ------------------------------------------------------
+
+"""
+Worker processes are started via spawn rather than fork, so each begins as a fresh
+interpreter instead of a copy of photocore (with its images, surfaces and such).
+The functions below are their entry points: they get passed only what they need,
+i.e., settings and the queues or shared memory to talk to the main process over.
+Queues and such shared with a worker must be created via this context as well.
+Note that a spawned process does import the main script again. That is start.py, which
+is kept thin so a worker only loads what it uses (photocore.py itself loads pygame and more).
+"""
+context = mp.get_context('spawn')
+
+""" Starts a worker process, running target(*args) """
+def start (target, args=(), name=None):
+	process = context.Process(target=target, args=args, name=name)
+	process.daemon = False
+	process.start()
+	return process
+
+""" Signals a worker to stop, then waits up to timeout seconds for it to do so
+	A worker that doesn't gets terminated, or killed as a last resort. Returns how it ended. """
+def stop (process, stop_signal, timeout=2):
+	stop_signal.set()
+	process.join(timeout)
+	if (not process.is_alive()):
+		return 'stopped'
+
+	process.terminate()  # SIGTERM
+	process.join(1)
+	if (not process.is_alive()):
+		return 'terminated'
+
+	process.kill()  # SIGKILL, which can't be ignored
+	process.join()
+	return 'killed'
+
+""" Returns the (resident, unique) memory of a process in bytes, or None if unavailable """
+def get_memory (process):
+	try:
+		info = psutil.Process(process.pid).memory_full_info()
+		return (info.rss, info.uss)
+	except (psutil.Error, ValueError):
+		return None
+
+# ----- WORKERS ---------------------------------------------------------------
+
+""" Reads the distance sensor and publishes readings to channel (a SensorChannel), see DistanceSensor
+	Runs until stop_signal is set. """
+def run_sensor (channel, stop_signal, backend='gpio'):
+	from sensors import PulseWidthSensor, SerialSensor
+
+	tracing.set_process_name('sensor')
+	with tracing.span('sensor.run', args={'backend': backend}) as span:
+		mock_port = None
+		if (backend == 'serial'):
+			# the sensor's serial output (TX) is connected to the UART RX pin
+			port = '/dev/ttyS0'
+			if (sys.platform == 'darwin'):
+				from mocking import MockSerialSensor
+				mock_port = MockSerialSensor()
+				mock_port.start()
+				port = mock_port.port
+			sensor = SerialSensor(channel, port=port)
+		else:
+			# the sensor's pulse width output is connected to this pin
+			input_pin = 16  # outer row, 3rd from USB ports
+			if (gethostname() == 'protopi4'):
+				input_pin = 12  # pin 16 broke off for this one :'(
+			# readings get published to the channel from within GPIO edge callbacks
+			sensor = PulseWidthSensor(channel, pin=input_pin)
+		sensor.start()
+
+		while (not stop_signal.is_set()):
+			try:
+				if (backend == 'serial'):
+					# blocks until data arrives, or the stop signal does
+					sensor.read(timeout=None, wake=stop_signal)
+				else:
+					# nothing left to do but wait for a request to stop
+					stop_signal.wait()
+			# ignore any key input (handled by main thread)
+			except KeyboardInterrupt:
+				pass
+
+		# finally, after exiting while loop, it ends here
+		sensor.stop()
+		if (mock_port is not None):
+			mock_port.stop()
+		span.set_arg('readings', channel.get_sequence())
+	tracing.flush()
+
+""" Imports uploads into the image folder, see ImageManager and Importer """
+def run_importer (image_folder, upload_folder, import_queue, scanner_queue, import_pending, stop_signal, scan_interval=60, do_delete=True):
+	# resizing is heavy work, so let the display process go first when both want the CPU
+	os.nice(10)
+	tracing.set_process_name('importer')
+
+	importer = Importer(image_folder, upload_folder, scanner_queue, stop_signal, scan_interval, do_delete)
+	importer.run(import_queue, import_pending)
+	tracing.flush()
+
+# ----- CLASSES ---------------------------------------------------------------
+
+
+"""
+StopSignal tells a worker process to stop. It wakes a worker right away, whether it waits on
+the signal itself or uses select on it (along with other file descriptors), rather than
+a worker having to check for a request to stop every so often. Once set, it stays set.
+"""
+class StopSignal ():
+	def __init__ (self):
+		self.reader, self.writer = context.Pipe(duplex=False)
+
+	def set (self):
+		if (not self.is_set()):
+			self.writer.send(True)
+
+	def is_set (self):
+		return self.reader.poll()
+
+	""" Blocks until the signal is set (or timeout passes), returns whether it is set """
+	def wait (self, timeout=None):
+		return self.reader.poll(timeout)
+
+	""" Makes this usable with select """
+	def fileno (self):
+		return self.reader.fileno()
+
+
+"""
+Importer resizes uploaded photos to the display size, and moves them into the image folder.
+Uploads get announced via the import queue. Others (e.g., copied onto the device) are found
+by scanning the upload folder now and then. Results go back via the scanner queue:
+	('image', path, uploaded_at, dhash) for an imported upload
+	('dhash', path, dhash)              for a hash requested via ('dhash', path)
+	True                                if a scan imported new images
+"""
+class Importer ():
+	def __init__ (self, image_folder, upload_folder, scanner_queue, stop_signal, scan_interval=60, do_delete=True):
+		from simpleserver import ContentIndex
+
+		self.image_folder  = image_folder
+		self.upload_folder = upload_folder
+		self.scanner_queue = scanner_queue
+		self.stop_signal   = stop_signal
+		self.scan_interval = scan_interval  # seconds between checks for files that weren't uploaded via the server
+		self.do_delete     = do_delete
+		self.last_scan     = 0
+
+		# hashes of imported uploads, to recognise files that were uploaded before
+		self.content_index = ContentIndex(os.path.join(self.image_folder, 'hashes.txt'))
+
+	""" Handles announced uploads until the stop signal is set
+		As a queue can't be waited upon together with the signal, None is put on the import queue
+		along with it. Any uploads still queued are left, to be found by a scan on the next run. """
+	def run (self, import_queue, import_pending):
+		from similarity import get_dhash
+
+		# run this while loop forever, unless a signal tells otherwise
+		while (not self.stop_signal.is_set()):
+			try:
+				# wait for an upload to be announced (or a signal to stop)
+				# a timeout allows for a periodic check on files that got there otherwise
+				try:
+					item = import_queue.get(timeout=self.scan_interval)
+					if (item is None or self.stop_signal.is_set()):
+						break
+
+					# calculate a perceptual hash for an image in the library
+					if (item[0] == 'dhash'):
+						with tracing.span('import.dhash'):
+							self.scanner_queue.put(('dhash', item[1], get_dhash(item[1])))
+						continue
+
+					file_path, uploaded_at, hashes = item
+					try:
+						with tracing.span('import.resize', args={'file': file_path}):
+							tracing.flow('upload', int(uploaded_at * 1e6))
+							# the file may have been handled by a periodic check already
+							if (os.path.exists(file_path) and file_path.lower().endswith(('.jpg', '.jpeg'))):
+								out_file_path = self.check_and_resize(os.path.dirname(file_path), os.path.basename(file_path), hashes)
+								if (out_file_path is not None):
+									self.scanner_queue.put(('image', out_file_path, uploaded_at, get_dhash(out_file_path)))
+					finally:
+						with import_pending.get_lock():
+							import_pending.value -= 1
+				except QueueEmpty:
+					pass
+
+				# check for new images
+				if (time.time() > self.last_scan + self.scan_interval):
+					with tracing.span('import.scan'):
+						new_images = self.scan_folder(self.upload_folder)
+
+					# indicate we have new images to scan
+					if (new_images > 0):
+						self.scanner_queue.put(True)
+
+					self.last_scan = time.time()
+			# ignore any key input (handled by main thread)
+			except KeyboardInterrupt:
+				pass
+
+	""" Imports all photos in folder, returns the number found """
+	def scan_folder (self, folder):
+		num_of_files_found = 0
+
+		for dirname, dirnames, filenames in os.walk(folder):
+			# editing 'dirnames' list will stop os.walk() from recursing into there
+			if '.git' in dirnames:
+				dirnames.remove('.git')
+			if '.DS_Store' in filenames:
+				filenames.remove('.DS_Store')
+
+			# check all filenames, act on valid ones
+			for filename in filenames:
+				if (self.stop_signal.is_set()):
+					return num_of_files_found
+				if filename.lower().endswith(('.jpg', '.jpeg')) and not filename.startswith('.'):
+					self.check_and_resize(dirname, filename)
+					num_of_files_found += 1
+
+		return num_of_files_found
+
+	""" Takes in an image filepath, checks if a resize is possible, then deletes original
+		Returns the path of the resized image, or None if it couldn't be made (or is a duplicate) """
+	def check_and_resize (self, dirname, filename, hashes=None):
+		# the Image class of the display is used for resizing, without loading the rest of photocore
+		from imaging import Image
+
+		# decide on in/output path
+		in_file_path        = os.path.join(dirname, filename)
+		in_file_size        = os.stat(in_file_path).st_size
+		marked_for_deletion = False
+
+		# files that didn't come via the upload server are hashed here
+		if (hashes is None):
+			content_hash = sha256()
+			with open(in_file_path, 'rb') as f:
+				for data in iter(lambda: f.read(65536), b''):
+					content_hash.update(data)
+			hashes = [content_hash.hexdigest()]
+
+			# known content can be removed without even decoding it
+			if (self.content_index.contains(hashes[0])):
+				if (self.do_delete):
+					os.remove(in_file_path)
+				return None
+
+		# consider a unique filename based on original filename and filesize (to avoid same names across folders mixups)
+		# use only the first 12 characters to keep it sane / legible
+		out_filename = md5(filename.encode('utf-8') + str(in_file_size).encode('utf-8')).hexdigest()[:12] + '.jpg'
+		out_file_path = os.path.join(self.image_folder, out_filename)
+
+		# check if resized image already exists, otherwise take action
+		if (os.path.exists(out_file_path) is True):
+			marked_for_deletion = True
+			result              = True
+		else:
+			# use the Image class for resizing and saving
+			p = Image(in_file_path, use_convert=False)
+			surface, size_string = p.get((800,480), fill_box=True, remove_black=True, check_orientation=True)
+			result = p.save_to_file(size_string, out_file_path)
+
+			if (result is False):
+				print('Warning, could not save: ', in_file_path)
+			else:
+				# the original may now be deleted
+				marked_for_deletion = True
+
+		# remember this content, to recognise it when uploaded once more
+		if (result is not False):
+			self.content_index.add(hashes, out_filename)
+
+		if (self.do_delete and marked_for_deletion):
+			# consider removing the original file
+			try:
+				os.remove(in_file_path)
+			except OSError as ose:
+				print(ose)
+
+		if (result is False):
+			return None
+		return out_file_path